@@ -166,12 +166,8 @@ class Controller:
         surrounding_tiles = self.grid.get_radius(x, y, radius)
         print(f"X: {x} | Y: {y} | Tile_ID: {self.current_tile.tile_id} | Tile_Type: {self.current_tile.tile_type}")
         print(f"Bombs: {self.bombs}")
-        display = ''
-        for row in surrounding_tiles:
-            for tile in row:
-                display += f'{Fore.BLACK}▨{Style.RESET_ALL} ' if tile is None else f'{tile} '
-            display+= '\n'
-        return display
+        empty = f'{Fore.BLACK}▨{Style.RESET_ALL}'
+        return ''.join(' '.join(empty if tile is None else str(tile) for tile in row) + ' \n' for row in surrounding_tiles)
 
     def grid_to_string(self):
         """Converts the grid to a string representation."""
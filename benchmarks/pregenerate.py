@@ -0,0 +1,36 @@
+"""Time Grid.pregenerate for a square region at several worker counts and check the results match.
+
+Run from the repository root with: python -m benchmarks.pregenerate [side] [max_workers]
+"""
+import os
+import sys
+import time
+from src.grid import Grid
+
+
+def fingerprint(grid):
+    return {key: (bytes(chunk.types), chunk.ids.tobytes()) for key, chunk in grid.chunks.items()}
+
+
+def main():
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    bbox = (-side // 2, -side // 2, side - side // 2 - 1, side - side // 2 - 1)
+    reference = None
+    serial = None
+    workers = 1
+    while workers <= max_workers:
+        grid = Grid('benchmark')
+        start = time.perf_counter()
+        grid.pregenerate(bbox, workers=workers)
+        elapsed = time.perf_counter() - start
+        serial = serial or elapsed
+        prints = fingerprint(grid)
+        reference = reference or prints
+        print(f"workers {workers:>3}: {elapsed:8.2f} s  {len(grid) / elapsed / 1e6:6.2f} Mtiles/s  "
+              f"speedup {serial / elapsed:5.2f}x  identical {prints == reference}")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Compare the old queue-based BFS against Grid.iter_range for generate_tiles_in_range.
+
+Run from the repository root with: python -m benchmarks.range_query
+"""
+import time
+from src.grid import Grid
+
+RANGES = [1, 10, 50, 200]
+
+
+def bfs_tiles_in_range(grid, x, y, range):
+    """The list.pop(0) BFS that generate_tiles_in_range used before the range iterator."""
+    queue = [(x, y, 0)]
+    visited = {(x, y)}
+    tiles_in_range = []
+
+    while queue:
+        current_x, current_y, depth = queue.pop(0)
+        if depth > range:
+            break
+        tile = grid.get_tile(current_x, current_y) or grid.create_tile(current_x, current_y)
+        tiles_in_range.append(tile)
+        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+            next_x, next_y = current_x + dx, current_y + dy
+            if (next_x, next_y) not in visited:
+                queue.append((next_x, next_y, depth + 1))
+                visited.add((next_x, next_y))
+
+    return tiles_in_range
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    # Both variants run on an already generated area so the numbers measure traversal, not terrain generation
+    grid = Grid('benchmark')
+    grid.generate_tiles_in_range(0, 0, max(RANGES))
+    print(f"{'gen_range':>9} {'tiles':>7} {'bfs ms':>10} {'iter ms':>10} {'speedup':>8}")
+    for gen_range in RANGES:
+        repeat = 3 if gen_range >= 50 else 20
+        bfs = best_of(lambda: bfs_tiles_in_range(grid, 0, 0, gen_range), repeat)
+        new = best_of(lambda: grid.generate_tiles_in_range(0, 0, gen_range), repeat)
+        tiles = 2 * gen_range * (gen_range + 1) + 1
+        print(f"{gen_range:>9} {tiles:>7} {bfs * 1000:>10.3f} {new * 1000:>10.3f} {bfs / new:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""Benchmark the hot paths and compare the results against a stored baseline.
+
+Each benchmark reports the best of several runs in seconds. The results are written as
+JSON, and the run fails when any of them is slower than the baseline by more than the
+threshold. Baselines only compare meaningfully on the machine that recorded them.
+
+Run from the repository root with:
+    python -m benchmarks.suite                      compare against benchmarks/baseline.json
+    python -m benchmarks.suite --save-baseline      record a new baseline
+    python -m benchmarks.suite --quick              smaller sizes, for a fast sanity check
+"""
+import argparse
+from contextlib import contextmanager, redirect_stdout
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from src.controller import Controller
+from src.direction import Direction
+from src.grid import Grid
+from src.renderer import Renderer, CSI
+from src.tile import Tile
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+SEED = 'benchmark'
+
+
+class NullSink:
+    """Output stream that discards everything, so rendering is timed without a terminal."""
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class CaptureSink(NullSink):
+    """Output stream that keeps what is written, to check which drawing path a frame took."""
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+        return len(data)
+
+
+# What a full repaint starts with, see Renderer.draw_frame
+FULL_CLEAR = f'{CSI}H{CSI}2J'
+
+
+@contextmanager
+def terminal_size(columns, lines):
+    """Report a terminal of the given size to shutil.get_terminal_size, whatever stdout is."""
+    previous = {name: os.environ.get(name) for name in ('COLUMNS', 'LINES')}
+    os.environ.update(COLUMNS=str(columns), LINES=str(lines))
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+
+def best_of(function, repeat, setup=None, min_time=0.5, max_runs=100):
+    """Run function after a fresh setup() each time and return the fastest run.
+
+    Runs at least repeat times and until min_time seconds were measured, so quick benchmarks
+    take the best of many runs. The collector is paused while timing to keep its pauses out.
+    """
+    best = None
+    total = 0
+    runs = 0
+    while runs < repeat or (total < min_time and runs < max_runs):
+        argument = setup() if setup else None
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function(argument)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return best
+
+
+def square(side):
+    return (-side // 2, -side // 2, side - side // 2 - 1, side - side // 2 - 1)
+
+
+def bench_generate(results, ranges, repeat):
+    for gen_range in ranges:
+        results[f'generate_tiles_in_range/{gen_range}'] = best_of(
+            lambda grid: grid.generate_tiles_in_range(0, 0, gen_range), repeat, lambda: Grid(SEED))
+
+
+def bench_get_radius(results, viewports, repeat):
+    grid = Grid(SEED)
+    grid.generate_tiles_in_range(0, 0, max(viewports) * 2)
+    for viewport in viewports:
+        results[f'get_radius/{viewport}'] = best_of(lambda _: grid.get_radius(0, 0, viewport), repeat)
+
+
+def bench_tiles(results, count, repeat):
+    grid = Grid(SEED)
+    grid.pregenerate(square(64), workers=1)
+    chunk = grid.get_chunk(0, 0)
+
+    def construct(_):
+        for i in range(count):
+            Tile(chunk, i & 15, i >> 4 & 15)
+    results[f'tile_construction/{count}'] = best_of(construct, repeat)
+
+
+def bench_moves(results, count, gen_range, repeat):
+    # Walks east, bombing through walls, so every move reaches new ground
+    def walk(cont):
+        for _ in range(count):
+            cont.is_bombing = True
+            cont.bombs = cont.max_bombs
+            cont.move(Direction.EAST)
+    results[f'controller_move/{count}@{gen_range}'] = best_of(walk, repeat, lambda: Controller(10, gen_range, SEED))
+
+
+def bench_render(results, viewports, frames, repeat):
+    # Piped or redirected, the terminal reads as 24 lines and every frame would fall back to
+    # a full repaint, so pin a size that fits the largest view
+    with terminal_size(4 * max(viewports) + 10, 2 * max(viewports) + 20):
+        for viewport in viewports:
+            bench_render_viewport(results, viewport, frames, repeat)
+
+
+def bench_render_viewport(results, viewport, frames, repeat):
+    def setup(sink=None):
+        cont = Controller(viewport, viewport, SEED)
+        cont.renderer = Renderer(sink or NullSink())
+        cont.display_grid(cont.x, cont.y)
+        return cont
+
+    def redraw(cont):
+        for _ in range(frames):
+            cont.renderer.invalidate()
+            cont.display_grid(cont.x, cont.y)
+
+    def scroll(cont):
+        for _ in range(frames):
+            cont.is_bombing = True
+            cont.bombs = cont.max_bombs
+            cont.move(Direction.SOUTH)
+            cont.display_grid(cont.x, cont.y)
+
+    # The move frames must take the diff and scroll path, not repaint the screen
+    sink = CaptureSink()
+    cont = setup(sink)
+    sink.data.clear()
+    scroll(cont)
+    assert sink.data and not any(FULL_CLEAR in data for data in sink.data), f"display_grid/move/{viewport} repainted the screen"
+    results[f'display_grid/full/{viewport}'] = best_of(redraw, repeat, setup) / frames
+    results[f'display_grid/move/{viewport}'] = best_of(scroll, repeat, setup) / frames
+
+
+def bench_saves(results, sides, repeat):
+    # Run inside a scratch directory, saving would otherwise migrate a saves.json in the working directory
+    previous = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='benchmark-saves-'))
+    try:
+        with redirect_stdout(NullSink()):
+            bench_save_sizes(results, sides, repeat, 'saves')
+    finally:
+        os.chdir(previous)
+
+
+def bench_save_sizes(results, sides, repeat, directory):
+    for side in sides:
+        cont = Controller(10, 1, SEED)
+        cont.grid.pregenerate(square(side), workers=1)
+        tiles = len(cont.grid)
+        runs = iter(range(100))
+
+        def save(_):
+            cont.save_grid(f'save-{side}-{next(runs)}', directory)
+
+        def load(_):
+            cont.load_grid(f'save-{side}-0', directory)
+        results[f'save_grid/{tiles}'] = best_of(save, repeat, max_runs=20)
+        results[f'load_grid/{tiles}'] = best_of(load, repeat, max_runs=20)
+
+
+def run(quick=False):
+    results = {}
+    repeat = 3
+    bench_generate(results, [10, 50] if quick else [10, 50, 200], repeat)
+    bench_get_radius(results, [10, 25] if quick else [10, 25, 50], repeat)
+    bench_tiles(results, 10_000 if quick else 100_000, repeat)
+    bench_moves(results, 200 if quick else 2000, 5, repeat)
+    bench_render(results, [10] if quick else [10, 25], 20, repeat)
+    # 100, 316 and 1000 wide squares hold 10k, 100k and 1M tiles
+    bench_saves(results, [100, 316] if quick else [100, 316, 1000], repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print results against the baseline and return the names that regressed beyond threshold."""
+    regressions = []
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:<36} {seconds * 1000:10.3f} ms   (no baseline)")
+            continue
+        ratio = seconds / reference
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<36} {seconds * 1000:10.3f} ms   {ratio:6.2f}x baseline{'   REGRESSED' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description="Benchmark the hot paths against a stored baseline.")
+    parser.add_argument('--baseline', default=BASELINE, help="baseline JSON file")
+    parser.add_argument('--output', default='bench_results.json', help="where to write the results JSON")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown, 0.25 fails anything more than 25%% slower")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline instead of comparing")
+    parser.add_argument('--quick', action='store_true', help="smaller sizes, only comparable to other quick runs")
+    args = parser.parse_args(argv)
+
+    results = run(args.quick)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': results,
+    }
+    with open(args.baseline if args.save_baseline else args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    if args.save_baseline:
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, record one with --save-baseline")
+        return 1
+    if baseline.get('quick') != args.quick:
+        print("The baseline was recorded with different sizes, compare quick runs with quick baselines")
+        return 1
+    regressions = compare(results, baseline['results'], args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
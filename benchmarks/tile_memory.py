@@ -0,0 +1,67 @@
+"""Measure bytes per explored tile before and after the chunked, slotted tile storage.
+
+Run from the repository root with: python -m benchmarks.tile_memory [side]
+The grid is side x side tiles, 1000 x 1000 (1M tiles) by default.
+"""
+import sys
+import tracemalloc
+from src.chunk import TYPE_NAMES
+from src.grid import Grid
+from src.terrain import generate_types
+from src.tile import TYPES
+
+
+class DictTile:
+    """The per-instance-__dict__ Tile that Grid.grid stored before chunked storage."""
+    def __init__(self, x, y, tile_id, seed, tile_type):
+        self.x = x
+        self.y = y
+        self.tile_id = tile_id
+        self.seed = f'{x},{y},{seed}'
+        self.is_occupied = False
+        self.tile_type = tile_type
+        metadata = TYPES[tile_type]
+        self.icon, self.color, self.has_collision, self.can_interact = metadata.icon, metadata.color, metadata.has_collision, metadata.can_interact
+
+
+def build_dict_grid(seed, side, codes):
+    grid = {}
+    for x in range(side):
+        for y in range(side):
+            grid[(x, y)] = DictTile(x, y, len(grid) + 1, seed, TYPE_NAMES[codes[x * side + y]])
+    return grid
+
+
+def build_chunked_grid(seed, side, codes):
+    grid = Grid(seed)
+    for x in range(side):
+        for y in range(side):
+            grid.create_tile(x, y, type=TYPE_NAMES[codes[x * side + y]])
+    return grid
+
+
+def measure(build, *args):
+    tracemalloc.start()
+    result = build(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    seed = 'benchmark'
+    # Terrain is generated up front so both variants measure storage, not generation
+    codes = generate_types(seed, 0, 0, side, side)
+    tiles = side * side
+    before = measure(build_dict_grid, seed, side, codes)
+    after = measure(build_chunked_grid, seed, side, codes)
+    print(f"{tiles} tiles")
+    print(f"dict of Tile objects: {before / 2**20:>8.1f} MiB {before / tiles:>7.1f} bytes/tile")
+    print(f"chunked arrays:       {after / 2**20:>8.1f} MiB {after / tiles:>7.1f} bytes/tile")
+    print(f"reduction:            {before / after:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,45 @@
-from src.direction import Direction
+from src.direction import Direction, STEPS
 from src.utils import get_random_string
 from src.controller import Controller
+from src.prefetch import Prefetcher
+from src.instrument import instrumentation
+from src.recording import Recorder, recording_name
+import asyncio
 import readchar
-
-def menu(cont):
+import os
+
+# Recording key of each move, see src.simulate
+MOVE_ACTIONS = {Direction.NORTH: 'w', Direction.WEST: 'a', Direction.SOUTH: 's', Direction.EAST: 'd'}
+
+def print_progress(label):
+    """Progress callback printing label and the percentage done, updated in place."""
+    shown = [None]
+    def progress(done, total):
+        percent = done * 100 // total if total else 100
+        if percent != shown[0]:
+            shown[0] = percent
+            print(f"\r{label} {percent}%", end='\n' if percent == 100 else '', flush=True)
+    return progress
+
+def menu(cont, recorder=None):
     """Handle user input and game interaction."""
+    asyncio.run(play(cont, recorder))
+
+async def play(cont, recorder=None):
+    """Run the game on an event loop, prefetching terrain ahead of the player while waiting for keys.
+
+    With a recorder every action is written to its input recording, which is closed when the game ends.
+    """
+    loop = asyncio.get_running_loop()
+    prefetcher = Prefetcher()
+    try:
+        await game_loop(cont, loop, prefetcher, recorder)
+    finally:
+        prefetcher.close()
+        if recorder:
+            recorder.close()
+
+async def game_loop(cont, loop, prefetcher, recorder):
     direction_mapping = {
         Direction.NORTH:['\x1b[A', '^[[A', '\x1bOA', '^[[1~', 'w'],
         Direction.WEST: ['\x1b[D', '^[[D', '\x1bOD', '^[[3~', 'a'],
@@ -20,6 +55,9 @@ def menu(cont):
         'gen_down': ['[', '-'],
         'gen_up': [']','='],
         'interact': ['e', ' '],
+        'debug': ['p'],
+        'profile': ['P'],
+        'map': ['m'],
 
 
     }
@@ -34,10 +72,11 @@ def menu(cont):
     print(direction_mapping)
 
     while True:
-        print('▬ '*(cont.viewport*2)+'▬')
         cont.display_grid(cont.x, cont.y)
 
-        key = readchar.readkey()
+        # Read in a worker thread so finished prefetches are merged while the player thinks
+        key = await loop.run_in_executor(None, readchar.readkey)
+        cont.renderer.clear_messages()
         direction = next(
             (
                 dir_key
@@ -48,30 +87,60 @@ def menu(cont):
         )
         if key in hotkeys['reset']:  # Reset grid
             new_seed = get_random_string(8)
-            cont.__init__(cont.viewport, cont.gen_range, new_seed)
+            cont.reset(new_seed)
+            if recorder:
+                recorder.reset(new_seed)
             print(f"Grid reset with the new seed: {new_seed}.")
             continue
 
         elif key in hotkeys['gen_down']:  # Reduce generation range
-            cont.gen_range = max(1, cont.gen_range - 1)
+            cont.set_gen_range(cont.gen_range - 1)
+            if recorder:
+                recorder.set_gen_range(cont.gen_range)
             print(f"Generation range reduced to {cont.gen_range}")
             continue
 
         elif key in hotkeys['gen_up']:  # Increase generation range
-            cont.gen_range += 1
+            cont.set_gen_range(cont.gen_range + 1)
+            if recorder:
+                recorder.set_gen_range(cont.gen_range)
             print(f"Generation range increased to {cont.gen_range}")
             continue
 
+        elif key in hotkeys['debug']:  # Toggle the debug overlay
+            if instrumentation.enabled:
+                instrumentation.disable()
+            else:
+                instrumentation.enable()
+            continue
+
+        elif key in hotkeys['map']:  # Cycle the overview map zoom levels
+            cont.cycle_map()
+            continue
+
+        elif key in hotkeys['profile']:  # Start or stop profiling
+            if instrumentation.profile is None:
+                instrumentation.enable()
+                instrumentation.start_profile()
+                print("Profiling, press P again to stop and write profile.pstats and trace.json")
+            else:
+                instrumentation.stop_profile('profile.pstats')
+                instrumentation.export_json('trace.json', cont.grid)
+                print("Wrote profile.pstats and trace.json")
+            continue
+
         elif key in hotkeys['export']:  # Export grid
             save_name = input("Enter a name for the save: ")
             if not save_name:
                 print("Save cancelled.")
                 continue
-            cont.save_grid(save_name)
+            cont.save_grid(save_name, progress=print_progress('Saving'))
             print(f"Game saved with name '{save_name}'")
             continue
 
         elif key in hotkeys['import']:  # Import grid
+            save_names = cont.save_store().names()
+            print(f"Saves: {', '.join(save_names)}" if save_names else "No saves yet.")
             while True:
                 save_name = input("Enter the name of the save to load: ")
                 if not save_name:
@@ -83,8 +152,13 @@ def menu(cont):
                         print("Load cancelled.")
                         break
                 try:
-                    cont.load_grid(save_name)
+                    cont.load_grid(save_name, progress=print_progress('Loading'))
                     print(f"Game loaded from save '{save_name}'")
+                    if recorder:
+                        # A recording replays from its seed, it cannot follow a jump to a loaded save
+                        recorder.close()
+                        recorder = None
+                        print("Input recording stopped.")
                     break
                 except Exception as e:
                     print(e)
@@ -92,43 +166,60 @@ def menu(cont):
             continue
 
         elif key in hotkeys['bomb']: # Toggle bombing
+            if recorder:
+                recorder.record('q')
             if cont.bombs > 0:
-                cont.is_bombing = not cont.is_bombing
+                cont.set_bombing(not cont.is_bombing)
             else:
                 print("You don't have any bombs left.")
+            continue
 
         elif key in hotkeys['interact']: # Interact with tile
+            if recorder:
+                recorder.record('e')
             try:
                 if not cont.current_tile.can_interact:
                     continue
-                elif cont.current_tile.tile_type == 'shrine':
-                    print(cont.current_tile.interact())
-                    cont.bombs += 1 if cont.bombs < 5 else 0
+                print(cont.interact())
 
             except Exception as e:
                 print(e)
-
+            continue
 
         elif direction is None:
             print('Invalid direction')
             continue
 
+        if recorder:
+            recorder.record(MOVE_ACTIONS[direction])
         try:
             cont.move(direction)
         except Exception as e:
             print(e)
+            continue
+        prefetcher.update(cont.grid, cont.x, cont.y, cont.gen_range, STEPS[direction])
 
 
 if __name__ == '__main__':
     seed = input("Enter the global seed: ") or get_random_string(8)
     print(f"Global seed: {seed}")
+    legacy = (input("Use the legacy terrain generator for this seed? (y/n): ") or 'n').lower() == 'y'
     gen_range = input("Enter the generation range: ") or 1
     viewport = input("Enter the viewport size: ") or 10
-    cont = Controller(int(viewport), int(gen_range), seed)
+    cont = Controller(int(viewport), int(gen_range), seed, legacy)
+    recorder = None
+    if os.path.exists(os.path.join('autosave', 'snapshot.sav')) and input("Resume the autosaved game? (y/n): ").lower() == 'y':
+        cont.resume_autosave()
+    else:
+        cont.enable_autosave()
+        # Only a game started from its seed can be replayed, see src.recording
+        os.makedirs('recordings', exist_ok=True)
+        recorder = Recorder(os.path.join('recordings', recording_name(seed)), seed, cont.gen_range, cont.viewport, legacy)
     while True:
         print("1. Play")
         opt = input("Enter your option: ") or '1'
         if opt == '1':
-            menu(cont)
+            menu(cont, recorder)
+            recorder = None
         else:
             print("Invalid option.")
@@ -0,0 +1,94 @@
+from array import array
+
+CHUNK_SIZE = 16
+
+# Tile type codes stored in Chunk.types, 0 marks a cell that has not been generated
+TYPE_NAMES = [None, 'empty', 'wall', 'shrine']
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES) if name}
+
+# Per-tile state bits stored in Chunk.flags
+OCCUPIED = 1
+BOMBED = 2
+USED = 4
+
+
+def chunk_key(x, y):
+    """Get the key of the chunk containing (x, y)."""
+    return x // CHUNK_SIZE, y // CHUNK_SIZE
+
+
+class Chunk:
+    """Square block of tiles stored as compact arrays of type, flags and tile_id."""
+    def __init__(self, cx, cy, size=CHUNK_SIZE):
+        self.cx = cx
+        self.cy = cy
+        self.size = size
+        self.x0 = cx * size
+        self.y0 = cy * size
+        self.types = bytearray(size * size)
+        self.flags = bytearray(size * size)
+        self.ids = array('I', bytes(4 * size * size))
+        self.count = 0
+        # Batch-generated type codes for the whole chunk, dropped once every cell exists
+        self.terrain = None
+
+    def index(self, x, y):
+        """Get the array index of the cell at world coordinates (x, y)."""
+        return (x - self.x0) * self.size + (y - self.y0)
+
+    def coords(self, index):
+        """Get the world coordinates of the cell at an array index."""
+        return self.x0 + index // self.size, self.y0 + index % self.size
+
+    def has(self, x, y):
+        return self.types[self.index(x, y)] != 0
+
+    def set(self, x, y, type_code, tile_id, flags=0):
+        """Store a generated cell, replacing whatever was there."""
+        index = self.index(x, y)
+        if not self.types[index]:
+            self.count += 1
+        self.types[index] = type_code
+        self.flags[index] = flags
+        self.ids[index] = tile_id
+        return index
+
+    def indices(self):
+        """Yield the array index of every generated cell."""
+        types = self.types
+        return (i for i in range(len(types)) if types[i])
+
+    def find(self, type_code):
+        """Yield the array index of every cell of type_code."""
+        types = self.types
+        index = types.find(type_code)
+        while index >= 0:
+            yield index
+            index = types.find(type_code, index + 1)
+
+    def mask(self):
+        """Get the explored mask of the chunk, one bit per cell."""
+        mask = bytearray(len(self.types) // 8)
+        for index in self.indices():
+            mask[index >> 3] |= 1 << (index & 7)
+        return bytes(mask)
+
+    def fill(self, terrain, mask=None):
+        """Set the type of every cell in mask (every cell without one) from the terrain codes."""
+        if mask is None:
+            self.types[:] = terrain
+        else:
+            types = self.types
+            for index in range(len(types)):
+                if mask[index >> 3] >> (index & 7) & 1:
+                    types[index] = terrain[index]
+        self.count = len(self.types) - self.types.count(0)
+
+    def copy(self):
+        """Get a copy of the chunk's arrays, without its cached terrain."""
+        chunk = Chunk(self.cx, self.cy, self.size)
+        chunk.types[:] = self.types
+        chunk.flags[:] = self.flags
+        chunk.ids = array('I', self.ids)
+        chunk.count = self.count
+        return chunk
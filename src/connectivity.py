@@ -0,0 +1,176 @@
+"""Connected regions of walkable tiles, for reachability without bombs.
+
+Walkable cells of each chunk are labelled with union-find nodes: a chunk seen for the first
+time is flood filled into one node per local component, and its border cells are unioned
+with the neighbouring chunks. Tiles only ever become walkable (generated, or walls bombed),
+never the other way, so later changes just add a node per new cell and union it with its
+neighbours. Queries are a label lookup and a find.
+
+Only generated tiles count: two places that are not connected yet may become connected
+as the world between them is explored.
+"""
+from array import array
+from src.chunk import CHUNK_SIZE, BOMBED, chunk_key
+from src.grid import WALL
+
+CELLS = CHUNK_SIZE * CHUNK_SIZE
+# Type code to walkable, code 0 is a cell that has not been generated and walls are walkable once bombed
+WALKABLE = bytes([0, 1, 0, 1]) + bytes(252)
+
+
+def walkable_cells(chunk):
+    """Get one byte per cell of a chunk, 1 where the cell is generated and walkable."""
+    cells = bytearray(chunk.types.translate(WALKABLE))
+    flags = chunk.flags
+    for index in chunk.find(WALL):
+        if flags[index] & BOMBED:
+            cells[index] = 1
+    return cells
+
+
+def cell_neighbours(index):
+    """Yield the indices of the cells next to index within the same chunk."""
+    row, column = divmod(index, CHUNK_SIZE)
+    if row:
+        yield index - CHUNK_SIZE
+    if row < CHUNK_SIZE - 1:
+        yield index + CHUNK_SIZE
+    if column:
+        yield index - 1
+    if column < CHUNK_SIZE - 1:
+        yield index + 1
+
+
+class Connectivity:
+    """Union-find over the walkable cells of a grid, kept up to date from the chunks it reports as changed."""
+    def __init__(self, grid):
+        self.grid = grid
+        # Chunk key to the node of every cell, 0 for cells that are not walkable
+        self.labels = {}
+        # Node 0 is the null label, roots are their own parent and hold their region's size
+        self.parent = [0]
+        self.size = [0]
+        self.changed = grid.watch()
+        self.changed.update(grid.chunk_keys())
+
+    def close(self):
+        """Stop following the grid's changes."""
+        self.grid.unwatch(self.changed)
+
+    def new_node(self, size):
+        node = len(self.parent)
+        self.parent.append(node)
+        self.size.append(size)
+        return node
+
+    def find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            # Path halving
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def refresh(self):
+        """Label the cells that became walkable since the last refresh."""
+        grid = self.grid
+        for key in self.changed:
+            chunk = grid.chunks.get(key) or grid.peek_chunk(key)
+            if chunk is None:
+                continue
+            cells = walkable_cells(chunk)
+            labels = self.labels.get(key)
+            if labels is None:
+                self.labels[key] = self.label_chunk(cells)
+                self.join_borders(key)
+            elif cells.count(1) != CELLS - labels.count(0):
+                self.add_cells(key, labels, cells)
+        self.changed.clear()
+
+    def label_chunk(self, cells):
+        """Flood fill the walkable cells of a chunk, one new node per component."""
+        labels = array('I', bytes(4 * CELLS))
+        for start in range(CELLS):
+            if not cells[start] or labels[start]:
+                continue
+            node = self.new_node(0)
+            labels[start] = node
+            stack = [start]
+            size = 0
+            while stack:
+                index = stack.pop()
+                size += 1
+                for neighbour in cell_neighbours(index):
+                    if cells[neighbour] and not labels[neighbour]:
+                        labels[neighbour] = node
+                        stack.append(neighbour)
+            self.size[node] = size
+        return labels
+
+    def join_borders(self, key):
+        """Union the border cells of a chunk with those of its labelled neighbours."""
+        labels = self.labels[key]
+        cx, cy = key
+        last = CHUNK_SIZE - 1
+        # (neighbour key, index of cell i of our side, index of the facing cell of theirs)
+        sides = (
+            ((cx - 1, cy), lambda i: i, lambda i: last * CHUNK_SIZE + i),
+            ((cx + 1, cy), lambda i: last * CHUNK_SIZE + i, lambda i: i),
+            ((cx, cy - 1), lambda i: i * CHUNK_SIZE, lambda i: i * CHUNK_SIZE + last),
+            ((cx, cy + 1), lambda i: i * CHUNK_SIZE + last, lambda i: i * CHUNK_SIZE),
+        )
+        for other_key, ours, theirs in sides:
+            other = self.labels.get(other_key)
+            if other is None:
+                continue
+            for i in range(CHUNK_SIZE):
+                a, b = labels[ours(i)], other[theirs(i)]
+                if a and b:
+                    self.union(a, b)
+
+    def add_cells(self, key, labels, cells):
+        """Give every newly walkable cell of a labelled chunk its own node, unioned with its walkable neighbours."""
+        for index in range(CELLS):
+            if not cells[index] or labels[index]:
+                continue
+            node = labels[index] = self.new_node(1)
+            for neighbour in cell_neighbours(index):
+                if labels[neighbour]:
+                    self.union(node, labels[neighbour])
+            row, column = divmod(index, CHUNK_SIZE)
+            for other_key, other_index, on_edge in (
+                ((key[0] - 1, key[1]), index + CELLS - CHUNK_SIZE, row == 0),
+                ((key[0] + 1, key[1]), index - CELLS + CHUNK_SIZE, row == CHUNK_SIZE - 1),
+                ((key[0], key[1] - 1), index + CHUNK_SIZE - 1, column == 0),
+                ((key[0], key[1] + 1), index - CHUNK_SIZE + 1, column == CHUNK_SIZE - 1),
+            ):
+                other = self.labels.get(other_key) if on_edge else None
+                if other is not None and other[other_index]:
+                    self.union(node, other[other_index])
+
+    def node(self, x, y):
+        labels = self.labels.get(chunk_key(x, y))
+        if labels is None:
+            return 0
+        return labels[x % CHUNK_SIZE * CHUNK_SIZE + y % CHUNK_SIZE]
+
+    def reachable(self, start, goal):
+        """Check whether goal (x, y) can be walked to from start without bombs, over generated tiles."""
+        self.refresh()
+        a, b = self.node(*start), self.node(*goal)
+        return bool(a and b) and self.find(a) == self.find(b)
+
+    def region_size(self, x, y):
+        """Count the generated tiles reachable from (x, y) without bombs, 0 when (x, y) is not walkable."""
+        self.refresh()
+        node = self.node(x, y)
+        return self.size[self.find(node)] if node else 0
@@ -1,138 +1,486 @@
+import codecs
+import io
+import os
 from src.grid import Grid
-from src.direction import Direction
-from colorama import Fore, Style
-import json
+from src.direction import STEPS
+from src.renderer import Renderer
+from src.region import RegionStore
+from src.saves import SaveStore
+from src.tile import Tile
+from src import journal, savefile
+from src.pathfind import find_path
+from src.minimap import Minimap, LEVELS, block_size
+from src.connectivity import Connectivity
+from src.instrument import instrumentation
+
+# Outcomes of try_move
+MOVED = 0
+BOMBED = 1          # moved by bombing a wall
+BLOCKED = 2         # a wall is in the way and no bomb is armed
+OUT_OF_RANGE = 3    # the target tile is outside the generation range
+
+
+def legacy_records(blocks):
+    """Yield the records of a legacy text save from its byte blocks, each up to its closing bracket.
+
+    The first record still carries the seed and generator prefix.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for block in blocks:
+        *records, pending = (pending + decoder.decode(block)).split(']')
+        yield from records
+    pending += decoder.decode(b'', final=True)
+    if pending.strip():
+        raise ValueError("Save data is truncated")
+
+
+def text_blocks(pieces, size=savefile.BUFFER_SIZE):
+    """Join text pieces into UTF-8 blocks of about size bytes."""
+    batch = []
+    length = 0
+    for piece in pieces:
+        batch.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(batch).encode()
+            batch = []
+            length = 0
+    yield ''.join(batch).encode()
+
+
+def counted_blocks(blocks, total, progress):
+    """Pass blocks through, calling progress(done, total) with the bytes seen so far."""
+    done = 0
+    for block in blocks:
+        done += len(block)
+        if progress:
+            progress(done, total)
+        yield block
 
 
 class Controller:
-    """Game controller handling game logic and user interaction."""
-    def __init__(self, viewport, gen_range, seed):
+    """Game controller handling game logic and user interaction.
+
+    cache_chunks bounds how many chunks stay in memory, unmodified terrain beyond that is
+    dropped and regenerated from the seed when it is visited again.
+
+    Passing a grid plays in an existing world instead of creating one, several controllers
+    can share a grid, each keeping its own player state.
+    """
+    def __init__(self, viewport, gen_range, seed, legacy=False, cache_chunks=None, grid=None):
         self.viewport = viewport
         self.gen_range = gen_range
-        self.grid = Grid(seed)
+        self.grid = grid if grid is not None else Grid(seed, legacy, max_chunks=cache_chunks)
+        self.renderer = Renderer()
         self.x = 0
         self.y = 0
-        self.current_tile = self.grid.get_tile(self.x, self.y)
+        # (x, y, gen_range) of the last position whose whole range was generated
+        self.generated = None
         self.enter_current_tile()
         self.saved = True
         self.max_bombs = 5
         self.bombs = 3
         self.is_bombing = False
+        self.journal = None
+        # Zoom level of the overview map while it is shown, None for the normal view
+        self.map_level = None
+        self.minimap = None
+        self.connectivity = None
 
+    @property
+    def current_tile(self):
+        """The tile the player stands on, looked up on every use since a cached chunk may have been paged out."""
+        return self.grid.get_tile(self.x, self.y)
+
+    def reset(self, seed):
+        """Start a new world with the given seed, keeping the settings and the autosave journal."""
+        autosave = self.journal
+        self.__init__(self.viewport, self.gen_range, seed, self.grid.legacy, self.grid.max_chunks)
+        self.journal = autosave
+        self.compact_journal()
 
     def move(self, direction):
         """Move to the tile in the given direction."""
-        dx, dy = {
-            Direction.NORTH: (-1, 0),
-            Direction.EAST: (0, 1),
-            Direction.SOUTH: (1, 0),
-            Direction.WEST: (0, -1)
-        }[direction]
+        status = self.try_move(*STEPS[direction])
+        if status == OUT_OF_RANGE:
+            raise ValueError('Cannot move in that direction')
+        if status == BLOCKED:
+            raise ValueError('Cannot move into a tile with collision')
+
+    def try_move(self, dx, dy):
+        """Move by one cell of (dx, dy), returning a status code instead of raising when the move fails."""
         next_x, next_y = self.x + dx, self.y + dy
         next_tile = self.grid.get_tile(next_x, next_y)
-        if next_tile is None or next_tile not in self.available_tiles:
-            raise ValueError('Cannot move in that direction')
+        if next_tile is None or not self.in_range(next_x, next_y):
+            return OUT_OF_RANGE
+        status = MOVED
         if next_tile.has_collision:
             if not self.is_bombing:
-                raise ValueError('Cannot move into a tile with collision')
+                return BLOCKED
             self.bombs -= 1
             next_tile.has_collision = False
-            next_tile.icon = '🞑'
-            next_tile.color = Fore.LIGHTGREEN_EX
+            self.grid.mark_changed(next_x, next_y)
+            self.record(journal.BOMB, next_x, next_y)
+            self.record(journal.BOMBS, self.bombs)
+            status = BOMBED
         self.leave_current_tile(next_tile)
-        self.enter_current_tile()
+        self.enter_current_tile((dx, dy))
         self.is_bombing = False
         self.saved = False
+        self.record(journal.MOVE, self.x, self.y)
+        return status
+
+    def path_to(self, x, y, use_bombs=False, **options):
+        """Find a path from the player to (x, y), see src.pathfind.find_path for the options.
 
-    def enter_current_tile(self):
-        """Enter the current tile and update available tiles."""
+        With use_bombs the path may go through as many walls as the player has bombs.
+        """
+        return find_path(self.grid, (self.x, self.y), (x, y), self.bombs if use_bombs else 0, **options)
+
+    def move_along_path(self, path):
+        """Follow a path from the player's position, arming a bomb before each wall on it.
+
+        Stops at the first step that fails. Returns the try_move status of every step taken.
+        """
+        statuses = []
+        for (x, y), (next_x, next_y) in zip(path, path[1:]):
+            if (x, y) != (self.x, self.y):
+                break
+            next_tile = self.grid.get_tile(next_x, next_y)
+            if next_tile is not None and next_tile.has_collision and self.bombs > 0:
+                self.set_bombing(True)
+            status = self.try_move(next_x - x, next_y - y)
+            statuses.append(status)
+            if status not in (MOVED, BOMBED):
+                break
+        return statuses
+
+    def connections(self):
+        """Get the connectivity index of the current grid, built on first use and again after a load or reset."""
+        if self.connectivity is None or self.connectivity.grid is not self.grid:
+            self.connectivity = Connectivity(self.grid)
+        return self.connectivity
+
+    def can_reach(self, x, y):
+        """Check whether (x, y) can be walked to from the player without bombs, over the generated tiles."""
+        return self.connections().reachable((self.x, self.y), (x, y))
+
+    def region_size(self):
+        """Count the generated tiles the player can walk to without bombs."""
+        return self.connections().region_size(self.x, self.y)
+
+    def interact(self):
+        """Interact with the current tile, a shrine gives back a bomb."""
+        tile = self.current_tile
+        message = tile.interact()
+        if tile.tile_type == 'shrine':
+            self.bombs += 1 if self.bombs < self.max_bombs else 0
+            self.grid.mark_changed(self.x, self.y)
+            self.record(journal.SHRINE, self.x, self.y)
+            self.record(journal.BOMBS, self.bombs)
+            self.saved = False
+        return message
+
+    def enter_current_tile(self, step=None):
+        """Enter the current tile and generate the tiles in range.
+
+        After a one-cell step from a position whose range was generated with at least the
+        current gen_range, only the leading edge of the diamond can be missing.
+        """
         self.current_tile.is_occupied = True
-        self.available_tiles = self.grid.generate_tiles_in_range(self.x, self.y, self.gen_range)
+        previous = self.generated
+        if step and previous and previous[:2] == (self.x - step[0], self.y - step[1]) and previous[2] >= self.gen_range:
+            self.grid.generate_leading_edge(self.x, self.y, self.gen_range, *step)
+        else:
+            self.grid.generate_tiles_in_range(self.x, self.y, self.gen_range)
+        self.generated = (self.x, self.y, self.gen_range)
+
+    def set_gen_range(self, gen_range):
+        """Change the generation range, generating only the rings a larger range adds."""
+        gen_range = max(1, gen_range)
+        previous = self.generated
+        if previous and previous[:2] == (self.x, self.y):
+            for radius in range(previous[2] + 1, gen_range + 1):
+                self.grid.generate_ring(self.x, self.y, radius)
+            self.generated = (self.x, self.y, max(previous[2], gen_range))
+        self.gen_range = gen_range
+        self.record(journal.GEN_RANGE, gen_range)
+
+    def set_bombing(self, armed):
+        """Arm or disarm the bomb for the next move."""
+        self.is_bombing = armed
+        self.record(journal.BOMBING, int(armed))
+
+    def in_range(self, x, y):
+        """Check whether (x, y) is within the generation range of the player."""
+        return abs(x - self.x) + abs(y - self.y) <= self.gen_range
 
     def leave_current_tile(self, next_tile):
         """Leave the current tile and move to the next tile."""
-        self.current_tile.is_occupied = False
-        self.current_tile = next_tile
-        self.x = self.current_tile.x
-        self.y = self.current_tile.y
+        self.grid.get_tile(self.x, self.y).is_occupied = False
+        self.x = next_tile.x
+        self.y = next_tile.y
 
     def display_grid(self, x, y, radius=None):
-        """Print the grid of tiles within a radius from (x, y)."""
+        """Draw the grid of tiles within a radius from (x, y), redrawing only what changed."""
         radius = radius or self.viewport
-        surrounding_tiles = self.grid.get_radius(x, y, radius)
-        print(f"X: {x} | Y: {y} | Tile_ID: {self.current_tile.tile_id} | Tile_Type: {self.current_tile.tile_type}")
-        print(f"Bombs: {self.bombs}")
-        for row in surrounding_tiles:
-            for tile in row:
-                if tile is None:
-                    print(f'{Fore.BLACK}▨{Style.RESET_ALL}', end=' ')
-                else:
-                    print(f'{tile}', end=' ')
-            print()
+        if self.map_level is not None:
+            self.display_map(x, y, radius)
+            return
+        tile = self.current_tile
+        header = [
+            '▬ ' * (radius * 2) + '▬',
+            f"X: {x} | Y: {y} | Tile_ID: {tile.tile_id} | Tile_Type: {tile.tile_type}",
+            f"Bombs: {self.bombs} | Nearest Shrine: {self.shrine_distance(x, y, radius * 2)}",
+        ]
+        if instrumentation.enabled:
+            header.extend(instrumentation.overlay(self.grid))
+        self.renderer.draw(self.grid, x, y, radius, header)
+
+    def display_map(self, x, y, radius):
+        """Draw the overview map around (x, y), each cell summarizing a block of the current zoom level."""
+        # Rebuilt when a load or reset replaced the grid
+        if self.minimap is None or self.minimap.grid is not self.grid:
+            self.minimap = Minimap(self.grid)
+        size = block_size(self.map_level)
+        header = [
+            '▬ ' * (radius * 2) + '▬',
+            f"Map 1:{size} | X: {x} | Y: {y} | {(radius * 2 + 1) * size} tiles wide",
+            "Shade: wall density | Green: mostly explored | ◆: usable shrine",
+        ]
+        frame = self.minimap.build_frame(x, y, radius, self.map_level)
+        self.renderer.draw_frame(frame, (x // size - radius, y // size - radius), header)
+
+    def cycle_map(self):
+        """Switch to the next zoom level of the overview map, back to the normal view after the last."""
+        if self.map_level is None:
+            self.map_level = 0
+        elif self.map_level + 1 < LEVELS:
+            self.map_level += 1
+        else:
+            self.map_level = None
+        self.renderer.invalidate()
+
+    def shrine_distance(self, x, y, max_distance):
+        """Describe how far the nearest usable shrine is, for the HUD."""
+        shrine = self.grid.nearest_shrine(x, y, max_distance)
+        if shrine is None:
+            return "none in sight"
+        return f"{abs(shrine.x - x) + abs(shrine.y - y)} tiles"
 
     def grid_to_string(self):
         """Converts the grid to a string representation."""
-        grid_string = f"{self.grid.seed}|"
-        for key, tile in self.grid.grid.items():
-            tile_string = f"[{tile.x},{tile.y},{tile.tile_id},{tile.tile_type},{tile.can_interact}"
-            if tile.is_occupied:
-                tile_string += ",occupied"
-            tile_string += "]"
-            grid_string += tile_string
-        return grid_string
+        return ''.join(self.iter_grid_string())
+
+    def iter_grid_string(self, progress=None):
+        """Yield the string representation of the grid a piece at a time, calling progress(done, total) per chunk."""
+        yield f"{self.grid.seed}|" + ("hashed|" if not self.grid.legacy else "")
+        keys = list(self.grid.chunk_keys())
+        for done, key in enumerate(keys, 1):
+            chunk = self.grid.peek_chunk(key)
+            for index in chunk.indices():
+                tile = Tile(chunk, *chunk.coords(index))
+                tile_string = f"[{tile.x},{tile.y},{tile.tile_id},{tile.tile_type},{tile.can_interact}"
+                if tile.is_occupied:
+                    tile_string += ",occupied"
+                yield tile_string + "]"
+            if progress:
+                progress(done, len(keys))
 
     def string_to_grid(self, grid_string):
         """Converts a string representation of the grid back into a grid of tiles."""
-        seed, grid_string = grid_string.split('|', 1)
-        self.grid.seed = seed
-        grid = {}
-        for tile_string in grid_string.split(']['):
-            tile_string = tile_string.replace('[', '').replace(']', '')
+        return self.read_legacy([grid_string.encode()])[0]
+
+    def read_legacy(self, blocks):
+        """Build a grid from the byte blocks of a legacy text save, one tile record at a time.
+
+        Returns the grid and the first occupied tile, or None when no tile is occupied.
+        """
+        grid = None
+        occupied = None
+        for record in legacy_records(blocks):
+            prefix, _, tile_string = record.partition('[')
+            if grid is None:
+                # Saves from before the hashed generator carry no generator name and use the legacy one
+                seed, generator = prefix.split('|', 1)
+                grid = Grid(seed, legacy=(generator.rstrip('|') or 'legacy') == 'legacy')
             tile_values = tile_string.split(',')
             x, y, tile_id = map(int, tile_values[:3])
             tile_type = tile_values[3]
             can_interact = tile_values[4] == 'True'
             is_occupied = len(tile_values) > 5 and tile_values[5] == "occupied"
-            tile = Tile(x, y, tile_id, self.grid.seed, type=tile_type)
+            tile = grid.create_tile(x, y, type=tile_type, tile_id=tile_id)
             tile.can_interact = can_interact
             tile.is_occupied = is_occupied
-            grid[(x, y)] = tile
-        return grid
-
-    def save_grid(self, save_name, filename="saves.json"):
-        """Saves the current state of the grid to a file."""
-        grid_string = self.grid_to_string()
-        try:
-            with open(filename, 'r') as f:
-                saves = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            saves = {}
-        if save_name in saves:
+            if is_occupied and occupied is None:
+                occupied = tile
+            grid.tile_count = max(grid.tile_count, tile_id)
+        if grid is None:
+            raise ValueError("Save holds no tiles")
+        return grid, occupied
+
+    def player_state(self):
+        """Get the player state stored alongside the grid in binary saves."""
+        return {field: getattr(self, field) for field in savefile.PLAYER_FIELDS}
+
+    def save_store(self, directory="saves", legacy_file="saves.json"):
+        """Open the save directory, importing the slots of an old single-file saves.json first."""
+        store = SaveStore(directory)
+        store.migrate(legacy_file)
+        return store
+
+    def save_grid(self, save_name, directory="saves", binary=True, compression='zlib', progress=None):
+        """Saves the current state of the grid to its own file in the save directory.
+
+        The save is streamed to the file a chunk at a time, progress(done, total) is called per chunk.
+        """
+        store = self.save_store(directory)
+        if save_name in store:
             overwrite = input(f"A save with the name '{save_name}' already exists. Do you want to overwrite it? (y/n): ")
             if overwrite.lower() != 'y':
                 i = 1
-                while f"{save_name}_{i}" in saves:
+                while f"{save_name}_{i}" in store:
                     i += 1
                 save_name = f"{save_name}_{i}"
-        saves[save_name] = grid_string
-        with open(filename, 'w') as f:
-            json.dump(saves, f)
+        if binary:
+            blocks = savefile.encode_stream(self.grid, self.player_state(), compression, progress)
+            store.write_blocks(save_name, blocks, 'binary', self.grid.seed)
+        else:
+            store.write_blocks(save_name, text_blocks(self.iter_grid_string(progress)), 'legacy', self.grid.seed)
         self.saved = True
         print(f"Map has been saved as '{save_name}'")
 
-    def load_grid(self, save_name, filename="saves.json"):
-        """Loads a saved state of the grid from a file."""
-        with open(filename, 'r') as f:
-            saves = json.load(f)
-        grid_string = saves.get(save_name)
-        if grid_string is None:
-            raise ValueError(f"No save found with name {save_name}")
-        self.grid.grid = self.string_to_grid(grid_string)
-        for tile in self.grid.grid.values():
-            if tile.is_occupied:
-                self.x = tile.x
-                self.y = tile.y
-                self.current_tile = tile
-                break
+    def load_grid(self, save_name, directory="saves", progress=None):
+        """Loads a saved state of the grid from the save directory, streaming it from the file.
+
+        progress(done, total) is called per chunk for binary saves and per block of bytes for legacy ones.
+        """
+        save_format, f = self.save_store(directory).open(save_name)
+        with f:
+            if save_format == 'binary':
+                self.load_binary_file(f, progress)
+                return
+            size = os.fstat(f.fileno()).st_size
+            self.grid, tile = self.read_legacy(counted_blocks(savefile.file_blocks(f), size, progress))
+        if tile is not None:
+            self.x = tile.x
+            self.y = tile.y
+        self.enter_current_tile()
+        self.saved = True
+        self.compact_journal()
+
+    def load_binary(self, data):
+        """Restores the grid and player state from a binary save."""
+        self.load_binary_file(io.BytesIO(data))
+
+    def load_binary_file(self, f, progress=None):
+        """Restores the grid and player state from a binary save file, decoding it a chunk at a time."""
+        self.grid, player = savefile.decode_stream(f, progress)
+        for field, value in player.items():
+            setattr(self, field, value)
         self.enter_current_tile()
-        self.saved = True
\ No newline at end of file
+        self.saved = True
+        self.compact_journal()
+
+    def save_world(self, directory):
+        """Writes the whole world to a directory of region files that open_world can page in lazily.
+
+        Saving a world opened with open_world back to its own directory only writes the chunks in memory.
+        """
+        store = self.grid.store
+        own = store is not None and os.path.realpath(store.directory) == os.path.realpath(directory)
+        if own:
+            self.grid.flush()
+        else:
+            store = RegionStore(directory)
+            for key in self.grid.chunk_keys():
+                store.write(self.grid.peek_chunk(key))
+            store.flush()
+        store.write_meta({'seed': self.grid.seed, 'legacy': self.grid.legacy, 'tile_count': self.grid.tile_count, 'player': self.player_state()})
+        if not own:
+            store.close()
+        self.saved = True
+
+    def open_world(self, directory, max_chunks=4096):
+        """Opens a world saved by save_world without reading its chunks up front.
+
+        Chunks are paged in as the player and the renderer reach them, at most max_chunks stay in memory.
+        """
+        store = RegionStore(directory)
+        meta = store.read_meta()
+        self.grid = Grid(meta['seed'], meta['legacy'], store=store, max_chunks=max_chunks)
+        self.grid.tile_count = meta['tile_count']
+        for field, value in meta['player'].items():
+            setattr(self, field, value)
+        self.enter_current_tile()
+        self.saved = True
+        self.compact_journal()
+
+    def record(self, op, *args):
+        if self.journal is not None:
+            self.journal.record(op, *args)
+
+    def capture(self):
+        """Copy the game state for an autosave snapshot, see journal.Journal.
+
+        Returns a function encoding the copy as binary save data, which can run on the
+        journal's thread while the game goes on, and the records of the gen_range, which
+        saves leave out. Region worlds are encoded right away, their chunks are paged in
+        and out of the store as the game goes on.
+        """
+        player = self.player_state()
+        records = bytearray()
+        journal.encode_record(records, journal.GEN_RANGE, self.gen_range)
+        if self.grid.store is not None:
+            data = savefile.encode(self.grid, player)
+            return (lambda: data), records
+        grid = self.grid.copy()
+        return (lambda: savefile.encode(grid, player)), records
+
+    def compact_journal(self):
+        if self.journal is not None:
+            self.journal.compact()
+
+    def enable_autosave(self, directory="autosave", **options):
+        """Start journaling every mutation to directory, on top of a snapshot of the current state."""
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = journal.Journal(directory, self.capture, **options)
+        self.journal.compact()
+
+    def resume_autosave(self, directory="autosave", **options):
+        """Restore the autosaved state by replaying its journal over its snapshot, then keep autosaving."""
+        data = journal.read_snapshot(directory)
+        if data is None:
+            raise ValueError(f"No autosave found in {directory}")
+        # Detach any running journal first, loading would otherwise compact over the snapshot being resumed
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.load_binary(data)
+        for op, args in journal.read_records(directory):
+            self.apply_record(op, args)
+        self.enable_autosave(directory, **options)
+
+    def apply_record(self, op, args):
+        """Apply one journal record to the game state."""
+        if op == journal.MOVE:
+            # Every move disarms the bomb, see try_move
+            self.is_bombing = False
+            step = (args[0] - self.x, args[1] - self.y)
+            next_tile = self.grid.get_tile(*args) or self.grid.create_tile(*args)
+            self.leave_current_tile(next_tile)
+            self.enter_current_tile(step if abs(step[0]) + abs(step[1]) == 1 else None)
+        elif op == journal.BOMB:
+            (self.grid.get_tile(*args) or self.grid.create_tile(*args)).has_collision = False
+            self.grid.mark_changed(*args)
+        elif op == journal.SHRINE:
+            (self.grid.get_tile(*args) or self.grid.create_tile(*args)).can_interact = False
+            self.grid.mark_changed(*args)
+        elif op == journal.BOMBS:
+            self.bombs = args[0]
+        elif op == journal.GEN_RANGE:
+            self.set_gen_range(args[0])
+        elif op == journal.BOMBING:
+            self.is_bombing = bool(args[0])
@@ -5,3 +5,12 @@ class Direction(Enum):
     EAST = 'e'
     SOUTH = 's'
     WEST = 'w'
+
+
+# (dx, dy) of a one-cell step, x runs north to south and y west to east
+STEPS = {
+    Direction.NORTH: (-1, 0),
+    Direction.EAST: (0, 1),
+    Direction.SOUTH: (1, 0),
+    Direction.WEST: (0, -1)
+}
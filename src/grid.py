@@ -1,41 +1,438 @@
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from math import isqrt
+from src.chunk import Chunk, CHUNK_SIZE, TYPE_CODES, OCCUPIED, BOMBED, USED, chunk_key
+from src.terrain import generate_chunk, generate_chunks
+from src.tile import Tile
+
+
+SHAPES = ('diamond', 'square', 'circle')
+WALL = TYPE_CODES['wall']
+SHRINE = TYPE_CODES['shrine']
+# Chunks generated per pregenerate task, large enough to amortise the process round trip
+PREGENERATE_BATCH = 64
+
+
+def range_rows(x, y, radius, shape='diamond'):
+    """Yield (row_x, first_y, last_y) for each row of a shape centred on (x, y).
+
+    Rows run along x, a diamond covers Manhattan distance, a square Chebyshev distance
+    and a circle Euclidean distance up to radius.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Invalid range shape: {shape}")
+    for i in range(-radius, radius + 1):
+        if shape == 'diamond':
+            half_width = radius - abs(i)
+        elif shape == 'square':
+            half_width = radius
+        else:
+            half_width = isqrt(radius * radius - i * i)
+        yield x + i, y - half_width, y + half_width
+
+
+def ring_keys(cx, cy, ring):
+    """Yield the chunk keys at Chebyshev distance ring from (cx, cy)."""
+    if ring == 0:
+        yield cx, cy
+        return
+    for i in range(-ring, ring + 1):
+        yield cx - ring, cy + i
+        yield cx + ring, cy + i
+    for i in range(-ring + 1, ring):
+        yield cx + i, cy - ring
+        yield cx + i, cy + ring
+
+
+def count_intact_walls(types, flags):
+    # BOMBED is only ever set on walls, and a wall can only be occupied once bombed,
+    # so the bombed walls are exactly the cells whose flags are BOMBED or BOMBED | OCCUPIED
+    return types.count(WALL) - flags.count(BOMBED) - flags.count(BOMBED | OCCUPIED)
+
+
 class Grid:
-    """Grid of tiles with dynamic generation."""
-    def __init__(self, seed):
-        self.grid = {}
+    """Grid of tiles with dynamic generation, stored in fixed-size chunks.
+
+    Terrain comes from the hashed batch generator in src.terrain, or from the
+    pre-chunking per-tile generator when legacy is set so old seeds keep their maps.
+
+    With a store (a src.region.RegionStore) chunks are paged in from disk the first time
+    they are touched, and with max_chunks the least recently used ones are written back
+    and dropped from memory whenever more than max_chunks are loaded.
+
+    With max_chunks and no store the grid is a bounded cache: an evicted chunk keeps only
+    its explored mask, plus its player-modified tiles pinned in a small overlay, and is
+    regenerated from the seed the next time it is touched. Regenerated tiles get new ids.
+    The mask is the only record of where the player has been, so it is kept, packed: a
+    fully explored chunk stores nothing but its key and a partly explored one 32 bytes.
+    Read-only queries (shrines, wall counts) peek at evicted chunks without paging them in.
+    """
+    def __init__(self, seed, legacy=False, store=None, max_chunks=None):
+        self.chunks = OrderedDict() if max_chunks else {}
         self.tile_count = 0
         self.seed = seed
-        self.create_tile(0, 0, type = 'empty')
+        self.legacy = legacy
+        self.store = store
+        self.max_chunks = max_chunks
+        # Explored masks of evicted chunks, None when fully explored, and their modified cells
+        # packed as array('I') pairs of (index << 16 | type << 8 | flags, tile_id)
+        self.evicted = {}
+        self.overlay = {}
+        # Chunk terrain generated ahead of time, see src.prefetch, taken by terrain() on first use
+        self.prefetched = {}
+        # Sets handed out by watch(), each collecting the keys of the chunks changed since it was emptied
+        self.change_sets = []
+        if self.get_tile(0, 0) is None:
+            self.create_tile(0, 0, type = 'empty')
+
+    def load_chunk(self, key):
+        """Get the chunk with key, paging it in from the store when it is not in memory."""
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            if self.max_chunks:
+                self.chunks.move_to_end(key)
+            return chunk
+        if self.store is not None:
+            chunk = self.store.read(*key)
+        elif key in self.evicted:
+            chunk = self.regenerate_chunk(key, self.evicted.pop(key), self.overlay.pop(key, ()))
+        if chunk is not None:
+            self.add_chunk(chunk)
+        return chunk
+
+    def add_chunk(self, chunk):
+        self.chunks[(chunk.cx, chunk.cy)] = chunk
+        if self.max_chunks:
+            while len(self.chunks) > self.max_chunks:
+                self.evict_chunk()
+
+    def evict_chunk(self):
+        """Drop the least recently used chunk from memory, writing it back to the store.
+
+        Without a store only the explored mask and the modified tiles are kept.
+        """
+        key, chunk = self.chunks.popitem(last=False)
+        if self.store is not None:
+            self.store.write(chunk)
+            return
+        self.evicted[key] = None if chunk.count == len(chunk.types) else chunk.mask()
+        terrain = generate_chunk(self.seed, chunk.cx, chunk.cy, self.legacy)
+        types, flags, ids = chunk.types, chunk.flags, chunk.ids
+        pinned = array('I')
+        for index in chunk.indices():
+            if types[index] != terrain[index] or flags[index] & (OCCUPIED | BOMBED | USED):
+                pinned.extend((index << 16 | types[index] << 8 | flags[index], ids[index]))
+        if pinned:
+            self.overlay[key] = pinned
+
+    def regenerate_chunk(self, key, mask, pinned=(), assign_ids=True):
+        """Rebuild an evicted chunk from the seed, its explored mask (None for all cells) and its pinned tiles."""
+        chunk = Chunk(*key)
+        chunk.fill(generate_chunk(self.seed, chunk.cx, chunk.cy, self.legacy), mask)
+        if assign_ids:
+            for index in chunk.indices():
+                self.tile_count += 1
+                chunk.ids[index] = self.tile_count
+        for i in range(0, len(pinned), 2):
+            cell = pinned[i]
+            index = cell >> 16
+            chunk.types[index], chunk.flags[index], chunk.ids[index] = cell >> 8 & 0xFF, cell & 0xFF, pinned[i + 1]
+        return chunk
+
+    def watch(self):
+        """Get a set that collects the key of every chunk whose tiles are created or modified from now on.
+
+        The owner empties it as it catches up, so summaries of the world only redo the chunks that changed.
+        """
+        changed = set()
+        self.change_sets.append(changed)
+        return changed
+
+    def unwatch(self, changed):
+        self.change_sets.remove(changed)
+
+    def mark_changed(self, x, y):
+        """Report a tile modified through its Tile view (bombed, used), the grid cannot see those writes."""
+        for changed in self.change_sets:
+            changed.add(chunk_key(x, y))
+
+    def get_chunk(self, x, y, create=False):
+        """Get the chunk containing (x, y), optionally creating it."""
+        key = chunk_key(x, y)
+        chunk = self.load_chunk(key)
+        if chunk is None and create:
+            chunk = Chunk(*key)
+            self.add_chunk(chunk)
+        return chunk
+
+    def chunk_keys(self):
+        """Get the keys of every chunk, in memory or in the store."""
+        keys = set(self.chunks)
+        keys.update(self.evicted)
+        if self.store is not None:
+            keys.update(self.store.keys())
+        return keys
+
+    def peek_chunk(self, key):
+        """Get a chunk for reading without paging it into memory."""
+        chunk = self.chunks.get(key)
+        if chunk is None and self.store is not None:
+            chunk = self.store.read(*key)
+        elif chunk is None and key in self.evicted:
+            chunk = self.regenerate_chunk(key, self.evicted[key], self.overlay.get(key, ()), assign_ids=False)
+        return chunk
+
+    def copy(self):
+        """Get a copy of the chunks in memory and the evicted ones, which can be read on another thread.
+
+        Grids with a store are not copied, their chunks on disk change as they are paged out.
+        """
+        if self.store is not None:
+            raise ValueError("Cannot copy a grid backed by a store")
+        grid = Grid(self.seed, self.legacy, max_chunks=self.max_chunks)
+        grid.chunks = type(self.chunks)((key, chunk.copy()) for key, chunk in self.chunks.items())
+        grid.tile_count = self.tile_count
+        grid.evicted = dict(self.evicted)
+        grid.overlay = dict(self.overlay)
+        return grid
+
+    def flush(self):
+        """Write every chunk in memory back to the store."""
+        for chunk in self.chunks.values():
+            self.store.write(chunk)
+        self.store.flush()
 
     def get_tile(self, x, y):
-        return self.grid.get((x, y))
+        chunk = self.load_chunk((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None or not chunk.has(x, y):
+            return None
+        return Tile(chunk, x, y)
+
+    def ensure_tile(self, x, y):
+        """Generate (x, y) unless it exists, without building Tile views. Returns whether it was created."""
+        chunk = self.load_chunk((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is not None and chunk.types[(x - chunk.x0) * chunk.size + (y - chunk.y0)]:
+            return False
+        self.create_tile(x, y)
+        return True
+
+    def create_tile(self, x, y, type = None, tile_id = None):
+        if tile_id is None:
+            self.tile_count += 1
+            tile_id = self.tile_count
+        chunk = self.get_chunk(x, y, create=True)
+        if type is None:
+            type_code = self.terrain(chunk)[chunk.index(x, y)]
+        elif type in TYPE_CODES:
+            type_code = TYPE_CODES[type]
+        else:
+            raise ValueError(f"Invalid tile type: {type}")
+        chunk.set(x, y, type_code, tile_id)
+        if chunk.count == len(chunk.types):
+            chunk.terrain = None
+        if self.change_sets:
+            for changed in self.change_sets:
+                changed.add((chunk.cx, chunk.cy))
+        return Tile(chunk, x, y)
+
+    def terrain(self, chunk):
+        """Get the generated type codes of a whole chunk, generating them in one batch on first use."""
+        if chunk.terrain is None:
+            chunk.terrain = self.prefetched.pop((chunk.cx, chunk.cy), None) or generate_chunk(self.seed, chunk.cx, chunk.cy, self.legacy)
+        return chunk.terrain
+
+    def tiles(self):
+        """Yield every generated tile, chunk by chunk."""
+        for key in self.chunk_keys():
+            chunk = self.peek_chunk(key)
+            for index in chunk.indices():
+                yield Tile(chunk, *chunk.coords(index))
+
+    def __len__(self):
+        return sum(self.peek_chunk(key).count for key in self.chunk_keys())
+
+    def iter_row(self, x, first_y, last_y, generate=False):
+        """Yield the tiles from (x, first_y) to (x, last_y) in order, None for missing ones.
+
+        Each chunk along the row is looked up once. With generate set, missing tiles are created.
+        """
+        tile_y = first_y
+        while tile_y <= last_y:
+            chunk = self.load_chunk((x // CHUNK_SIZE, tile_y // CHUNK_SIZE))
+            segment_end = min(last_y, (tile_y // CHUNK_SIZE + 1) * CHUNK_SIZE - 1)
+            if chunk is None:
+                for y in range(tile_y, segment_end + 1):
+                    yield self.create_tile(x, y) if generate else None
+                tile_y = segment_end + 1
+                continue
+            types = chunk.types
+            index = chunk.index(x, tile_y)
+            for y in range(tile_y, segment_end + 1):
+                if types[index]:
+                    yield Tile(chunk, x, y)
+                else:
+                    yield self.create_tile(x, y) if generate else None
+                index += 1
+            tile_y = segment_end + 1
 
-    def create_tile(self, x, y, type = None):
-        from src.tile import Tile
-        self.tile_count += 1
-        tile = Tile(x, y, self.tile_count, self.seed, type = type)
-        self.grid[(x, y)] = tile
-        return tile
+    def iter_range(self, x, y, radius, shape='diamond', generate=False):
+        """Lazily yield the tiles within radius of (x, y), row by row, None for missing ones."""
+        for row_x, first_y, last_y in range_rows(x, y, radius, shape):
+            yield from self.iter_row(row_x, first_y, last_y, generate)
 
     def get_radius(self, x, y, radius):
         """Get tiles within a radius from (x, y)."""
-        return [[self.get_tile(x + i, y + j) for j in range(-radius, radius + 1)] for i in range(-radius, radius + 1)]
+        return [list(self.iter_row(row_x, first_y, last_y)) for row_x, first_y, last_y in range_rows(x, y, radius, 'square')]
 
     def generate_tiles_in_range(self, x, y, range):
         """Generate tiles within a range from (x, y)."""
-        queue = [(x, y, 0)]
-        visited = {(x, y)}
-        tiles_in_range = []
+        return list(self.iter_range(x, y, range, generate=True))
 
-        while queue:
-            current_x, current_y, depth = queue.pop(0)
-            if depth > range:
+    def generate_leading_edge(self, x, y, gen_range, dx, dy):
+        """Generate the tiles that a one-cell step of (dx, dy) onto (x, y) brings into range.
+
+        These are the cells at exactly gen_range from (x, y) on the side the step moved
+        towards, the only part of the diamond not already in range of the previous position.
+        Returns the number of tiles created.
+        """
+        ensure_tile = self.ensure_tile
+        created = 0
+        for forward in range(gen_range + 1):
+            side = gen_range - forward
+            for offset in ((-side, side) if side else (0,)):
+                created += ensure_tile(x + dx * forward + dy * offset, y + dy * forward + dx * offset)
+        return created
+
+    def generate_ring(self, x, y, radius):
+        """Generate the tiles at exactly Manhattan distance radius from (x, y), returning how many were created."""
+        created = 0
+        for i in range(-radius, radius + 1):
+            side = radius - abs(i)
+            for tile_y in ((y - side, y + side) if side else (y,)):
+                created += self.ensure_tile(x + i, tile_y)
+        return created
+
+    def shrines_within(self, x, y, radius, usable=False):
+        """Get the generated shrines within Manhattan distance radius of (x, y), nearest first.
+
+        Only the chunks overlapping the range are searched, so the cost does not grow with the world.
+        Chunks are peeked at, not paged in, so the tiles are for reading: use get_tile to change one.
+        """
+        found = []
+        for cx in range((x - radius) // CHUNK_SIZE, (x + radius) // CHUNK_SIZE + 1):
+            for cy in range((y - radius) // CHUNK_SIZE, (y + radius) // CHUNK_SIZE + 1):
+                found += self.chunk_shrines((cx, cy), x, y, radius, usable)
+        found.sort(key=lambda shrine: shrine[:3])
+        return [Tile(chunk, tile_x, tile_y) for _, tile_x, tile_y, chunk in found]
+
+    def nearest_shrine(self, x, y, max_distance=256, usable=True):
+        """Get the generated shrine nearest to (x, y), or None when there is none within max_distance.
+
+        Chunks are searched in square rings around (x, y), stopping at the first ring that cannot
+        hold anything nearer than the best shrine found so far. Like shrines_within, the tile is for reading.
+        """
+        cx, cy = chunk_key(x, y)
+        best = None
+        for ring in range(max_distance // CHUNK_SIZE + 2):
+            # Every cell of a chunk ring chunks away is at least this far from (x, y)
+            if ring and (ring - 1) * CHUNK_SIZE + 1 > (best[0] if best else max_distance):
                 break
-            tile = self.get_tile(current_x, current_y) or self.create_tile(current_x, current_y)
-            tiles_in_range.append(tile)
-            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                next_x, next_y = current_x + dx, current_y + dy
-                if (next_x, next_y) not in visited:
-                    queue.append((next_x, next_y, depth + 1))
-                    visited.add((next_x, next_y))
-
-        return tiles_in_range
+            for key in ring_keys(cx, cy, ring):
+                for shrine in self.chunk_shrines(key, x, y, max_distance, usable):
+                    if best is None or shrine[:3] < best[:3]:
+                        best = shrine
+        return Tile(best[3], best[1], best[2]) if best else None
+
+    def chunk_shrines(self, key, x, y, radius, usable):
+        """Get (distance, x, y, chunk) for the shrines of one chunk within radius of (x, y)."""
+        chunk = self.peek_chunk(key)
+        if chunk is None:
+            return []
+        flags = chunk.flags
+        shrines = []
+        for index in chunk.find(SHRINE):
+            if usable and flags[index] & USED:
+                continue
+            tile_x, tile_y = chunk.coords(index)
+            distance = abs(tile_x - x) + abs(tile_y - y)
+            if distance <= radius:
+                shrines.append((distance, tile_x, tile_y, chunk))
+        return shrines
+
+    def count_walls(self, bbox):
+        """Count the intact generated walls in bbox = (min_x, min_y, max_x, max_y), inclusive.
+
+        Whole chunks are counted in one pass over their arrays and edge chunks one row slice at a time.
+        """
+        min_x, min_y, max_x, max_y = bbox
+        walls = 0
+        for cx in range(min_x // CHUNK_SIZE, max_x // CHUNK_SIZE + 1):
+            for cy in range(min_y // CHUNK_SIZE, max_y // CHUNK_SIZE + 1):
+                chunk = self.peek_chunk((cx, cy))
+                if chunk is None:
+                    continue
+                first_x, last_x = max(min_x, chunk.x0), min(max_x, chunk.x0 + CHUNK_SIZE - 1)
+                first_y, last_y = max(min_y, chunk.y0), min(max_y, chunk.y0 + CHUNK_SIZE - 1)
+                if last_y - first_y == CHUNK_SIZE - 1 and last_x - first_x == CHUNK_SIZE - 1:
+                    walls += count_intact_walls(chunk.types, chunk.flags)
+                    continue
+                for row_x in range(first_x, last_x + 1):
+                    start = chunk.index(row_x, first_y)
+                    stop = start + last_y - first_y + 1
+                    walls += count_intact_walls(chunk.types[start:stop], chunk.flags[start:stop])
+        return walls
+
+    def pregenerate(self, bbox, workers=None):
+        """Generate every tile in bbox = (min_x, min_y, max_x, max_y), inclusive.
+
+        Chunk terrain is computed in batches on a process pool of workers processes (one per
+        core by default, workers=1 stays in this process) and merged straight into the chunk
+        arrays. Batches are merged in a fixed order, so tile ids and contents are the same for
+        any number of workers. Tiles that already exist are left untouched.
+        """
+        min_x, min_y, max_x, max_y = bbox
+        keys = [
+            (cx, cy)
+            for cx in range(min_x // CHUNK_SIZE, max_x // CHUNK_SIZE + 1)
+            for cy in range(min_y // CHUNK_SIZE, max_y // CHUNK_SIZE + 1)
+        ]
+        batches = [keys[i:i + PREGENERATE_BATCH] for i in range(0, len(keys), PREGENERATE_BATCH)]
+        if workers == 1:
+            results = (generate_chunks(self.seed, batch, self.legacy) for batch in batches)
+            for batch, terrains in zip(batches, results):
+                self.merge_terrain(batch, terrains, bbox)
+            return
+        with ProcessPoolExecutor(workers) as pool:
+            results = pool.map(generate_chunks, repeat(self.seed), batches, repeat(self.legacy))
+            for batch, terrains in zip(batches, results):
+                self.merge_terrain(batch, terrains, bbox)
+
+    def merge_terrain(self, keys, terrains, bbox):
+        """Create the missing tiles of each chunk inside bbox from its generated terrain."""
+        min_x, min_y, max_x, max_y = bbox
+        cells = CHUNK_SIZE * CHUNK_SIZE
+        for key, terrain in zip(keys, terrains):
+            chunk = self.get_chunk(key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE, create=True)
+            for changed in self.change_sets:
+                changed.add(key)
+            first_x, last_x = max(min_x, chunk.x0), min(max_x, chunk.x0 + CHUNK_SIZE - 1)
+            first_y, last_y = max(min_y, chunk.y0), min(max_y, chunk.y0 + CHUNK_SIZE - 1)
+            if not chunk.count and (last_x - first_x + 1) * (last_y - first_y + 1) == cells:
+                chunk.types[:] = terrain
+                chunk.ids = array('I', range(self.tile_count + 1, self.tile_count + cells + 1))
+                chunk.count = cells
+                self.tile_count += cells
+                continue
+            types, ids = chunk.types, chunk.ids
+            for x in range(first_x, last_x + 1):
+                index = chunk.index(x, first_y)
+                for index in range(index, index + last_y - first_y + 1):
+                    if not types[index]:
+                        self.tile_count += 1
+                        types[index] = terrain[index]
+                        ids[index] = self.tile_count
+                        chunk.count += 1
+            if chunk.count == cells:
+                chunk.terrain = None
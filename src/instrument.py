@@ -0,0 +1,211 @@
+"""Opt-in timing of the hot paths, for the debug overlay and for profiling lag reports.
+
+Nothing is instrumented until enable() is called: it replaces the hot methods with timed
+wrappers and disable() puts the originals back, so a disabled game runs the exact same
+code as one that never imported this module.
+"""
+import cProfile
+from collections import deque
+import functools
+import json
+import sys
+from time import perf_counter_ns
+from src.chunk import Chunk
+
+# Histogram buckets are powers of two of microseconds, bucket i holds durations below 2 ** i us
+BUCKETS = 24
+TRACE_EVENTS = 10000
+
+
+class Stat:
+    """Call count, total, maximum and a log2 histogram of durations in nanoseconds."""
+    __slots__ = ('count', 'total', 'max', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.histogram = [0] * BUCKETS
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.histogram[min((value // 1000).bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the histogram bucket holding the given fraction of the values, in nanoseconds."""
+        wanted = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= wanted:
+                return min(1000 << bucket, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total / 1e6,
+            'mean_ms': self.total / self.count / 1e6 if self.count else 0,
+            'p50_ms': self.percentile(0.5) / 1e6,
+            'p99_ms': self.percentile(0.99) / 1e6,
+            'max_ms': self.max / 1e6,
+            'histogram_us': {f'<{1 << bucket}': count for bucket, count in enumerate(self.histogram) if count},
+        }
+
+
+def chunk_bytes():
+    """Estimate the memory held by one chunk and its arrays."""
+    chunk = Chunk(0, 0)
+    return sys.getsizeof(chunk) + sys.getsizeof(chunk.__dict__) + sum(sys.getsizeof(a) for a in (chunk.types, chunk.flags, chunk.ids))
+
+
+class Instrumentation:
+    """Timed wrappers around the hot paths, with per-call statistics and a trace of recent calls."""
+    def __init__(self):
+        self.enabled = False
+        self.patched = []
+        self.stats = {}
+        self.reset_steps()
+        self.trace = deque(maxlen=TRACE_EVENTS)
+        self.profile = None
+
+    def targets(self):
+        # Imported here, the controller imports this module
+        from src.controller import Controller
+        from src.grid import Grid
+        from src.renderer import Renderer
+        return [
+            (Controller, 'move'),
+            (Controller, 'try_move'),
+            (Controller, 'enter_current_tile'),
+            (Grid, 'generate_tiles_in_range'),
+            (Grid, 'generate_leading_edge'),
+            (Renderer, 'draw'),
+            (Controller, 'save_grid'),
+            (Controller, 'load_grid'),
+            (Controller, 'load_binary_file'),
+            (Controller, 'capture'),
+        ]
+
+    def enable(self):
+        """Start timing the hot paths."""
+        if self.enabled:
+            return
+        for owner, name in self.targets():
+            original = getattr(owner, name)
+            self.patched.append((owner, name, original))
+            wrapper = self.count_tiles if name == 'enter_current_tile' else self.timed
+            setattr(owner, name, wrapper(f'{getattr(owner, "__name__", owner)}.{name}'.replace('src.', ''), original))
+        self.enabled = True
+
+    def disable(self):
+        """Stop timing and restore the original methods, the statistics are kept."""
+        for owner, name, original in reversed(self.patched):
+            setattr(owner, name, original)
+        self.patched = []
+        self.enabled = False
+
+    def reset(self):
+        # Cleared in place, the installed wrappers hold on to this dict
+        self.stats.clear()
+        self.reset_steps()
+        self.trace.clear()
+
+    def reset_steps(self):
+        # Tiles generated by each enter_current_tile call
+        self.steps = 0
+        self.step_tiles = 0
+        self.max_step_tiles = 0
+        self.last_step_tiles = 0
+
+    def timed(self, name, function):
+        stats = self.stats
+        trace = self.trace
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                stat = stats.get(name)
+                if stat is None:
+                    stat = stats[name] = Stat()
+                stat.add(elapsed)
+                trace.append((name, start, elapsed))
+        return wrapper
+
+    def count_tiles(self, name, function):
+        # Timed like the others, and also records how many tiles the step generated
+        timed = self.timed(name, function)
+
+        @functools.wraps(function)
+        def wrapper(cont, *args, **kwargs):
+            before = cont.grid.tile_count
+            try:
+                return timed(cont, *args, **kwargs)
+            finally:
+                tiles = self.last_step_tiles = cont.grid.tile_count - before
+                self.steps += 1
+                self.step_tiles += tiles
+                self.max_step_tiles = max(self.max_step_tiles, tiles)
+        return wrapper
+
+    def grid_gauges(self, grid):
+        """Size and estimated memory of a grid."""
+        chunks = len(grid.chunks)
+        terrain = sum(1 for chunk in grid.chunks.values() if chunk.terrain is not None) + len(grid.prefetched)
+        return {
+            'chunks': chunks,
+            'tiles_created': grid.tile_count,
+            'evicted_chunks': len(grid.evicted),
+            'prefetched_chunks': len(grid.prefetched),
+            'memory_bytes': chunks * chunk_bytes() + terrain * sys.getsizeof(bytearray(len(Chunk(0, 0).types))),
+        }
+
+    def overlay(self, grid):
+        """Lines for the in-game debug overlay."""
+        gauges = self.grid_gauges(grid)
+        lines = [
+            f"Debug | Tiles/step: last {self.last_step_tiles} avg {self.step_tiles / self.steps if self.steps else 0:.1f} max {self.max_step_tiles}"
+            f" | Chunks: {gauges['chunks']} | Tiles: {gauges['tiles_created']} | Memory: ~{gauges['memory_bytes'] // 1024} KiB",
+        ]
+        for name, stat in self.stats.items():
+            lines.append(f"  {name:<36} n {stat.count:<7} avg {stat.total / stat.count / 1e6:7.3f} ms"
+                         f"  p99 {stat.percentile(0.99) / 1e6:7.3f} ms  max {stat.max / 1e6:7.3f} ms")
+        return lines
+
+    def export_json(self, path, grid=None):
+        """Write the statistics and the recent calls as JSON, the calls in Chrome trace event format."""
+        data = {
+            'stats': {name: stat.to_dict() for name, stat in self.stats.items()},
+            'tiles_per_step': {'steps': self.steps, 'tiles': self.step_tiles, 'max': self.max_step_tiles},
+            'gauges': self.grid_gauges(grid) if grid is not None else {},
+            'traceEvents': [
+                {'name': name, 'ph': 'X', 'ts': start / 1000, 'dur': elapsed / 1000, 'pid': 0, 'tid': 0}
+                for name, start, elapsed in self.trace
+            ],
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    def start_profile(self):
+        """Start a cProfile run over everything the game does."""
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop_profile(self, path):
+        """Stop the cProfile run and dump it for pstats or snakeviz."""
+        if self.profile is None:
+            return
+        self.profile.disable()
+        self.profile.dump_stats(path)
+        self.profile = None
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,160 @@
+import atexit
+import os
+import threading
+from src.saves import atomic_write
+from src.savefile import Reader, write_signed
+
+SNAPSHOT_FILE = 'snapshot.sav'
+JOURNAL_FILE = 'journal.log'
+
+# Record opcodes, each followed by zigzag varint arguments
+MOVE = 1    # x, y: the player moved onto (x, y)
+BOMB = 2    # x, y: the wall at (x, y) was bombed
+SHRINE = 3  # x, y: the shrine at (x, y) was used
+BOMBS = 4   # count: the player's bomb count changed
+GEN_RANGE = 5  # range: the generation range changed
+BOMBING = 6    # armed: the bomb was armed (1) or disarmed (0)
+ARGUMENTS = {MOVE: 2, BOMB: 2, SHRINE: 2, BOMBS: 1, GEN_RANGE: 1, BOMBING: 1}
+
+
+def encode_record(out, op, *args):
+    """Append one record to a bytearray."""
+    out.append(op)
+    for arg in args:
+        write_signed(out, arg)
+
+
+class Journal:
+    """Append-only log of world mutations on top of a snapshot, for cheap autosaves.
+
+    Records are buffered in memory and a background thread appends and fsyncs them every
+    interval seconds, so a crash loses at most the last batch. Every compact_every records
+    the journal is folded into a fresh snapshot: capture(), called on the recording thread,
+    returns a function encoding a copy of the state as binary save data and the records of
+    what a save leaves out, and the background thread runs the encoding and starts the log
+    over from those records plus whatever was recorded since the capture. Records hold
+    absolute positions and counts, so replaying one twice (after a crash between replacing
+    the snapshot and replacing the journal) is harmless.
+    """
+    def __init__(self, directory, capture, interval=0.5, compact_every=10000):
+        self.directory = directory
+        self.capture = capture
+        self.interval = interval
+        self.compact_every = compact_every
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        os.makedirs(directory, exist_ok=True)
+        self.buffer = bytearray()
+        self.records = 0
+        self.lock = threading.Lock()
+        # Held while a snapshot is written out, so compactions never overlap
+        self.compacting = threading.Lock()
+        # Compaction captured but not written out yet, see start_compaction
+        self.pending = None
+        self.file = open(self.journal_path, 'ab')
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='journal', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, op, *args):
+        """Buffer one mutation record, capturing a snapshot when the journal has grown long enough."""
+        with self.lock:
+            encode_record(self.buffer, op, *args)
+            self.records += 1
+        # Not while a snapshot is being written out, that moves the journal under any new capture
+        if self.records >= self.compact_every and self.pending is None and not self.compacting.locked():
+            self.pending = self.start_compaction()
+
+    def run(self):
+        while not self.closed.wait(self.interval):
+            self.flush()
+            self.finish_pending()
+
+    def finish_pending(self):
+        """Write out the compaction captured by record(), if there is one."""
+        with self.compacting:
+            pending, self.pending = self.pending, None
+            if pending:
+                self.finish_compaction(pending)
+
+    def flush(self):
+        """Append the buffered records to the journal file and fsync it."""
+        with self.lock:
+            if not self.buffer or self.file.closed:
+                return
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def start_compaction(self):
+        """Capture the state and note where the journal stands, returning what finish_compaction needs."""
+        encode, records = self.capture()
+        with self.lock:
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+            self.file.flush()
+            self.records = 0
+            return encode, records, self.file.tell()
+
+    def finish_compaction(self, compaction):
+        """Write the captured snapshot and keep only the records that came after the capture."""
+        encode, records, offset = compaction
+        data = encode()
+        with self.lock:
+            if self.file.closed:
+                return
+            atomic_write(self.snapshot_path, data)
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+            self.file.flush()
+            with open(self.journal_path, 'rb') as f:
+                f.seek(offset)
+                later = f.read()
+            # Replaced whole like the snapshot, a crash leaves either the old journal or the new one
+            self.file.close()
+            atomic_write(self.journal_path, bytes(records) + later)
+            self.file = open(self.journal_path, 'ab')
+
+    def compact(self):
+        """Replace the snapshot with the current state and empty the journal, before returning."""
+        with self.compacting:
+            self.pending = None
+            self.finish_compaction(self.start_compaction())
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.thread.join()
+        # A compaction still pending is dropped, the journal holds everything since the last snapshot
+        self.flush()
+        self.file.close()
+        atexit.unregister(self.close)
+
+
+def read_snapshot(directory):
+    """Read the snapshot of an autosave directory, or None when there is none."""
+    try:
+        with open(os.path.join(directory, SNAPSHOT_FILE), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def read_records(directory):
+    """Yield the (op, args) records of an autosave journal, stopping at a torn final record."""
+    try:
+        with open(os.path.join(directory, JOURNAL_FILE), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    reader = Reader(data)
+    while reader.position < len(data):
+        try:
+            op = reader.take(1)[0]
+            args = tuple(reader.signed() for _ in range(ARGUMENTS[op]))
+        except (IndexError, KeyError, ValueError):
+            return
+        yield op, args
@@ -0,0 +1,112 @@
+"""Zoomed-out overview of the world, drawn from per-chunk summaries instead of tiles.
+
+Each chunk is summarized as (explored cells, intact walls, usable shrines) and the summaries
+are summed into square blocks of 4x4 blocks of the level below, so every cell of the overview
+at any zoom level is a single dictionary lookup. Summaries are recomputed only for the chunks
+the grid reports as changed since the last refresh.
+"""
+from colorama import Fore, Style
+from src.chunk import CHUNK_SIZE, USED, OCCUPIED
+from src.grid import SHRINE, count_intact_walls
+from src.tile import EMPTY_GLYPH
+
+# Each level's blocks are 2 ** LEVEL_SHIFT chunks wider than the level below
+LEVEL_SHIFT = 2
+LEVELS = 6
+NOTHING = (0, 0, 0)
+
+# Wall density of a block in tenths picks the character, the share explored its color
+DENSITY_CHARS = '·░▒▓█'
+SHRINE_GLYPH = f'{Fore.YELLOW}◆{Style.RESET_ALL}'
+PLAYER_GLYPH = f'{Fore.CYAN}🞚{Style.RESET_ALL}'
+DENSITY_GLYPHS = [
+    [color + char + Style.RESET_ALL for char in DENSITY_CHARS]
+    for color in (Fore.LIGHTBLACK_EX, Fore.GREEN)
+]
+
+
+def summarize(chunk):
+    """Get (explored cells, intact walls, usable shrines) of a chunk, counted over its whole arrays."""
+    types, flags = chunk.types, chunk.flags
+    # USED is only ever set on shrines, alone or with OCCUPIED
+    shrines = types.count(SHRINE) - flags.count(USED) - flags.count(USED | OCCUPIED)
+    return chunk.count, count_intact_walls(types, flags), shrines
+
+
+def block_size(level):
+    """Width in tiles of the blocks of a level."""
+    return CHUNK_SIZE << LEVEL_SHIFT * level
+
+
+def summary_glyph(summary, cells):
+    """Glyph of one overview cell covering cells tiles."""
+    if summary is None or not summary[0]:
+        return EMPTY_GLYPH
+    explored, walls, shrines = summary
+    if shrines:
+        return SHRINE_GLYPH
+    return DENSITY_GLYPHS[explored * 2 >= cells][min(walls * 10 // explored, len(DENSITY_CHARS) - 1)]
+
+
+class Minimap:
+    """Summaries of a grid at LEVELS zoom levels, level 0 being one chunk per block."""
+    def __init__(self, grid, levels=LEVELS):
+        self.grid = grid
+        # Per level, block key to summary, tuples for chunks and [explored, walls, shrines] above
+        self.levels = [{} for _ in range(levels)]
+        self.changed = grid.watch()
+        self.changed.update(grid.chunk_keys())
+
+    def close(self):
+        """Stop following the grid's changes."""
+        self.grid.unwatch(self.changed)
+
+    def refresh(self):
+        """Recompute the chunks changed since the last refresh and add the differences to every level above."""
+        grid = self.grid
+        chunks = self.levels[0]
+        upper = self.levels[1:]
+        for key in self.changed:
+            # Read without paging in, an overview must not push the player's surroundings out of the cache
+            chunk = grid.chunks.get(key) or grid.peek_chunk(key)
+            summary = summarize(chunk) if chunk is not None else NOTHING
+            previous = chunks.get(key, NOTHING)
+            if summary == previous:
+                continue
+            chunks[key] = summary
+            explored, walls, shrines = (new - old for new, old in zip(summary, previous))
+            bx, by = key
+            for blocks in upper:
+                bx >>= LEVEL_SHIFT
+                by >>= LEVEL_SHIFT
+                block = blocks.get((bx, by))
+                if block is None:
+                    block = blocks[(bx, by)] = [0, 0, 0]
+                block[0] += explored
+                block[1] += walls
+                block[2] += shrines
+        self.changed.clear()
+
+    def summary(self, level, bx, by):
+        """Get the summary of block (bx, by) of a level, None when nothing in it was generated."""
+        self.refresh()
+        return self.levels[level].get((bx, by))
+
+    def overview(self, x, y, radius, level):
+        """Get the rows of block summaries of the square of radius blocks around the block holding (x, y)."""
+        self.refresh()
+        size = block_size(level)
+        blocks = self.levels[level]
+        bx, by = x // size, y // size
+        return [
+            [blocks.get((row, column)) for column in range(by - radius, by + radius + 1)]
+            for row in range(bx - radius, bx + radius + 1)
+        ]
+
+    def build_frame(self, x, y, radius, level):
+        """Get the glyph rows of the overview around (x, y), the player's block marked."""
+        size = block_size(level)
+        cells = size * size
+        frame = [[summary_glyph(summary, cells) for summary in row] for row in self.overview(x, y, radius, level)]
+        frame[radius][radius] = PLAYER_GLYPH
+        return frame
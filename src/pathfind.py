@@ -0,0 +1,235 @@
+"""Paths over the grid, with walls as obstacles or, optionally, bombed through.
+
+Searches read the chunk arrays directly, one byte of cell cost per cell, and cells that
+have not been generated yet are read from the seed's terrain without creating tiles.
+Without bombs every step costs the same and jump point search skips over open ground,
+with bombs A* runs over (cell, bombs used) states so no path spends more than it has.
+Both are shortest by default, and within a given weight of it when asked to be faster, see find_path.
+"""
+from heapq import heappush, heappop
+from src.chunk import CHUNK_SIZE, TYPE_CODES, BOMBED
+from src.terrain import generate_chunk
+
+# Cell costs
+OPEN = 0
+WALL = 1
+VOID = 2   # not walkable at all: outside the search bounds, or not generated when not generating
+
+# Type code to cell cost, code 0 is a cell that has not been generated
+CELL_COSTS = bytes([VOID, OPEN, WALL, OPEN]) + bytes([VOID]) * 252
+
+CELLS = CHUNK_SIZE * CHUNK_SIZE
+
+
+class PathMap:
+    """Cell costs of a grid, built one chunk at a time as a search reaches it.
+
+    Chunks outside bounds = (min_cx, min_cy, max_cx, max_cy) are void, which keeps a search
+    for an unreachable goal from wandering the infinite world.
+    """
+    def __init__(self, grid, generate=True, bounds=None):
+        self.grid = grid
+        self.generate = generate
+        self.bounds = bounds
+        self.chunks = {}
+
+    def load(self, key):
+        cells = self.chunks[key] = self.chunk_cells(key)
+        return cells
+
+    def chunk_cells(self, key):
+        bounds = self.bounds
+        if bounds and not (bounds[0] <= key[0] <= bounds[2] and bounds[1] <= key[1] <= bounds[3]):
+            return bytes([VOID]) * CELLS
+        grid = self.grid
+        chunk = grid.load_chunk(key)
+        if chunk is None or (self.generate and chunk.count < CELLS):
+            terrain = None
+            if self.generate:
+                terrain = (chunk and chunk.terrain) or grid.prefetched.get(key) or generate_chunk(grid.seed, *key, grid.legacy)
+            if chunk is None:
+                return terrain.translate(CELL_COSTS) if terrain else bytes([VOID]) * CELLS
+            cells = bytearray(chunk.types.translate(CELL_COSTS))
+            if terrain:
+                for index in chunk.find(0):
+                    cells[index] = CELL_COSTS[terrain[index]]
+        else:
+            cells = bytearray(chunk.types.translate(CELL_COSTS))
+        flags = chunk.flags
+        for index in chunk.find(TYPE_CODES['wall']):
+            if flags[index] & BOMBED:
+                cells[index] = OPEN
+        return cells
+
+    def cost(self, x, y):
+        cells = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if cells is None:
+            cells = self.load((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        return cells[x % CHUNK_SIZE * CHUNK_SIZE + y % CHUNK_SIZE]
+
+
+# Heuristic weight to pass for long paths, see find_path
+FAST_WEIGHT = 1.2
+
+
+def find_path(grid, start, goal, bombs=0, bomb_cost=10, generate=True, margin=64, weight=1):
+    """Find a shortest path from start to goal, both (x, y), as a list of cells including both ends.
+
+    Walls can be bombed through when bombs > 0, each one adding bomb_cost to the path length
+    and at most bombs of them per path. With generate set cells are read from the seed where
+    no tile exists yet, otherwise only generated tiles are walkable. The search stays within
+    margin cells of the box spanned by start and goal. Returns None when there is no path.
+
+    Paths are exactly shortest by default. A weight above 1 inflates the heuristic: with
+    FAST_WEIGHT paths may be up to 20% longer than the shortest, typically about 5% over
+    long distances, in exchange for 10k-step paths in under a second instead of ten or more.
+    Over short distances both are as fast.
+    """
+    bounds = (
+        (min(start[0], goal[0]) - margin) // CHUNK_SIZE, (min(start[1], goal[1]) - margin) // CHUNK_SIZE,
+        (max(start[0], goal[0]) + margin) // CHUNK_SIZE, (max(start[1], goal[1]) + margin) // CHUNK_SIZE,
+    )
+    path_map = PathMap(grid, generate, bounds)
+    if path_map.cost(*goal) == VOID or path_map.cost(*start) == VOID:
+        return None
+    if bombs > 0:
+        return astar(path_map, start, goal, bombs, bomb_cost, weight)
+    if path_map.cost(*goal) != OPEN:
+        return None
+    return jump_point_search(path_map, start, goal, weight)
+
+
+def jump_point_search(path_map, start, goal, weight=1):
+    """A* over jump points on a uniform-cost grid, walls blocking.
+
+    Among equally short paths only those taking x steps as early as possible are searched:
+    an x scan branches into y scans at every cell, while a y scan only stops where an x step
+    becomes possible that was not possible from the cell before, or at the goal.
+    """
+    cost = path_map.cost
+    chunks = path_map.chunks
+    goal_x, goal_y = goal
+
+    def blocked(x, y):
+        return cost(x, y) != OPEN
+
+    def row(x, cy):
+        # The cells of row x within chunk column cy
+        cells = chunks.get((x // CHUNK_SIZE, cy))
+        if cells is None:
+            cells = path_map.load((x // CHUNK_SIZE, cy))
+        start = x % CHUNK_SIZE * CHUNK_SIZE
+        return cells[start:start + CHUNK_SIZE]
+
+    def jump_y(x, y, dy):
+        # Scans a chunk-wide segment of rows x - 1, x and x + 1 at a time, any nonzero cost blocks
+        cy, i = divmod(y, CHUNK_SIZE)
+        above, here, below = row(x - 1, cy), row(x, cy), row(x + 1, cy)
+        blocked_above, blocked_below = above[i], below[i]
+        while True:
+            y += dy
+            i += dy
+            if i == CHUNK_SIZE or i < 0:
+                cy += dy
+                i %= CHUNK_SIZE
+                above, here, below = row(x - 1, cy), row(x, cy), row(x + 1, cy)
+            if here[i]:
+                return None
+            if x == goal_x and y == goal_y:
+                return y
+            if (blocked_above and not above[i]) or (blocked_below and not below[i]):
+                return y
+            blocked_above, blocked_below = above[i], below[i]
+
+    def jump_x(x, y, dx):
+        while True:
+            next_x = x + dx
+            if blocked(next_x, y):
+                return None
+            if (next_x == goal_x and y == goal_y) or jump_y(next_x, y, 1) is not None or jump_y(next_x, y, -1) is not None:
+                return next_x
+            x = next_x
+
+    start_x, start_y = start
+    # Heap of (f, -g, x, y, dx, dy), preferring deeper nodes among equal f
+    heap = [(abs(goal_x - start_x) + abs(goal_y - start_y), 0, start_x, start_y, 0, 0)]
+    best = {start: 0}
+    parent = {}
+    while heap:
+        _, g, x, y, dx, dy = heappop(heap)
+        g = -g
+        if g > best[(x, y)]:
+            continue
+        if x == goal_x and y == goal_y:
+            return expand_path(parent, goal)
+        if dx:
+            directions = [(dx, 0), (0, 1), (0, -1)]
+        elif dy:
+            directions = [(0, dy)] + [(step, 0) for step in (-1, 1) if blocked(x + step, y - dy) and not blocked(x + step, y)]
+        else:
+            directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+        for step_x, step_y in directions:
+            if step_x:
+                next_x, next_y = jump_x(x, y, step_x), y
+                if next_x is None:
+                    continue
+            else:
+                next_x, next_y = x, jump_y(x, y, step_y)
+                if next_y is None:
+                    continue
+            next_g = g + abs(next_x - x) + abs(next_y - y)
+            if next_g < best.get((next_x, next_y), next_g + 1):
+                best[(next_x, next_y)] = next_g
+                parent[(next_x, next_y)] = (x, y)
+                heappush(heap, (next_g + weight * (abs(goal_x - next_x) + abs(goal_y - next_y)), -next_g, next_x, next_y, step_x, step_y))
+    return None
+
+
+def expand_path(parent, goal):
+    """Turn the jump points leading to goal into the full list of cells from the start."""
+    points = [goal]
+    while points[-1] in parent:
+        points.append(parent[points[-1]])
+    points.reverse()
+    path = [points[0]]
+    for (x, y), (next_x, next_y) in zip(points, points[1:]):
+        step_x = (next_x > x) - (next_x < x)
+        step_y = (next_y > y) - (next_y < y)
+        while (x, y) != (next_x, next_y):
+            x, y = x + step_x, y + step_y
+            path.append((x, y))
+    return path
+
+
+def astar(path_map, start, goal, bombs, bomb_cost, weight=1):
+    """A* over (x, y, bombs used) states, each wall on the path costing a bomb and bomb_cost extra steps."""
+    cost = path_map.cost
+    goal_x, goal_y = goal
+    start_state = (start[0], start[1], 0)
+    heap = [(abs(goal_x - start[0]) + abs(goal_y - start[1]), 0, start_state)]
+    best = {start_state: 0}
+    parent = {}
+    while heap:
+        _, g, state = heappop(heap)
+        g = -g
+        if g > best[state]:
+            continue
+        x, y, used = state
+        if x == goal_x and y == goal_y:
+            path = [state]
+            while path[-1] in parent:
+                path.append(parent[path[-1]])
+            return [(x, y) for x, y, _ in reversed(path)]
+        for next_x, next_y in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            cell = cost(next_x, next_y)
+            if cell == OPEN:
+                next_state, next_g = (next_x, next_y, used), g + 1
+            elif cell == WALL and used < bombs:
+                next_state, next_g = (next_x, next_y, used + 1), g + 1 + bomb_cost
+            else:
+                continue
+            if next_g < best.get(next_state, next_g + 1):
+                best[next_state] = next_g
+                parent[next_state] = state
+                heappush(heap, (next_g + weight * (abs(goal_x - next_x) + abs(goal_y - next_y)), -next_g, next_state))
+    return None
@@ -0,0 +1,104 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from src.chunk import CHUNK_SIZE, chunk_key
+from src.terrain import generate_chunks
+
+# Chunks per worker task: tasks run in order, so the nearest chunks are ready first
+PREFETCH_BATCH = 8
+
+
+def crossings(start, direction, length):
+    """Get the steps t in 1..length at which start + direction * t enters another chunk along one axis."""
+    if not direction:
+        return range(0)
+    # Steps to the first cell of the next chunk that way
+    first = -start % CHUNK_SIZE if direction > 0 else start % CHUNK_SIZE + 1
+    return range(first or CHUNK_SIZE, length + 1, CHUNK_SIZE)
+
+
+def diagonal_chunk_keys(x, y, sx, sy, length, keys):
+    """Add the keys of the chunks the cells (x + sx * t, y + sy * t) for t in 0..length lie in.
+
+    Only the cells where the line enters another chunk are looked at, so no chunk is skipped
+    and the work grows with the chunks crossed rather than the cells.
+    """
+    keys.add(chunk_key(x, y))
+    for t in {*crossings(x, sx, length), *crossings(y, sy, length)}:
+        keys.add(chunk_key(x + sx * t, y + sy * t))
+
+
+def edge_chunk_keys(x, y, gen_range, dx, dy, lookahead):
+    """Get the keys of the chunks the leading edge crosses over the next lookahead steps of (dx, dy).
+
+    Same geometry as Grid.generate_leading_edge: each step's edge is two diagonals from the
+    sides of the diamond to its tip, walked exactly a chunk boundary at a time.
+    """
+    keys = set()
+    for step in range(1, lookahead + 1):
+        centre_x, centre_y = x + dx * step, y + dy * step
+        for sign in (-1, 1):
+            diagonal_chunk_keys(centre_x + dy * sign * gen_range, centre_y + dx * sign * gen_range,
+                                dx - dy * sign, dy - dx * sign, gen_range, keys)
+    return keys
+
+
+def chunk_distance(key, x, y):
+    """Manhattan distance from (x, y) to the nearest cell of the chunk with key."""
+    x0, y0 = key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE
+    return max(x0 - x, 0, x - x0 - CHUNK_SIZE + 1) + max(y0 - y, 0, y - y0 - CHUNK_SIZE + 1)
+
+
+class Prefetcher:
+    """Generates the terrain of chunks ahead of the player in a worker pool while the game waits for input.
+
+    Results are merged into grid.prefetched on the event loop thread, the same thread the
+    game runs on, so the grid is never touched concurrently. Grid.terrain takes them from
+    there when the leading edge reaches their chunk. At most limit chunks are held.
+    """
+    def __init__(self, executor=None, lookahead=2 * CHUNK_SIZE, limit=1024):
+        self.executor = executor or ProcessPoolExecutor(max_workers=1)
+        self.lookahead = lookahead
+        self.limit = limit
+        self.grid = None
+        self.pending = set()
+
+    def update(self, grid, x, y, gen_range, step):
+        """Schedule the chunks the player will reach by moving on in direction step = (dx, dy).
+
+        Chunks are generated nearest first, PREFETCH_BATCH to a task. Returns the futures of the tasks.
+        """
+        if grid is not self.grid:
+            self.grid = grid
+            self.pending = set()
+        keys = sorted(
+            (key for key in edge_chunk_keys(x, y, gen_range, *step, self.lookahead)
+             if key not in self.pending and key not in grid.prefetched and not self.generated(grid, key)),
+            key=lambda key: (chunk_distance(key, x, y), key),
+        )
+        self.pending.update(keys)
+        loop = asyncio.get_running_loop()
+        futures = []
+        for start in range(0, len(keys), PREFETCH_BATCH):
+            batch = keys[start:start + PREFETCH_BATCH]
+            future = loop.run_in_executor(self.executor, generate_chunks, grid.seed, batch, grid.legacy)
+            future.add_done_callback(lambda future, batch=batch: self.merge(grid, batch, future))
+            futures.append(future)
+        return futures
+
+    def generated(self, grid, key):
+        # Only chunks already in memory are checked, paging one in just to look would defeat the point
+        chunk = grid.chunks.get(key)
+        return chunk is not None and (chunk.terrain is not None or chunk.count == CHUNK_SIZE * CHUNK_SIZE)
+
+    def merge(self, grid, keys, future):
+        if grid is self.grid:
+            self.pending.difference_update(keys)
+        if future.cancelled() or future.exception() is not None:
+            return
+        for key, terrain in zip(keys, future.result()):
+            grid.prefetched[key] = terrain
+        while len(grid.prefetched) > self.limit:
+            del grid.prefetched[next(iter(grid.prefetched))]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,280 @@
+"""Input recordings: a compact log of a game's actions, and replaying it without rendering.
+
+A recording is a header (seed, terrain generator, initial gen_range and viewport) followed
+by varint entries of (count << 3 | code). Codes 0 to 5 are the simulation keys w/a/s/d/q/e,
+repeated count times, so holding a key down costs one entry. Code 6 sets the generation
+range to count and code 7 resets the world to a new seed, whose count bytes follow.
+
+Replays run the actions through src.simulate, the same rules the game uses, and keep
+copies of the state at regular steps so seeking backwards only replays from the last
+copy before the target instead of from the start.
+
+Replay a recording from the repository root with:
+    python -m src.recording recordings/game.rec
+    python -m src.recording recordings/game.rec --to 150000 --save bug-report
+"""
+from array import array
+import argparse
+from bisect import bisect_right
+import hashlib
+import re
+import time
+from src.chunk import Chunk
+from src.controller import Controller
+from src.savefile import Reader, write_varint
+from src.simulate import simulate, summarize, ACTIONS
+
+MAGIC = b'SDRC'
+VERSION = 1
+
+# Header flag bits
+LEGACY_TERRAIN = 1
+
+# Entry codes beyond the ACTIONS indices
+GEN_RANGE = 6
+RESET = 7
+CODE_BITS = 3
+
+CHECKPOINT_INTERVAL = 100_000
+
+
+def recording_name(seed):
+    """Get a file name for a new recording of seed, safe whatever characters the seed holds.
+
+    Like save files, a readable slug of the seed is disambiguated with a hash of it.
+    """
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', str(seed))[:40]
+    digest = hashlib.sha1(str(seed).encode()).hexdigest()[:8]
+    return f"{slug}-{digest}-{time.strftime('%Y%m%d-%H%M%S')}.rec"
+
+
+class Recorder:
+    """Writes the actions of a game to a recording file as they happen, a run of one action as one entry.
+
+    The run in progress is only written when another action starts or on flush, so a game
+    that crashes loses at most that run.
+    """
+    def __init__(self, path, seed, gen_range, viewport, legacy=False):
+        self.path = path
+        self.file = open(path, 'wb')
+        header = bytearray(MAGIC)
+        write_varint(header, VERSION)
+        write_varint(header, LEGACY_TERRAIN if legacy else 0)
+        write_varint(header, gen_range)
+        write_varint(header, viewport)
+        self.file.write(header)
+        self.write_seed(seed)
+        self.code = None
+        self.count = 0
+        self.actions = 0
+
+    def write_seed(self, seed):
+        seed = str(seed).encode()
+        out = bytearray()
+        write_varint(out, len(seed))
+        self.file.write(out + seed)
+
+    def write_entry(self, code, count):
+        out = bytearray()
+        write_varint(out, count << CODE_BITS | code)
+        self.file.write(out)
+
+    def end_run(self):
+        if self.count:
+            self.write_entry(self.code, self.count)
+        self.code = None
+        self.count = 0
+
+    def record(self, action):
+        """Record one action, a key of src.simulate.ACTIONS."""
+        code = ACTIONS.index(action.encode() if isinstance(action, str) else action)
+        if code != self.code:
+            self.end_run()
+            self.code = code
+        self.count += 1
+        self.actions += 1
+
+    def set_gen_range(self, gen_range):
+        self.end_run()
+        self.write_entry(GEN_RANGE, gen_range)
+
+    def reset(self, seed):
+        self.end_run()
+        seed = str(seed).encode()
+        self.write_entry(RESET, len(seed))
+        self.file.write(seed)
+
+    def flush(self):
+        self.end_run()
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+
+def read_header(data):
+    """Get the header fields of a recording and the reader positioned on its first entry."""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not an input recording")
+    reader = Reader(data, len(MAGIC))
+    version = reader.varint()
+    if version != VERSION:
+        raise ValueError(f"Unsupported recording version {version}")
+    flags = reader.varint()
+    header = {'legacy': bool(flags & LEGACY_TERRAIN), 'gen_range': reader.varint(), 'viewport': reader.varint()}
+    header['seed'] = bytes(reader.take(reader.varint())).decode()
+    return header, reader
+
+
+def read_entries(reader):
+    """Yield (code, count, seed) for every entry, seed only set for resets.
+
+    A last entry cut short, as a crash can leave it, ends the recording.
+    """
+    data = reader.data
+    while reader.position < len(data):
+        try:
+            value = reader.varint()
+            code, count = value & (1 << CODE_BITS) - 1, value >> CODE_BITS
+            seed = bytes(reader.take(count)).decode() if code == RESET else None
+        except (IndexError, ValueError):
+            return
+        yield code, count, seed
+
+
+class Replay:
+    """Replays a recording against a Controller, seekable to any step.
+
+    Steps count the actions, not the gen_range and reset entries. A copy of the chunk arrays
+    and player state is kept every checkpoint_interval steps the first time the replay passes
+    them, so a seek restores exactly the state, tile ids included, that replaying from the
+    start would reach.
+    """
+    def __init__(self, data, checkpoint_interval=CHECKPOINT_INTERVAL):
+        header, reader = read_header(data)
+        self.header = header
+        # Every action as one byte, so a stretch of them is a slice, and the gen_range
+        # changes and resets as (step they come before, code, count, seed)
+        self.actions = bytearray()
+        self.controls = []
+        for code, count, seed in read_entries(reader):
+            if code < GEN_RANGE:
+                self.actions += ACTIONS[code:code + 1] * count
+            else:
+                self.controls.append((len(self.actions), code, count, seed))
+        self.total = len(self.actions)
+        self.checkpoint_interval = checkpoint_interval
+        # (step, control index, snapshot), by step
+        self.checkpoints = []
+        self.restart()
+
+    @classmethod
+    def open(cls, path, checkpoint_interval=CHECKPOINT_INTERVAL):
+        with open(path, 'rb') as f:
+            return cls(f.read(), checkpoint_interval)
+
+    def restart(self):
+        header = self.header
+        self.controller = Controller(header['viewport'], header['gen_range'], header['seed'], header['legacy'])
+        self.step = 0
+        self.control = 0
+
+    def checkpoint(self):
+        if self.checkpoints and self.checkpoints[-1][0] >= self.step:
+            return
+        cont = self.controller
+        grid = cont.grid
+        chunks = [
+            (chunk.cx, chunk.cy, bytes(chunk.types), bytes(chunk.flags), chunk.ids.tobytes())
+            for chunk in map(grid.peek_chunk, grid.chunk_keys())
+        ]
+        state = (grid.seed, grid.tile_count, cont.gen_range, cont.generated, cont.player_state())
+        self.checkpoints.append((self.step, self.control, (state, chunks)))
+
+    def restore(self, checkpoint):
+        step, control, (state, chunks) = checkpoint
+        seed, tile_count, gen_range, generated, player = state
+        cont = self.controller = Controller(self.header['viewport'], gen_range, seed, self.header['legacy'])
+        grid = cont.grid
+        grid.chunks.clear()
+        for cx, cy, types, flags, ids in chunks:
+            chunk = Chunk(cx, cy)
+            chunk.types[:] = types
+            chunk.flags[:] = flags
+            chunk.ids = array('I', ids)
+            chunk.count = len(types) - types.count(0)
+            grid.chunks[(cx, cy)] = chunk
+        grid.tile_count = tile_count
+        for field, value in player.items():
+            setattr(cont, field, value)
+        cont.generated = generated
+        self.step, self.control = step, control
+
+    def run(self, until=None):
+        """Replay up to step until, the end by default, returning the status codes of the actions run."""
+        until = self.total if until is None else min(until, self.total)
+        statuses = bytearray()
+        interval = self.checkpoint_interval
+        controls = self.controls
+        while self.step < until:
+            if self.step % interval == 0:
+                self.checkpoint()
+            cont = self.controller
+            while self.control < len(controls) and controls[self.control][0] == self.step:
+                _, code, count, seed = controls[self.control]
+                if code == GEN_RANGE:
+                    cont.set_gen_range(count)
+                else:
+                    cont.reset(seed)
+                self.control += 1
+            # Run the actions up to the next checkpoint, control entry or until, whichever comes first
+            stop = min(until, (self.step // interval + 1) * interval)
+            if self.control < len(controls):
+                stop = min(stop, controls[self.control][0])
+            statuses += simulate(cont, self.actions[self.step:stop])
+            self.step = stop
+        if self.step % interval == 0 and self.step < self.total:
+            self.checkpoint()
+        return statuses
+
+    def seek(self, step):
+        """Bring the replay to step, from the last checkpoint at or before it when that is closer than where it is."""
+        step = max(0, min(step, self.total))
+        index = bisect_right([checkpoint[0] for checkpoint in self.checkpoints], step) - 1
+        if step < self.step or (index >= 0 and self.checkpoints[index][0] > self.step):
+            if index >= 0:
+                self.restore(self.checkpoints[index])
+            else:
+                self.restart()
+        self.run(step)
+        return self.controller
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m src.recording', description="Replay an input recording without rendering.")
+    parser.add_argument('recording')
+    parser.add_argument('--to', type=int, metavar='STEP', help="stop at this step instead of the end")
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_INTERVAL, metavar='STEPS')
+    parser.add_argument('--save', metavar='NAME', help="save the replayed state under this name, to load it in the game")
+    args = parser.parse_args(argv)
+
+    replay = Replay.open(args.recording, args.checkpoint_every)
+    header = replay.header
+    print(f"Seed: {header['seed']} | Gen range: {header['gen_range']} | Viewport: {header['viewport']} | Actions: {replay.total}")
+    start = time.perf_counter()
+    statuses = replay.run(args.to)
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {len(statuses)} actions in {elapsed:.3f}s ({len(statuses) / elapsed if elapsed else 0:,.0f} actions/s)")
+    for name, count in summarize(statuses).items():
+        print(f"  {name}: {count}")
+    cont = replay.controller
+    print(f"Step {replay.step}: X: {cont.x} | Y: {cont.y} | Bombs: {cont.bombs} | Tiles generated: {len(cont.grid)}")
+    if args.save:
+        cont.save_grid(args.save)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+from array import array
+import json
+import mmap
+import os
+import re
+import struct
+from src.chunk import Chunk, CHUNK_SIZE
+from src.saves import atomic_write
+
+MAGIC = b'SDRG'
+VERSION = 1
+# Chunks per region side, a region file covers REGION_SIZE x REGION_SIZE chunks
+REGION_SIZE = 32
+
+HEADER = struct.Struct('<4sBBBx')
+# One slot number per chunk of the region, 0 when the chunk is not stored
+TABLE = struct.Struct(f'<{REGION_SIZE * REGION_SIZE}I')
+DATA_START = HEADER.size + TABLE.size
+CELLS = CHUNK_SIZE * CHUNK_SIZE
+# types, flags, then 4-byte tile ids
+RECORD_SIZE = CELLS * 6
+
+META_FILE = 'world.json'
+REGION_NAME = re.compile(r'r\.(-?\d+)\.(-?\d+)\.region$')
+
+
+class RegionFile:
+    """Memory-mapped file holding the chunks of one region at fixed-size record offsets.
+
+    The file starts with a header and an offset table giving the record slot of every chunk
+    in the region. Records are appended as chunks are first stored and rewritten in place
+    after that, so reading a chunk only pages in its own record.
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, CHUNK_SIZE, REGION_SIZE))
+                f.write(bytes(TABLE.size))
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, version, chunk_size, region_size = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a region file: {path}")
+        if (chunk_size, region_size) != (CHUNK_SIZE, REGION_SIZE):
+            raise ValueError(f"Region file {path} uses a different chunk layout")
+
+    def table_offset(self, cx, cy):
+        return HEADER.size + 4 * ((cx % REGION_SIZE) * REGION_SIZE + cy % REGION_SIZE)
+
+    def slot(self, cx, cy):
+        return struct.unpack_from('<I', self.map, self.table_offset(cx, cy))[0]
+
+    def keys(self, rx, ry):
+        """Yield the keys of the chunks stored in this region."""
+        for i, slot in enumerate(TABLE.unpack_from(self.map, HEADER.size)):
+            if slot:
+                yield rx * REGION_SIZE + i // REGION_SIZE, ry * REGION_SIZE + i % REGION_SIZE
+
+    def read(self, cx, cy):
+        """Read chunk (cx, cy), or None when it is not stored."""
+        slot = self.slot(cx, cy)
+        if not slot:
+            return None
+        offset = DATA_START + (slot - 1) * RECORD_SIZE
+        if offset + RECORD_SIZE > len(self.map):
+            # Appended through another handle on the same file since this one was mapped
+            self.remap()
+        chunk = Chunk(cx, cy)
+        chunk.types[:] = self.map[offset:offset + CELLS]
+        chunk.flags[:] = self.map[offset + CELLS:offset + 2 * CELLS]
+        chunk.ids = array('I', self.map[offset + 2 * CELLS:offset + RECORD_SIZE])
+        chunk.count = CELLS - chunk.types.count(0)
+        return chunk
+
+    def write(self, chunk):
+        """Write a chunk into its record, appending a new record the first time."""
+        slot = self.slot(chunk.cx, chunk.cy)
+        if not slot:
+            # Counted from the table and the file itself rather than kept since opening,
+            # another handle on the same file may have appended records in the meantime
+            slot = max(TABLE.unpack_from(self.map, HEADER.size)) + 1
+            if DATA_START + slot * RECORD_SIZE > len(self.map):
+                self.grow(slot)
+            struct.pack_into('<I', self.map, self.table_offset(chunk.cx, chunk.cy), slot)
+        offset = DATA_START + (slot - 1) * RECORD_SIZE
+        self.map[offset:offset + CELLS] = chunk.types
+        self.map[offset + CELLS:offset + 2 * CELLS] = chunk.flags
+        self.map[offset + 2 * CELLS:offset + RECORD_SIZE] = chunk.ids.tobytes()
+
+    def grow(self, slots):
+        """Extend the file to fit at least slots records, doubling to keep remaps rare."""
+        size = os.fstat(self.file.fileno()).st_size
+        capacity = max(slots, 2 * ((size - DATA_START) // RECORD_SIZE), 16)
+        self.file.truncate(DATA_START + capacity * RECORD_SIZE)
+        self.remap()
+
+    def remap(self):
+        """Map the file again at its current size."""
+        self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class RegionStore:
+    """World directory of region files plus a world.json with the seed and player state."""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.regions = {}
+        # Regions already known not to exist, so misses over unexplored ground stay cheap
+        self.missing = set()
+
+    def region(self, cx, cy, create=False):
+        rx, ry = cx // REGION_SIZE, cy // REGION_SIZE
+        region = self.regions.get((rx, ry))
+        if region is None:
+            if not create and (rx, ry) in self.missing:
+                return None
+            path = os.path.join(self.directory, f'r.{rx}.{ry}.region')
+            if not create and not os.path.exists(path):
+                self.missing.add((rx, ry))
+                return None
+            self.missing.discard((rx, ry))
+            region = self.regions[(rx, ry)] = RegionFile(path)
+        return region
+
+    def read(self, cx, cy):
+        region = self.region(cx, cy)
+        return region.read(cx, cy) if region else None
+
+    def write(self, chunk):
+        self.region(chunk.cx, chunk.cy, create=True).write(chunk)
+
+    def keys(self):
+        """Yield the keys of every stored chunk."""
+        for name in os.listdir(self.directory):
+            match = REGION_NAME.match(name)
+            if match:
+                rx, ry = int(match.group(1)), int(match.group(2))
+                yield from self.region(rx * REGION_SIZE, ry * REGION_SIZE).keys(rx, ry)
+
+    def read_meta(self):
+        with open(os.path.join(self.directory, META_FILE), 'r') as f:
+            return json.load(f)
+
+    def write_meta(self, meta):
+        atomic_write(os.path.join(self.directory, META_FILE), json.dumps(meta).encode())
+
+    def flush(self):
+        for region in self.regions.values():
+            region.flush()
+
+    def close(self):
+        for region in self.regions.values():
+            region.close()
+        self.regions = {}
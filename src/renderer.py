@@ -0,0 +1,125 @@
+import shutil
+import sys
+from src.chunk import CHUNK_SIZE
+from src.tile import EMPTY_GLYPH, GLYPHS, GLYPH_FLAGS
+
+CSI = '\x1b['
+SAVE_CURSOR = '\x1b7'
+RESTORE_CURSOR = '\x1b8'
+# Lines kept free below the frame for messages, so printing them never scrolls the frame away
+MESSAGE_LINES = 3
+
+
+class Renderer:
+    """Terminal renderer that keeps the previous frame and redraws only what changed.
+
+    The frame is drawn from the top of the screen: header lines first, then one row of
+    cells per grid row, each cell taking two columns. When the view scrolls by one cell
+    the terminal itself shifts the old frame (scroll region for rows, insert/delete
+    characters for columns) so only the newly exposed cells and the cells whose glyph
+    changed are written. Everything for a frame goes out in a single write.
+    """
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.header = None
+        self.frame = None
+        self.origin = None
+        self.status_row = None
+
+    def invalidate(self):
+        """Forget the previous frame so the next draw repaints the whole screen."""
+        self.frame = None
+
+    def build_frame(self, grid, x, y, radius):
+        """Get the glyph rows of the square view of radius around (x, y)."""
+        return [self.build_row(grid, row_x, y - radius, y + radius) for row_x in range(x - radius, x + radius + 1)]
+
+    def build_row(self, grid, x, first_y, last_y):
+        """Get the glyphs from (x, first_y) to (x, last_y), read straight from the chunk arrays."""
+        row = []
+        tile_y = first_y
+        while tile_y <= last_y:
+            chunk = grid.load_chunk((x // CHUNK_SIZE, tile_y // CHUNK_SIZE))
+            segment_end = min(last_y, (tile_y // CHUNK_SIZE + 1) * CHUNK_SIZE - 1)
+            if chunk is None:
+                row.extend([EMPTY_GLYPH] * (segment_end - tile_y + 1))
+            else:
+                start = chunk.index(x, tile_y)
+                stop = start + segment_end - tile_y + 1
+                row.extend(GLYPHS[type_code << 3 | flags & GLYPH_FLAGS] for type_code, flags in zip(chunk.types[start:stop], chunk.flags[start:stop]))
+            tile_y = segment_end + 1
+        return row
+
+    def draw(self, grid, x, y, radius, header):
+        """Draw the header lines and the view around (x, y), writing only the changes."""
+        self.draw_frame(self.build_frame(grid, x, y, radius), (x - radius, y - radius), header)
+
+    def draw_frame(self, frame, origin, header):
+        """Draw the header lines and a frame of glyph rows whose top left cell is at origin."""
+        top = len(header) + 1
+        lines = shutil.get_terminal_size().lines
+        # A frame taller than the terminal scrolls it, so the previous frame is no longer where we left it
+        if (self.frame is None or len(self.frame) != len(frame) or len(self.header) != len(header)
+                or top + len(frame) + MESSAGE_LINES > lines):
+            out = [f'{CSI}H{CSI}2J']
+            out.extend(f'{line}{CSI}K\n' for line in header)
+            out.extend(' '.join(row) + ' \n' for row in frame)
+        else:
+            out = [SAVE_CURSOR]
+            for row, (old, new) in enumerate(zip(self.header, header)):
+                if old != new:
+                    out.append(f'{CSI}{row + 1};1H{new}{CSI}K')
+            out.extend(self.scroll(origin[0] - self.origin[0], origin[1] - self.origin[1], top))
+            out.extend(self.diff(frame, top))
+            out.append(RESTORE_CURSOR)
+        self.out.write(''.join(out))
+        self.out.flush()
+        self.header = list(header)
+        self.frame = frame
+        self.origin = origin
+        self.status_row = top + len(frame)
+
+    def scroll(self, dx, dy, top):
+        """Shift the previous frame on screen and in memory to follow a one-cell move of the view."""
+        frame = self.frame
+        size = len(frame)
+        bottom = top + size - 1
+        blank = [' '] * size
+        if (dx, dy) == (1, 0):
+            frame[:] = frame[1:] + [list(blank)]
+            return [f'{CSI}{top};{bottom}r{CSI}{bottom};1H{CSI}S{CSI}r']
+        if (dx, dy) == (-1, 0):
+            frame[:] = [list(blank)] + frame[:-1]
+            return [f'{CSI}{top};{bottom}r{CSI}{top};1H{CSI}T{CSI}r']
+        if (dx, dy) == (0, 1):
+            for row in frame:
+                row[:] = row[1:] + [' ']
+            return [f'{CSI}{top + i};1H{CSI}2P' for i in range(size)]
+        if (dx, dy) == (0, -1):
+            for row in frame:
+                row[:] = [' '] + row[:-1]
+            # Inserting pushes the last cell past the edge of the view, erase it there
+            return [f'{CSI}{top + i};1H{CSI}2@{CSI}{top + i};{2 * size + 1}H{CSI}K' for i in range(size)]
+        return []
+
+    def diff(self, frame, top):
+        """Yield the escapes that write every cell differing from the previous frame."""
+        for i, (old_row, new_row) in enumerate(zip(self.frame, frame)):
+            j = 0
+            width = len(new_row)
+            while j < width:
+                if old_row[j] == new_row[j]:
+                    j += 1
+                    continue
+                # Write a run of consecutive changed cells after a single cursor move
+                start = j
+                while j < width and old_row[j] != new_row[j]:
+                    j += 1
+                yield f'{CSI}{top + i};{2 * start + 1}H' + ' '.join(new_row[start:j])
+
+    def clear_messages(self):
+        """Erase anything printed below the frame since the last draw and put the cursor there."""
+        if self.frame is None:
+            return
+        self.out.write(f'{CSI}{self.status_row};1H{CSI}J')
+        self.out.flush()
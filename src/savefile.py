@@ -0,0 +1,292 @@
+from array import array
+import io
+from itertools import chain
+import lzma
+import zlib
+from src.chunk import Chunk, CHUNK_SIZE, BOMBED, USED
+from src.grid import Grid
+from src.terrain import generate_chunk
+
+MAGIC = b'SDSV'
+VERSION = 1
+
+class Uncompressed:
+    """Stand-in compressor for saves written without compression."""
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+# Compression code and a factory for a streaming compressor of each compression
+COMPRESSORS = {
+    'none': (0, Uncompressed),
+    'zlib': (1, lambda: zlib.compressobj(6)),
+    'lzma': (2, lzma.LZMACompressor),
+}
+COMPRESSION_NAMES = {code: name for name, (code, _) in COMPRESSORS.items()}
+
+# Saves are written and read in blocks of this many bytes
+BUFFER_SIZE = 1 << 16
+
+# Header flag bits
+LEGACY_TERRAIN = 1
+
+# Chunk record kinds, a full chunk needs no explored mask
+FULL_CHUNK = 0
+MASKED_CHUNK = 1
+
+# Flags worth saving, occupancy is rebuilt from the player position
+SAVED_FLAGS = BOMBED | USED
+SAVED_BITS = bytes(flags & SAVED_FLAGS for flags in range(256))
+
+PLAYER_FIELDS = ('x', 'y', 'bombs', 'max_bombs', 'is_bombing')
+
+CELLS = CHUNK_SIZE * CHUNK_SIZE
+# Largest possible chunk record: kind, mask, cell count, then a varint index delta, type and flags per cell
+MAX_CHUNK_RECORD = 1 + CELLS // 8 + 3 + CELLS * 4
+
+
+def write_varint(out, value):
+    """Append an unsigned LEB128 varint."""
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def write_signed(out, value):
+    """Append a zigzag-encoded signed varint."""
+    write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+class Reader:
+    """Cursor over a bytes buffer for reading varints and raw fields."""
+    def __init__(self, data, position=0):
+        self.data = data
+        self.position = position
+
+    def varint(self):
+        data = self.data
+        result = shift = 0
+        while True:
+            try:
+                byte = data[self.position]
+            except IndexError:
+                raise ValueError("Save data is truncated") from None
+            self.position += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def signed(self):
+        value = self.varint()
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    def take(self, size):
+        start = self.position
+        self.position += size
+        if self.position > len(self.data):
+            raise ValueError("Save data is truncated")
+        return self.data[start:self.position]
+
+
+def encode_header(grid, player, compression):
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    out.append(LEGACY_TERRAIN if grid.legacy else 0)
+    out.append(COMPRESSORS[compression][0])
+    seed = str(grid.seed).encode()
+    write_varint(out, len(seed))
+    out += seed
+    for field in PLAYER_FIELDS:
+        write_signed(out, int(player[field]))
+    return out
+
+
+def encode_chunk(out, chunk, terrain):
+    """Append one chunk: its explored mask and every cell that differs from the seed's terrain."""
+    types, flags = chunk.types, chunk.flags
+    if chunk.count == CELLS:
+        out.append(FULL_CHUNK)
+    else:
+        out.append(MASKED_CHUNK)
+        out += chunk.mask()
+    if chunk.count == CELLS and types == terrain and flags.translate(SAVED_BITS).count(0) == CELLS:
+        # Untouched full chunk, nothing to compare cell by cell
+        modified = []
+    else:
+        modified = [index for index in chunk.indices() if types[index] != terrain[index] or flags[index] & SAVED_FLAGS]
+    write_varint(out, len(modified))
+    previous = 0
+    for index in modified:
+        write_varint(out, index - previous)
+        out.append(types[index])
+        out.append(flags[index] & SAVED_FLAGS)
+        previous = index
+
+
+def encode_stream(grid, player, compression='zlib', progress=None):
+    """Encode a grid and player state as a versioned binary save, yielding it in blocks.
+
+    Only the explored mask and the tiles that no longer match what the seed generates
+    (bombed walls, used shrines, tiles created with an explicit type) are stored, every
+    other tile is regenerated from the seed on load. player maps PLAYER_FIELDS to values.
+    Chunks are encoded and compressed one at a time, so besides the sorted chunk keys the
+    memory used does not grow with the world. progress(done, total) is called per chunk.
+    """
+    if compression not in COMPRESSORS:
+        raise ValueError(f"Invalid compression: {compression}")
+    compressor = COMPRESSORS[compression][1]()
+    out = encode_header(grid, player, compression)
+    keys = sorted(grid.chunk_keys())
+    record = bytearray()
+    write_varint(record, len(keys))
+    previous_cx = previous_cy = 0
+    for done, (cx, cy) in enumerate(keys, 1):
+        write_signed(record, cx - previous_cx)
+        write_signed(record, cy - previous_cy)
+        previous_cx, previous_cy = cx, cy
+        encode_chunk(record, grid.peek_chunk((cx, cy)), generate_chunk(grid.seed, cx, cy, grid.legacy))
+        out += compressor.compress(bytes(record))
+        record.clear()
+        if len(out) >= BUFFER_SIZE:
+            yield bytes(out)
+            out.clear()
+        if progress:
+            progress(done, len(keys))
+    out += compressor.compress(bytes(record))
+    out += compressor.flush()
+    yield bytes(out)
+
+
+def encode(grid, player, compression='zlib'):
+    """Encode a grid and player state as binary save data in memory, see encode_stream."""
+    return b''.join(encode_stream(grid, player, compression))
+
+
+def decode_header(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a binary save")
+    reader = Reader(data, len(MAGIC))
+    version = reader.varint()
+    if version != VERSION:
+        raise ValueError(f"Unsupported save format version {version}")
+    flags = reader.varint()
+    compression = COMPRESSION_NAMES.get(reader.varint())
+    if compression is None:
+        raise ValueError("Unknown save compression")
+    seed = bytes(reader.take(reader.varint())).decode()
+    player = {field: reader.signed() for field in PLAYER_FIELDS}
+    player['is_bombing'] = bool(player['is_bombing'])
+    return seed, bool(flags & LEGACY_TERRAIN), compression, player, reader.position
+
+
+def decode_chunk(reader, grid, cx, cy):
+    chunk = Chunk(cx, cy)
+    terrain = generate_chunk(grid.seed, cx, cy, grid.legacy)
+    if reader.take(1)[0] == FULL_CHUNK:
+        chunk.fill(terrain)
+    else:
+        chunk.fill(terrain, reader.take(CELLS // 8))
+    index = 0
+    for _ in range(reader.varint()):
+        index += reader.varint()
+        if index >= CELLS:
+            raise ValueError("Save data is corrupt: cell index outside its chunk")
+        chunk.types[index], chunk.flags[index] = reader.take(2)
+    chunk.count = CELLS - chunk.types.count(0)
+    if chunk.count == CELLS:
+        chunk.ids = array('I', range(grid.tile_count + 1, grid.tile_count + CELLS + 1))
+        grid.tile_count += CELLS
+        return chunk
+    for index in chunk.indices():
+        grid.tile_count += 1
+        chunk.ids[index] = grid.tile_count
+    return chunk
+
+
+def file_blocks(f):
+    """Yield the rest of a binary file in blocks of BUFFER_SIZE bytes."""
+    return iter(lambda: f.read(BUFFER_SIZE), b'')
+
+
+def decompressed_blocks(blocks, compression):
+    """Decompress a stream of blocks, yielding blocks of at most BUFFER_SIZE bytes."""
+    if compression == 'none':
+        yield from blocks
+    elif compression == 'zlib':
+        decompressor = zlib.decompressobj()
+        for block in blocks:
+            while block:
+                yield decompressor.decompress(block, BUFFER_SIZE)
+                block = decompressor.unconsumed_tail
+        yield decompressor.flush()
+        if not decompressor.eof:
+            raise ValueError("Save data is truncated")
+    else:
+        decompressor = lzma.LZMADecompressor()
+        for block in blocks:
+            yield decompressor.decompress(block, BUFFER_SIZE)
+            while not decompressor.eof and not decompressor.needs_input:
+                yield decompressor.decompress(b'', BUFFER_SIZE)
+        if not decompressor.eof:
+            raise ValueError("Save data is truncated")
+
+
+class StreamReader(Reader):
+    """Reader over a stream of blocks, keeping only what has not been read yet buffered."""
+    def __init__(self, blocks):
+        super().__init__(b'')
+        self.blocks = blocks
+
+    def fill(self, size):
+        """Buffer at least size unread bytes, or whatever is left of the stream."""
+        if len(self.data) - self.position >= size:
+            return
+        data = bytearray(self.data[self.position:])
+        for block in self.blocks:
+            data += block
+            if len(data) >= size:
+                break
+        self.data = data
+        self.position = 0
+
+
+def decode_stream(f, progress=None):
+    """Decode a binary save from a file object into a new Grid and the saved player state.
+
+    The body is decompressed in fixed-size blocks and decoded a chunk at a time. Tile ids
+    are not stored, they are reassigned in chunk order. progress(done, total) is called per chunk.
+    """
+    header = StreamReader(file_blocks(f))
+    # A whole block is read, the header is only a few bytes plus the seed
+    header.fill(BUFFER_SIZE)
+    seed, legacy, compression, player, position = decode_header(header.data)
+    body = chain([header.data[position:]], header.blocks)
+    reader = StreamReader(decompressed_blocks(body, compression))
+    grid = Grid(seed, legacy)
+    grid.chunks.clear()
+    grid.tile_count = 0
+    reader.fill(10)
+    total = reader.varint()
+    cx = cy = 0
+    for done in range(1, total + 1):
+        reader.fill(20 + MAX_CHUNK_RECORD)
+        cx += reader.signed()
+        cy += reader.signed()
+        grid.chunks[(cx, cy)] = decode_chunk(reader, grid, cx, cy)
+        if progress:
+            progress(done, total)
+    tile = grid.get_tile(player['x'], player['y'])
+    if tile is None:
+        raise ValueError("Save places the player outside the explored grid")
+    tile.is_occupied = True
+    return grid, player
+
+
+def decode(data):
+    """Decode binary save data held in memory, see decode_stream."""
+    return decode_stream(io.BytesIO(data))
@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from src.savefile import decode_header
+
+INDEX_FILE = 'index.json'
+EXTENSIONS = {'binary': '.sav', 'legacy': '.txt'}
+
+
+def atomic_write(path, data):
+    """Write bytes to path through a temporary file and a rename, so readers never see a partial file."""
+    atomic_write_blocks(path, [data])
+
+
+def atomic_write_blocks(path, blocks):
+    """Write an iterable of byte blocks to path atomically, see atomic_write. Returns the size written."""
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for block in blocks:
+                f.write(block)
+                size += len(block)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return size
+
+
+class SaveStore:
+    """Directory of save slots, one file per slot plus a small index.
+
+    The index maps each save name to its file, format, seed, size and save time, so
+    listing saves never opens the save files themselves.
+    """
+    def __init__(self, directory='saves'):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        try:
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+
+    def names(self):
+        return list(self.index)
+
+    def __contains__(self, save_name):
+        return save_name in self.index
+
+    def info(self, save_name):
+        """Get the index entry of a save without reading the save itself."""
+        return self.index.get(save_name)
+
+    def file_name(self, save_name, save_format):
+        # Names are free text, keep a readable slug and disambiguate with a hash
+        slug = re.sub(r'[^A-Za-z0-9_-]+', '_', save_name)[:40]
+        digest = hashlib.sha1(save_name.encode()).hexdigest()[:8]
+        return f"{slug}-{digest}{EXTENSIONS[save_format]}"
+
+    def write(self, save_name, data, save_format='binary', seed=None, index=True):
+        """Atomically write one save slot, then the index unless index is False."""
+        self.write_blocks(save_name, [data], save_format, seed, index)
+
+    def write_blocks(self, save_name, blocks, save_format='binary', seed=None, index=True):
+        """Atomically write one save slot from an iterable of byte blocks, then the index unless index is False."""
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = self.file_name(save_name, save_format)
+        size = atomic_write_blocks(os.path.join(self.directory, file_name), blocks)
+        previous = self.index.get(save_name)
+        if previous and previous['file'] != file_name:
+            try:
+                os.unlink(os.path.join(self.directory, previous['file']))
+            except FileNotFoundError:
+                pass
+        self.index[save_name] = {'file': file_name, 'format': save_format, 'seed': seed, 'size': size, 'saved_at': time.time()}
+        if index:
+            self.write_index()
+
+    def write_index(self):
+        atomic_write(self.index_path, json.dumps(self.index, indent=1).encode())
+
+    def read(self, save_name):
+        """Read one save slot, returning its format and raw data."""
+        save_format, f = self.open(save_name)
+        with f:
+            return save_format, f.read()
+
+    def open(self, save_name):
+        """Open one save slot for streaming, returning its format and a binary file object."""
+        entry = self.index.get(save_name)
+        if entry is None:
+            raise ValueError(f"No save found with name {save_name}")
+        return entry['format'], open(os.path.join(self.directory, entry['file']), 'rb')
+
+    def migrate(self, legacy_file='saves.json'):
+        """Move every slot of a single-file saves.json into the store, once.
+
+        The old file is renamed to <legacy_file>.migrated afterwards so it is never imported twice.
+        The index is written once after every slot is in. Returns the number of slots imported,
+        not counting those already in the store.
+        """
+        try:
+            with open(legacy_file, 'r') as f:
+                saves = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        imported = 0
+        for save_name, entry in saves.items():
+            if save_name in self.index:
+                continue
+            if isinstance(entry, dict):
+                data = base64.b64decode(entry['data'])
+                self.write(save_name, data, 'binary', seed=decode_header(data)[0], index=False)
+            else:
+                self.write(save_name, entry.encode(), 'legacy', seed=entry.split('|', 1)[0], index=False)
+            imported += 1
+        if imported:
+            self.write_index()
+        os.replace(legacy_file, legacy_file + '.migrated')
+        return imported
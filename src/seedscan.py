@@ -0,0 +1,215 @@
+"""Scan many seeds for map properties around the origin and keep the best ones.
+
+Each seed's terrain within Manhattan distance radius of (0, 0), the area a game starts in,
+is generated straight from the seed with src.terrain, the rule behind
+Tile.deterministic_tile_type, without building a Grid. Per seed it measures the shrines,
+the wall density and the size of the region reachable from the origin without bombs.
+
+Seeds are scanned in batches on a process pool, with a bounded number of batches in
+flight, and only the top K results are kept, so memory does not grow with the number of
+seeds. Every result can also be streamed to a CSV file.
+
+Run from the repository root with:
+    python -m src.seedscan --random 100000 --radius 32 --by region --top 20
+    python -m src.seedscan --seeds seeds.txt --by walls --ascending --csv results.csv
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import csv
+import heapq
+from itertools import islice
+import os
+import random
+import string
+import sys
+import time
+from src.chunk import TYPE_CODES
+from src.connectivity import WALKABLE
+from src.terrain import generate_types
+
+EMPTY = TYPE_CODES['empty']
+WALL = TYPE_CODES['wall']
+SHRINE = TYPE_CODES['shrine']
+
+METRICS = ('region', 'shrines', 'walls')
+BATCH_SIZE = 64
+SEED_CHARACTERS = string.ascii_letters + string.digits
+
+
+def diamond_types(seed, radius, legacy=False):
+    """Get the type codes around the origin as a square of side 2 * radius + 1, rows along x.
+
+    Only the cells within Manhattan distance radius are generated, a row at a time, the
+    corners are left 0 like cells that do not exist. The origin is empty, as in every game.
+    """
+    side = 2 * radius + 1
+    types = bytearray(side * side)
+    for i in range(side):
+        half = radius - abs(i - radius)
+        start = i * side + radius - half
+        types[start:start + 2 * half + 1] = generate_types(seed, i - radius, -half, 1, 2 * half + 1, legacy)
+    types[radius * side + radius] = EMPTY
+    return types
+
+
+def component_size(cells, side, start):
+    """Count the cells of value 1 connected to start in a side x side grid, clearing them to 0.
+
+    Fills a row span at a time, so the work in Python grows with the number of spans rather than cells.
+    """
+    if cells[start] != 1:
+        return 0
+    size = 0
+    total = len(cells)
+    stack = [start]
+    while stack:
+        index = stack.pop()
+        if not cells[index]:
+            continue
+        row_start = index - index % side
+        left = cells.rfind(0, row_start, index)
+        left = row_start if left < 0 else left + 1
+        right = cells.find(0, index, row_start + side)
+        right = row_start + side if right < 0 else right
+        cells[left:right] = bytes(right - left)
+        size += right - left
+        # Push the first cell of every open run touching the span in the rows above and below
+        for first in (left - side, left + side):
+            if first < 0 or first >= total:
+                continue
+            last = first + right - left
+            position = cells.find(1, first, last)
+            while position >= 0:
+                stack.append(position)
+                position = cells.find(0, position, last)
+                if position < 0:
+                    break
+                position = cells.find(1, position, last)
+    return size
+
+
+def scan_seed(seed, radius, legacy=False):
+    """Get (seed, shrines, wall density, region size) for the diamond of radius around the origin."""
+    side = 2 * radius + 1
+    types = diamond_types(seed, radius, legacy)
+    cells = 2 * radius * radius + 2 * radius + 1
+    region = component_size(types.translate(WALKABLE), side, radius * side + radius)
+    return seed, types.count(SHRINE), types.count(WALL) / cells, region
+
+
+def scan_batch(seeds, radius, legacy=False):
+    """Scan a batch of seeds, module-level so a process pool can run it."""
+    return [scan_seed(seed, radius, legacy) for seed in seeds]
+
+
+def random_seeds(count, seed=None):
+    """Yield count random seeds like the game picks, 8 letters and digits each."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choices(SEED_CHARACTERS, k=8))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def scan(seeds, radius, workers=None, legacy=False, batch_size=BATCH_SIZE):
+    """Yield the result of every seed of an iterable, see scan_seed, in no particular order.
+
+    workers=1 scans in this process, otherwise batches run on a pool of that many processes
+    (one per core by default) with at most a few batches per process queued at a time.
+    """
+    batches = batched(seeds, batch_size)
+    if workers == 1:
+        for batch in batches:
+            yield from scan_batch(batch, radius, legacy)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        limit = 4 * (workers or os.cpu_count() or 1)
+        pending = set()
+        for batch in batches:
+            pending.add(pool.submit(scan_batch, batch, radius, legacy))
+            if len(pending) >= limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        for future in pending:
+            yield from future.result()
+
+
+def top_results(results, k, metric='region', ascending=False, each=None):
+    """Keep the k best results of a stream by metric, best first, calling each(result) on every result."""
+    column = {'shrines': 1, 'walls': 2, 'region': 3}[metric]
+    sign = -1 if ascending else 1
+    heap = []
+    for result in results:
+        if each:
+            each(result)
+        # Ties are broken by the seed, so the same seeds always give the same top k
+        entry = (sign * result[column], result[0], result)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return [result for *_, result in sorted(heap, reverse=True)]
+
+
+def read_seeds(path):
+    """Yield the seeds of a file, one per line, - for stdin."""
+    f = sys.stdin if path == '-' else open(path)
+    try:
+        for line in f:
+            if line.strip():
+                yield line.strip()
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m src.seedscan', description="Scan seeds for map properties around the origin.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--random', type=int, metavar='COUNT', help="scan this many random seeds")
+    source.add_argument('--seeds', metavar='FILE', help="scan the seeds of a file, one per line, - for stdin")
+    parser.add_argument('--random-seed', help="seed for --random, to scan the same seeds again")
+    parser.add_argument('--radius', type=int, default=32, help="Manhattan radius around the origin to measure")
+    parser.add_argument('--by', choices=METRICS, default='region', help="metric to rank seeds by")
+    parser.add_argument('--ascending', action='store_true', help="keep the lowest values instead of the highest")
+    parser.add_argument('--top', type=int, default=10, help="number of seeds to keep")
+    parser.add_argument('--workers', type=int, help="processes to scan with, one per core by default")
+    parser.add_argument('--legacy', action='store_true', help="use the legacy terrain generator")
+    parser.add_argument('--csv', metavar='PATH', help="also write every result to this CSV file as it comes")
+    args = parser.parse_args(argv)
+
+    seeds = random_seeds(args.random, args.random_seed) if args.random is not None else read_seeds(args.seeds)
+    csv_file = open(args.csv, 'w', newline='') if args.csv else None
+    writer = csv.writer(csv_file) if csv_file else None
+    scanned = [0]
+    start = time.perf_counter()
+
+    def each(result):
+        scanned[0] += 1
+        if writer:
+            writer.writerow((result[0], result[1], f'{result[2]:.4f}', result[3]))
+        if scanned[0] % 10000 == 0:
+            elapsed = time.perf_counter() - start
+            print(f"\rScanned {scanned[0]:,} seeds ({scanned[0] / elapsed:,.0f}/s)", end='', file=sys.stderr, flush=True)
+
+    try:
+        if writer:
+            writer.writerow(('seed', 'shrines', 'wall_density', 'region'))
+        best = top_results(scan(seeds, args.radius, args.workers, args.legacy), args.top, args.by, args.ascending, each)
+    finally:
+        if csv_file:
+            csv_file.close()
+    elapsed = time.perf_counter() - start
+    print(f"\rScanned {scanned[0]:,} seeds at radius {args.radius} in {elapsed:.1f}s ({scanned[0] / elapsed if elapsed else 0:,.0f} seeds/s)", file=sys.stderr)
+    print(f"{'seed':<12} {'shrines':>8} {'walls':>7} {'region':>8}")
+    for seed, shrines, density, region in best:
+        print(f"{seed:<12} {shrines:>8} {density:>7.1%} {region:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""World server: many players in one shared world per seed, over a line-based socket protocol.
+
+Each connection is a session with its own Controller, so position, bombs and bombing state
+are per player, while the Grid, and with it every generated chunk, is shared by all sessions
+on the same seed. All sessions run as coroutines on one event loop and the grid is only ever
+touched from that loop's thread, which is what keeps the shared world consistent without locks.
+
+Protocol, one request line and one reply line at a time:
+    join <seed> [gen_range] [legacy]  ->  ok <x> <y> <bombs>
+    <actions>                         ->  <status codes> <x> <y> <bombs>
+    view <radius>                     ->  rows of the view joined by '/'
+    quit
+Actions are the keys of src.simulate (w/a/s/d/q/e), several can be sent on one line and get
+one status digit each. Errors are replied as 'error <message>'.
+
+Run from the repository root with:
+    python -m src.server serve --port 7777
+    python -m src.server loadtest --bots 50 --steps 1000
+"""
+import argparse
+import asyncio
+from collections import Counter
+import random
+import time
+from src.chunk import CHUNK_SIZE
+from src.controller import Controller
+from src.grid import Grid
+from src.simulate import simulate, ACTIONS
+
+# View characters per type code, '?' for cells not generated yet
+VIEW_CHARS = '?.#*'
+PLAYER_CHAR = '@'
+
+
+class WorldServer:
+    """Serves sessions, one shared Grid per (seed, legacy) and one Controller per player."""
+    def __init__(self, cache_chunks=None):
+        self.cache_chunks = cache_chunks
+        self.worlds = {}
+        # Players standing on each cell of each world, so one leaving does not clear another's occupancy
+        self.positions = {}
+        self.sessions = 0
+        self.steps = 0
+
+    def world(self, seed, legacy):
+        key = (seed, legacy)
+        if key not in self.worlds:
+            self.worlds[key] = Grid(seed, legacy, max_chunks=self.cache_chunks)
+            self.positions[key] = Counter()
+        return key, self.worlds[key]
+
+    def join(self, seed, gen_range=1, legacy=False):
+        """Create a player in the world of seed, returning its world key and controller."""
+        key, grid = self.world(seed, legacy)
+        cont = Controller(gen_range, gen_range, seed, legacy, grid=grid)
+        cont.server_position = (cont.x, cont.y)
+        self.positions[key][cont.server_position] += 1
+        self.sessions += 1
+        return key, cont
+
+    def leave(self, key, cont):
+        self.move_player(key, cont, None)
+        self.sessions -= 1
+
+    def move_player(self, key, cont, position):
+        """Update the player counts after cont moved from its old position to position (None when leaving)."""
+        positions = self.positions[key]
+        old = cont.server_position
+        positions[old] -= 1
+        if positions[old] <= 0:
+            del positions[old]
+            cont.grid.get_tile(*old).is_occupied = False
+        else:
+            # The controller cleared it on leaving, but someone else is still standing there
+            cont.grid.get_tile(*old).is_occupied = True
+        if position is not None:
+            positions[position] += 1
+            cont.server_position = position
+
+    def act(self, key, cont, actions):
+        """Apply a line of actions for one player, returning the reply line."""
+        statuses = bytearray()
+        # One action at a time, every cell left has to be checked for other players standing on it
+        for action in actions.encode():
+            statuses += simulate(cont, bytes((action,)))
+            if (cont.x, cont.y) != cont.server_position:
+                self.move_player(key, cont, (cont.x, cont.y))
+        self.steps += len(statuses)
+        return f"{''.join(map(str, statuses))} {cont.x} {cont.y} {cont.bombs}"
+
+    def view(self, key, cont, radius):
+        """Render the square view around a player as rows of VIEW_CHARS."""
+        grid = cont.grid
+        positions = self.positions[key]
+        rows = []
+        for x in range(cont.x - radius, cont.x + radius + 1):
+            row = []
+            for y in range(cont.y - radius, cont.y + radius + 1):
+                chunk = grid.load_chunk((x // CHUNK_SIZE, y // CHUNK_SIZE))
+                if (x, y) in positions:
+                    row.append(PLAYER_CHAR)
+                elif chunk is None:
+                    row.append(VIEW_CHARS[0])
+                else:
+                    row.append(VIEW_CHARS[chunk.types[chunk.index(x, y)]])
+            rows.append(''.join(row))
+        return '/'.join(rows)
+
+    async def handle(self, reader, writer):
+        """Serve one connection until it quits or disconnects."""
+        session = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode().split()
+                if not words:
+                    continue
+                try:
+                    if words[0] == 'quit':
+                        break
+                    if words[0] == 'join':
+                        if session:
+                            self.leave(*session)
+                        gen_range = int(words[2]) if len(words) > 2 else 1
+                        legacy = len(words) > 3 and words[3] == 'legacy'
+                        session = self.join(words[1], max(1, gen_range), legacy)
+                        reply = f"ok {session[1].x} {session[1].y} {session[1].bombs}"
+                    elif session is None:
+                        reply = "error join a world first"
+                    elif words[0] == 'view':
+                        reply = self.view(*session, min(int(words[1]), 64) if len(words) > 1 else 5)
+                    else:
+                        reply = self.act(*session, ''.join(words))
+                except (ValueError, IndexError) as error:
+                    reply = f"error {error}"
+                writer.write(reply.encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if session:
+                self.leave(*session)
+            writer.close()
+
+
+async def serve(host='127.0.0.1', port=7777, unix=None, cache_chunks=None):
+    server = WorldServer(cache_chunks)
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle, unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving on {unix or f'{host}:{port}'}")
+    async with listener:
+        await listener.serve_forever()
+
+
+async def bot(host, port, seed, steps, gen_range, latencies, rng):
+    """One simulated player sending single random actions and timing each reply."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"join {seed} {gen_range}\n".encode())
+    await writer.drain()
+    await reader.readline()
+    for action in rng.choices(ACTIONS.decode(), (6, 6, 6, 6, 1, 1), k=steps):
+        start = time.perf_counter()
+        writer.write(action.encode() + b'\n')
+        await writer.drain()
+        reply = await reader.readline()
+        latencies.append(time.perf_counter() - start)
+        if reply.startswith(b'error'):
+            raise RuntimeError(reply.decode())
+    writer.write(b'quit\n')
+    await writer.drain()
+    writer.close()
+
+
+async def load_test(bots=50, steps=1000, seed='loadtest', gen_range=5, host=None, port=None):
+    """Run bots against a server, starting one in this process unless host and port are given.
+
+    Returns (moves per second, p50 latency, p99 latency), latencies in seconds.
+    """
+    listener = None
+    if host is None:
+        server = WorldServer()
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        host, port = listener.sockets[0].getsockname()[:2]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(bot(host, port, seed, steps, gen_range, latencies, random.Random(i)) for i in range(bots)))
+    elapsed = time.perf_counter() - start
+    if listener:
+        listener.close()
+        await listener.wait_closed()
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m src.server', description="Shared world server and its load test.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="run the server")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=7777)
+    serve_parser.add_argument('--unix', help="listen on this unix socket path instead of TCP")
+    serve_parser.add_argument('--cache-chunks', type=int, help="bound the chunks each world keeps in memory")
+    test_parser = commands.add_parser('loadtest', help="measure throughput and latency with simulated players")
+    test_parser.add_argument('--bots', type=int, default=50)
+    test_parser.add_argument('--steps', type=int, default=1000, help="actions per bot")
+    test_parser.add_argument('--gen-range', type=int, default=5)
+    test_parser.add_argument('--seed', default='loadtest')
+    test_parser.add_argument('--connect', metavar='HOST:PORT', help="test a running server instead of an in-process one")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        asyncio.run(serve(args.host, args.port, args.unix, args.cache_chunks))
+        return
+    host = port = None
+    if args.connect:
+        host, port = args.connect.rsplit(':', 1)
+        port = int(port)
+    rate, p50, p99 = asyncio.run(load_test(args.bots, args.steps, args.seed, args.gen_range, host, port))
+    print(f"{args.bots} bots x {args.steps} steps: {rate:,.0f} moves/s, p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
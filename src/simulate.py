@@ -0,0 +1,290 @@
+"""Headless simulation: apply scripted actions to a Controller without rendering.
+
+A script is a string of the same keys the game uses, w/a/s/d to move, q to toggle the
+bomb and e to interact, whitespace ignored. Each action yields one status code.
+
+Plain moves onto open cells take a lean path that works on the chunk arrays directly and
+creates the leading edge from each chunk's batch-generated terrain, skipping the Tile views
+and method calls of Controller.try_move. Everything else (bombing a wall, interacting, the
+first move after the range changed) goes through the controller, and grids that page chunks
+in and out, journaled games and instrumented runs always do, so the results are the same.
+
+Run a script against a seed from the repository root with:
+    python -m src.simulate SEED script.txt
+    python -m src.simulate SEED --random 1000000
+"""
+import argparse
+from collections import Counter
+import random
+import sys
+import time
+from src.chunk import CHUNK_SIZE, OCCUPIED, USED, BOMBED as BOMBED_FLAG
+from src.controller import Controller, MOVED, BLOCKED, OUT_OF_RANGE
+from src.grid import WALL, SHRINE
+from src.instrument import instrumentation
+
+# Outcomes of the other actions, following the try_move ones
+INTERACTED = 4
+NOTHING_TO_INTERACT = 5
+ARMED = 6
+DISARMED = 7
+NO_BOMBS = 8
+INVALID = 9
+STATUS_NAMES = ['moved', 'bombed', 'blocked', 'out_of_range', 'interacted', 'nothing_to_interact', 'armed', 'disarmed', 'no_bombs', 'invalid']
+
+ACTION_STEPS = {ord('w'): (-1, 0), ord('a'): (0, -1), ord('s'): (1, 0), ord('d'): (0, 1)}
+BOMB = ord('q')
+INTERACT = ord('e')
+WHITESPACE = frozenset(b' \t\r\n')
+ACTIONS = b'wasdqe'
+
+# Chunk coordinates and array indices by shifting and masking, CHUNK_SIZE is a power of two
+SHIFT = CHUNK_SIZE.bit_length() - 1
+MASK = CHUNK_SIZE - 1
+CELLS = CHUNK_SIZE * CHUNK_SIZE
+
+
+def toggle_bomb(cont):
+    if cont.bombs <= 0:
+        return NO_BOMBS
+    cont.set_bombing(not cont.is_bombing)
+    return ARMED if cont.is_bombing else DISARMED
+
+
+def interact(cont):
+    if not cont.current_tile.can_interact:
+        return NOTHING_TO_INTERACT
+    cont.interact()
+    return INTERACTED
+
+
+def simulate(cont, script):
+    """Apply every action of script (str or bytes) to cont, returning a bytearray of status codes."""
+    if isinstance(script, str):
+        script = script.encode()
+    if lean_path_applies(cont):
+        return step_lean(cont, script)
+    return step_actions(cont, script)
+
+
+def lean_path_applies(cont):
+    """Check that nothing but the chunk arrays has to see the moves of cont, see step_lean."""
+    grid = cont.grid
+    return cont.journal is None and not instrumentation.enabled and grid.store is None and not grid.max_chunks and cont.gen_range >= 1
+
+
+def leading_edges(gen_range):
+    """Get the offsets of the leading edge cells per step, in the order generate_leading_edge creates them."""
+    edges = {}
+    for dx, dy in ACTION_STEPS.values():
+        offsets = []
+        for forward in range(gen_range + 1):
+            side = gen_range - forward
+            for offset in ((-side, side) if side else (0,)):
+                offsets.append((dx * forward + dy * offset, dy * forward + dx * offset))
+        edges[(dx, dy)] = offsets
+    return edges
+
+
+def step_actions(cont, script):
+    """Apply the actions of a bytes script one by one through the controller's methods."""
+    statuses = bytearray(len(script))
+    # Bound once, the loop runs per action
+    try_move = cont.try_move
+    steps = ACTION_STEPS.get
+    count = 0
+    for action in script:
+        step = steps(action)
+        if step is not None:
+            status = try_move(*step)
+        elif action == BOMB:
+            status = toggle_bomb(cont)
+        elif action == INTERACT:
+            status = interact(cont)
+        elif action in WHITESPACE:
+            continue
+        else:
+            status = INVALID
+        statuses[count] = status
+        count += 1
+    del statuses[count:]
+    return statuses
+
+
+def step_lean(cont, script):
+    """Apply the actions of a bytes script, moving onto open cells without going through try_move.
+
+    Only for grids whose chunks stay in memory, see lean_path_applies. The player's position
+    and chunk are kept in locals and written back to cont before anything else reads them.
+    """
+    grid = cont.grid
+    chunks = grid.chunks
+    gen_range = cont.gen_range
+    # Per action byte, None or (dx, dy, leading edge cells, the same as index offsets for
+    # positions whose whole edge lies in their own chunk)
+    moves = [None] * 256
+    edges = leading_edges(gen_range)
+    for action, (dx, dy) in ACTION_STEPS.items():
+        edge = edges[(dx, dy)]
+        moves[action] = (dx, dy, edge, [(offset_x << SHIFT) + offset_y for offset_x, offset_y in edge])
+    inner = range(gen_range, CHUNK_SIZE - gen_range)
+    statuses = bytearray(len(script))
+    count = 0
+    moved = False
+
+    def create(chunk, index):
+        """What create_tile does, from the chunk's terrain generated in one batch."""
+        terrain = chunk.terrain or grid.terrain(chunk)
+        grid.tile_count += 1
+        chunk.types[index] = terrain[index]
+        chunk.ids[index] = grid.tile_count
+        chunk.count += 1
+        if chunk.count == CELLS:
+            chunk.terrain = None
+        for changed in grid.change_sets:
+            changed.add((chunk.cx, chunk.cy))
+
+    x = y = None
+    for action in script:
+        if x is None:
+            # (Re)load the player's state from cont
+            x, y = cont.x, cont.y
+            chunk_x, chunk_y = x >> SHIFT, y >> SHIFT
+            chunk = chunks[(chunk_x, chunk_y)]
+            bombing = cont.is_bombing
+            generated = cont.generated
+            # A lean move only adds the leading edge, the range around the player must be complete
+            lean = generated is not None and generated[:2] == (x, y) and generated[2] >= gen_range
+        move = moves[action]
+        if move is not None:
+            dx, dy, edge_cells, edge_offsets = move
+            next_x, next_y = x + dx, y + dy
+            if next_x >> SHIFT == chunk_x and next_y >> SHIFT == chunk_y:
+                target = chunk
+            else:
+                target = chunks.get((next_x >> SHIFT, next_y >> SHIFT))
+            index = (next_x & MASK) << SHIFT | next_y & MASK
+            cell = target.types[index] if target is not None else 0
+            if not cell:
+                statuses[count] = OUT_OF_RANGE
+                count += 1
+                continue
+            if cell == WALL and not target.flags[index] & BOMBED_FLAG:
+                if not bombing:
+                    statuses[count] = BLOCKED
+                    count += 1
+                    continue
+                lean = False
+            if lean:
+                chunk.flags[(x & MASK) << SHIFT | y & MASK] &= ~OCCUPIED
+                target.flags[index] |= OCCUPIED
+                x, y = next_x, next_y
+                if target is not chunk:
+                    chunk = target
+                    chunk_x, chunk_y = chunk.cx, chunk.cy
+                moved = True
+                bombing = False
+                if (x & MASK) in inner and (y & MASK) in inner:
+                    if chunk.count != CELLS:
+                        types = chunk.types
+                        for offset in edge_offsets:
+                            if not types[index + offset]:
+                                create(chunk, index + offset)
+                else:
+                    for offset_x, offset_y in edge_cells:
+                        edge_x, edge_y = x + offset_x, y + offset_y
+                        if edge_x >> SHIFT == chunk_x and edge_y >> SHIFT == chunk_y:
+                            edge = chunk
+                        else:
+                            edge = chunks.get((edge_x >> SHIFT, edge_y >> SHIFT))
+                        if edge is None:
+                            grid.create_tile(edge_x, edge_y)
+                        elif not edge.types[(edge_x & MASK) << SHIFT | edge_y & MASK]:
+                            create(edge, (edge_x & MASK) << SHIFT | edge_y & MASK)
+                statuses[count] = MOVED
+                count += 1
+                continue
+        elif action == BOMB:
+            if cont.bombs <= 0:
+                statuses[count] = NO_BOMBS
+            else:
+                bombing = not bombing
+                statuses[count] = ARMED if bombing else DISARMED
+            count += 1
+            continue
+        elif action == INTERACT:
+            index = (x & MASK) << SHIFT | y & MASK
+            if chunk.types[index] != SHRINE or chunk.flags[index] & USED:
+                statuses[count] = NOTHING_TO_INTERACT
+                count += 1
+                continue
+        elif action in WHITESPACE:
+            continue
+        # Anything else runs through the controller, with the state written back first and read again after
+        if moved:
+            cont.x, cont.y = x, y
+            cont.generated = (x, y, gen_range)
+            cont.saved = False
+            moved = False
+        cont.is_bombing = bombing
+        statuses[count] = step_actions(cont, bytes((action,)))[0]
+        count += 1
+        x = None
+    if moved:
+        cont.x, cont.y = x, y
+        cont.generated = (x, y, gen_range)
+        cont.saved = False
+    if x is not None:
+        cont.is_bombing = bombing
+    del statuses[count:]
+    return statuses
+
+
+def summarize(statuses):
+    """Count the status codes of a simulation by name."""
+    counts = Counter(statuses)
+    return {STATUS_NAMES[code]: counts[code] for code in sorted(counts)}
+
+
+def random_script(length, seed=None, weights=(6, 6, 6, 6, 1, 1)):
+    """Generate a random script of length actions, moves weighted far above q and e by default."""
+    return bytes(random.Random(seed).choices(ACTIONS, weights, k=length))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m src.simulate', description="Run a move script against a seed without rendering.")
+    parser.add_argument('seed')
+    parser.add_argument('script', nargs='?', help="script file of w/a/s/d/q/e actions, - for stdin")
+    parser.add_argument('--random', type=int, metavar='STEPS', help="run a random script of STEPS actions instead")
+    parser.add_argument('--random-seed', help="seed for --random")
+    parser.add_argument('--gen-range', type=int, default=1)
+    parser.add_argument('--legacy', action='store_true', help="use the legacy terrain generator")
+    parser.add_argument('--repeat', type=int, default=1, help="run the script this many times in a row")
+    args = parser.parse_args(argv)
+
+    if args.random is not None:
+        script = random_script(args.random, args.random_seed)
+    elif args.script == '-':
+        script = sys.stdin.buffer.read()
+    elif args.script:
+        with open(args.script, 'rb') as f:
+            script = f.read()
+    else:
+        parser.error("a script file or --random is required")
+
+    cont = Controller(args.gen_range, args.gen_range, args.seed, args.legacy)
+    statuses = bytearray()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        statuses += simulate(cont, script)
+    elapsed = time.perf_counter() - start
+
+    print(f"Steps: {len(statuses)} in {elapsed:.3f}s ({len(statuses) / elapsed if elapsed else 0:,.0f} steps/s)")
+    for name, count in summarize(statuses).items():
+        print(f"  {name}: {count}")
+    print(f"Final position: X: {cont.x} | Y: {cont.y} | Bombs: {cont.bombs}")
+    print(f"Tiles generated: {len(cont.grid)} in {len(cont.grid.chunks)} chunks")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import hashlib
+import random
+from bisect import bisect
+from itertools import accumulate
+from src.chunk import CHUNK_SIZE, TYPE_CODES
+from src.tile import TYPES
+
+MASK64 = (1 << 64) - 1
+MASK32 = (1 << 32) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+
+# Tile type codes and cumulative weights in TYPES order, shared by both generators
+CODES = [TYPE_CODES[name] for name in TYPES]
+CUM_WEIGHTS = list(accumulate(tile_type.weight for tile_type in TYPES.values()))
+# Same cumulative weights scaled to the 32-bit range of a hashed cell value
+THRESHOLDS = [int(w / CUM_WEIGHTS[-1] * (1 << 32)) for w in CUM_WEIGHTS[:-1]]
+
+
+def seed_key(seed):
+    """Hash a seed string into a 64-bit key, stable across runs and processes."""
+    return int.from_bytes(hashlib.blake2b(str(seed).encode(), digest_size=8).digest(), 'little')
+
+
+def generate_types(seed, x0, y0, width, height, legacy=False):
+    """Generate the type codes of a width x height rectangle with its corner at (x0, y0).
+
+    Returns a bytearray laid out row by row along x, the same layout as Chunk.types.
+    The hashed generator mixes a seed key with each coordinate through a splitmix64
+    finaliser and never touches the global random state. With legacy=True every cell
+    reproduces Tile.deterministic_tile_type from before chunked generation, using a
+    private Random instance instead of reseeding the module one.
+    """
+    if legacy:
+        return _generate_legacy(seed, x0, y0, width, height)
+    key = seed_key(seed)
+    codes, thresholds = CODES, THRESHOLDS
+    ys = [(y & MASK32) for y in range(y0, y0 + height)]
+    out = bytearray()
+    for x in range(x0, x0 + width):
+        row = key + ((x & MASK32) << 32)
+        hashed = [((row + y) * GOLDEN) & MASK64 for y in ys]
+        hashed = [(z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & MASK64 for z in hashed]
+        hashed = [(z ^ (z >> 27)) * 0x94D049BB133111EB & MASK64 for z in hashed]
+        out.extend(codes[bisect(thresholds, (z ^ (z >> 31)) >> 32)] for z in hashed)
+    return out
+
+
+def _generate_legacy(seed, x0, y0, width, height):
+    rng = random.Random()
+    codes, cum_weights, total = CODES, CUM_WEIGHTS, CUM_WEIGHTS[-1]
+    out = bytearray()
+    for x in range(x0, x0 + width):
+        for y in range(y0, y0 + height):
+            rng.seed(f'{x},{y},{seed}')
+            out.append(codes[bisect(cum_weights, rng.random() * total, 0, len(cum_weights) - 1)])
+    return out
+
+
+def generate_chunk(seed, cx, cy, legacy=False):
+    """Generate the type codes of every cell in chunk (cx, cy)."""
+    return generate_types(seed, cx * CHUNK_SIZE, cy * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE, legacy)
+
+
+def generate_chunks(seed, keys, legacy=False):
+    """Generate the type codes of several chunks, one bytearray per (cx, cy) key.
+
+    Module-level so a process pool can run it on a batch of chunks per task.
+    """
+    return [generate_chunk(seed, cx, cy, legacy) for cx, cy in keys]
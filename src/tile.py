@@ -1,37 +1,148 @@
 import random
+from collections import namedtuple
 from colorama import Fore, Style
+from src.chunk import TYPE_NAMES, TYPE_CODES, OCCUPIED, BOMBED, USED
+
+TileType = namedtuple('TileType', ['name', 'weight', 'icon', 'color', 'has_collision', 'can_interact'])
+
+# Metadata shared by every tile of a type, per-tile differences live in the chunk flags
+TYPES = {
+    'empty': TileType('empty', .75, '🞑', Fore.GREEN, False, False),
+    'wall': TileType('wall', .2, '◼', Fore.RED, True, False),
+    'shrine': TileType('shrine', .05, '🞖', Fore.YELLOW, False, True),
+}
+# TYPES indexed by the type codes stored in Chunk.types
+TYPES_BY_CODE = [TYPES.get(name) for name in TYPE_NAMES]
+
+# State bits that change how a tile is drawn, the low bits of Chunk.flags
+GLYPH_FLAGS = OCCUPIED | BOMBED | USED
+
+
+def render_glyph(tile_type, occupied, can_interact, bombed):
+    """Render the colored glyph of a tile in the given state."""
+    if tile_type is None:
+        return f'{Fore.BLACK}▨{Style.RESET_ALL}'
+    icon, color = TYPES[tile_type].icon, TYPES[tile_type].color
+    if bombed:
+        icon, color = '🞑', Fore.LIGHTGREEN_EX
+    if tile_type == 'shrine':
+        icon = '🞖' if can_interact else '🞔'
+        if not can_interact:
+            color = Fore.BLACK
+    if occupied:
+        color = Fore.CYAN
+        if tile_type == 'shrine':
+            icon = '🞛' if can_interact else '🞜'
+        else:
+            icon = '🞚'
+    return color + icon + Style.RESET_ALL
+
+
+def _render_glyphs():
+    glyphs = []
+    for tile_type in TYPE_NAMES:
+        for flags in range(GLYPH_FLAGS + 1):
+            can_interact = bool(tile_type and TYPES[tile_type].can_interact and not flags & USED)
+            glyphs.append(render_glyph(tile_type, bool(flags & OCCUPIED), can_interact, bool(flags & BOMBED)))
+    return glyphs
+
+
+# Every glyph rendered up front, indexed by type code << 3 | (flags & GLYPH_FLAGS).
+# Type code 0 is a cell that does not exist yet.
+GLYPHS = _render_glyphs()
+EMPTY_GLYPH = GLYPHS[0]
+
 
 class Tile:
-    """Tile in the grid with x, y coordinates and a unique id."""
-    def __init__(self, x, y, tile_id,seed, type=None):
+    """Tile in the grid with x, y coordinates and a unique id.
+
+    A tile is a view onto one cell of a Chunk, reads and writes go straight to the chunk arrays.
+    Type metadata comes from the shared TYPES table and per-tile state from the chunk flags.
+    """
+    __slots__ = ('chunk', 'index', 'x', 'y')
+
+    def __init__(self, chunk, x, y):
+        self.chunk = chunk
+        self.index = chunk.index(x, y)
         self.x = x
         self.y = y
-        self.tile_id = tile_id
-        # Use a hash function to generate a consistent value based on coordinates and seed
-        self.seed = f'{x},{y},{seed}'
-        self.is_occupied = False
-        self.can_interact = False
-        self.tile_type = None
-        self.set_type(type)
 
-    def set_type(self, tile_type):
-        types = {
-            'empty': [.75, '🞑', Fore.GREEN, False, False],
-            'wall': [.2, '◼', Fore.RED, True, False],
-            'shrine': [.05, '🞖', Fore.YELLOW, False, True],
-        }
-        tile_type = tile_type or self.deterministic_tile_type(types)
-        if tile_type in types:
-            self.tile_type = tile_type
-            self.icon, self.color, self.has_collision, self.can_interact = types[tile_type][1:]
+    def __eq__(self, other):
+        return isinstance(other, Tile) and self.chunk is other.chunk and self.index == other.index
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def _get_flag(self, flag):
+        return bool(self.chunk.flags[self.index] & flag)
+
+    def _set_flag(self, flag, value):
+        if value:
+            self.chunk.flags[self.index] |= flag
         else:
+            self.chunk.flags[self.index] &= ~flag
+
+    @property
+    def tile_id(self):
+        return self.chunk.ids[self.index]
+
+    @property
+    def tile_type(self):
+        return TYPE_NAMES[self.chunk.types[self.index]]
+
+    @property
+    def kind(self):
+        """The shared TileType metadata of this tile."""
+        return TYPES_BY_CODE[self.chunk.types[self.index]]
+
+    @property
+    def is_occupied(self):
+        return self._get_flag(OCCUPIED)
+
+    @is_occupied.setter
+    def is_occupied(self, value):
+        self._set_flag(OCCUPIED, value)
+
+    @property
+    def has_collision(self):
+        return self.kind.has_collision and not self._get_flag(BOMBED)
+
+    @has_collision.setter
+    def has_collision(self, value):
+        self._set_flag(BOMBED, self.kind.has_collision and not value)
+
+    @property
+    def can_interact(self):
+        return self.kind.can_interact and not self._get_flag(USED)
+
+    @can_interact.setter
+    def can_interact(self, value):
+        self._set_flag(USED, self.kind.can_interact and not value)
+
+    @property
+    def icon(self):
+        if self._get_flag(BOMBED):
+            return '🞑'
+        return self.kind.icon
+
+    @property
+    def color(self):
+        if self._get_flag(BOMBED):
+            return Fore.LIGHTGREEN_EX
+        if self._get_flag(USED):
+            return Fore.BLACK
+        return self.kind.color
+
+    def set_type(self, tile_type):
+        if tile_type not in TYPES:
             raise ValueError(f"Invalid tile type: {tile_type}")
+        self.chunk.types[self.index] = TYPE_CODES[tile_type]
 
-    def deterministic_tile_type(self, types):
+    @staticmethod
+    def deterministic_tile_type(x, y, seed, legacy=False):
         """Deterministically assign tile type based on coordinates and seed."""
-        random.seed(self.seed)
-        # Select the tile type based on the hash value
-        return random.choices(list(types.keys()), weights=[w[0] for w in types.values()])[0]
+        from src.terrain import generate_types
+        return TYPE_NAMES[generate_types(seed, x, y, 1, 1, legacy)[0]]
 
     def interact(self):
         """Interact with the tile."""
@@ -39,16 +150,7 @@ class Tile:
             raise ValueError(f'{self.tile_id} at ({self.x}, {self.y}) cannot be interacted with')
         if self.tile_type == 'shrine':
             self.can_interact = False
-            self.color = Fore.BLACK
             return random.choice(['You feel a strange power ...', 'You feel a strange presence ...', 'You feel a strange energy ...'])
 
     def __str__(self):
-        icon = self.icon
-        if self.is_occupied:
-            icon = '🞚'
-        if self.tile_type == "shrine":
-            icon = '🞖' if self.can_interact else '🞔'
-            if self.is_occupied:
-                icon = '🞛' if self.can_interact else '🞜'
-        color = Fore.CYAN if self.is_occupied else self.color
-        return color+icon+Style.RESET_ALL
+        return GLYPHS[self.chunk.types[self.index] << 3 | self.chunk.flags[self.index] & GLYPH_FLAGS]
@@ -0,0 +1,53 @@
+from collections import deque
+from src.chunk import BOMBED
+from src.controller import Controller
+from src.grid import WALL
+from src.simulate import simulate, random_script
+
+
+def walkable(grid):
+    """Every generated cell that can be walked on without bombs."""
+    cells = set()
+    for chunk in grid.chunks.values():
+        for index in chunk.indices():
+            if chunk.types[index] != WALL or chunk.flags[index] & BOMBED:
+                cells.add(chunk.coords(index))
+    return cells
+
+
+def regions(cells):
+    """Label the connected regions of a set of cells by BFS, cell to region number."""
+    labels = {}
+    for start in cells:
+        if start in labels:
+            continue
+        labels[start] = start
+        queue = deque([start])
+        while queue:
+            x, y = queue.popleft()
+            for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if cell in cells and cell not in labels:
+                    labels[cell] = start
+                    queue.append(cell)
+    return labels
+
+
+def test_regions_match_bfs_as_walls_are_bombed():
+    cont = Controller(5, 2, 'connected')
+    # Built before playing, so every later chunk arrives through the change tracking
+    connectivity = cont.connections()
+    for seed in range(6):
+        simulate(cont, random_script(1500, seed=seed, weights=(6, 6, 6, 6, 4, 2)))
+        labels = regions(walkable(cont.grid))
+        sizes = {}
+        for label in labels.values():
+            sizes[label] = sizes.get(label, 0) + 1
+        assert cont.region_size() == sizes[labels[(cont.x, cont.y)]]
+        cells = sorted(labels)
+        for a, b in zip(cells[::37], cells[1::37]):
+            assert connectivity.reachable(a, b) == (labels[a] == labels[b])
+            assert connectivity.region_size(*a) == sizes[labels[a]]
+    assert any(chunk.flags.count(BOMBED) for chunk in cont.grid.chunks.values())
+    chunk = cont.grid.chunks[(0, 0)]
+    wall = next(index for index in chunk.find(WALL) if not chunk.flags[index] & BOMBED)
+    assert connectivity.region_size(*chunk.coords(wall)) == 0
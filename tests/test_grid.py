@@ -0,0 +1,128 @@
+import random
+from src.chunk import OCCUPIED, BOMBED, USED, chunk_key
+from src.controller import Controller
+from src.grid import WALL, SHRINE
+from src.simulate import simulate, random_script
+
+
+def world_state(grid):
+    """Types, flags and explored mask of every chunk, read without paging anything in."""
+    state = {}
+    for key in grid.chunk_keys():
+        chunk = grid.peek_chunk(key)
+        state[key] = (bytes(chunk.types), bytes(chunk.flags), chunk.mask())
+    return state
+
+
+def test_bounded_cache_plays_like_unbounded():
+    script = random_script(20000, seed=1)
+    reference = Controller(5, 1, 'evict')
+    cached = Controller(5, 1, 'evict', cache_chunks=4)
+    assert simulate(cached, script) == simulate(reference, script)
+    assert (cached.x, cached.y, cached.bombs) == (reference.x, reference.y, reference.bombs)
+    assert cached.grid.evicted
+    flags = b''.join(flags for _, flags, _ in world_state(reference.grid).values())
+    assert any(flag & BOMBED for flag in flags) and any(flag & USED for flag in flags)
+    assert world_state(cached.grid) == world_state(reference.grid)
+
+
+def test_player_and_modified_chunks_survive_eviction():
+    cont = Controller(5, 1, 'evict', cache_chunks=4)
+    simulate(cont, random_script(5000, seed=2))
+    before = world_state(cont.grid)
+    modified = {key for key, (_, flags, _) in before.items() if any(flag & (BOMBED | USED) for flag in flags)}
+    assert modified
+    player_key = chunk_key(cont.x, cont.y)
+    # Touch chunks far away until everything above was evicted
+    for i in range(8):
+        cont.grid.generate_tiles_in_range(10000 + 32 * i, 10000, 1)
+    assert player_key not in cont.grid.chunks and not modified & set(cont.grid.chunks)
+    tile = cont.current_tile
+    assert tile.is_occupied and tile.x == cont.x and tile.y == cont.y
+    after = world_state(cont.grid)
+    for key, state in before.items():
+        assert after[key] == state
+    chunk = cont.grid.load_chunk(player_key)
+    assert chunk.flags[chunk.index(cont.x, cont.y)] & OCCUPIED
+
+
+def test_interact_after_eviction_marks_the_live_chunk():
+    cont = Controller(5, 1, 'shrine', cache_chunks=4)
+    cont.grid.generate_tiles_in_range(0, 0, 16)
+    shrine = cont.grid.nearest_shrine(0, 0)
+    cont.x, cont.y = shrine.x, shrine.y
+    for i in range(8):
+        cont.grid.generate_tiles_in_range(10000 + 32 * i, 10000, 1)
+    assert chunk_key(cont.x, cont.y) not in cont.grid.chunks
+    bombs = cont.bombs
+    cont.interact()
+    assert cont.bombs == bombs + 1
+    assert not cont.grid.get_tile(cont.x, cont.y).can_interact
+
+
+def test_queries_read_evicted_chunks_without_paging_them_in():
+    script = random_script(20000, seed=3)
+    reference = Controller(5, 1, 'queries')
+    cached = Controller(5, 1, 'queries', cache_chunks=4)
+    simulate(reference, script)
+    simulate(cached, script)
+    grid = cached.grid
+    assert len(grid.evicted) > 4
+    resident, tile_count = list(grid.chunks), grid.tile_count
+    bbox = (-200, -200, 200, 200)
+    assert grid.count_walls(bbox) == reference.grid.count_walls(bbox)
+    for x, y in ((0, 0), (cached.x, cached.y), (40, -40)):
+        for usable in (True, False):
+            shrine, expected = grid.nearest_shrine(x, y, 200, usable), reference.grid.nearest_shrine(x, y, 200, usable)
+            assert (shrine.x, shrine.y) == (expected.x, expected.y)
+        assert [(t.x, t.y) for t in grid.shrines_within(x, y, 64)] == [(t.x, t.y) for t in reference.grid.shrines_within(x, y, 64)]
+    # Nothing was paged in, evicted or given new ids
+    assert list(grid.chunks) == resident and grid.tile_count == tile_count
+
+
+def test_evicted_chunks_are_stored_packed():
+    cont = Controller(5, 1, 'packed', cache_chunks=4)
+    cont.grid.pregenerate((0, 0, 63, 63), workers=1)
+    simulate(cont, random_script(5000, seed=4))
+    grid = cont.grid
+    for i in range(8):
+        grid.generate_tiles_in_range(10000 + 32 * i, 10000, 1)
+    full = [key for key, mask in grid.evicted.items() if mask is None]
+    assert full and all(isinstance(mask, bytes) and len(mask) == 32 for mask in grid.evicted.values() if mask is not None)
+    assert grid.overlay and all(len(pinned) % 2 == 0 for pinned in grid.overlay.values())
+    # A fully explored chunk comes back whole
+    assert grid.peek_chunk(full[0]).count == 256
+
+
+def generated_cells(grid):
+    """(x, y, type, flags) of every generated cell, the scan the queries avoid."""
+    for key in grid.chunk_keys():
+        chunk = grid.peek_chunk(key)
+        for index in chunk.indices():
+            yield (*chunk.coords(index), chunk.types[index], chunk.flags[index])
+
+
+def test_shrine_and_wall_queries_match_a_full_scan():
+    cont = Controller(5, 3, 'queries')
+    simulate(cont, random_script(6000, seed=5, weights=(6, 6, 6, 6, 4, 3)))
+    grid = cont.grid
+    cells = list(generated_cells(grid))
+    assert any(flags & USED for *_, flags in cells) and any(flags & BOMBED for *_, flags in cells)
+    rng = random.Random(5)
+    for _ in range(40):
+        x, y = rng.randint(-80, 80), rng.randint(-80, 80)
+        radius = rng.choice((0, 5, 17, 40, 200))
+        for usable in (True, False):
+            shrines = sorted(
+                (abs(tile_x - x) + abs(tile_y - y), tile_x, tile_y) for tile_x, tile_y, type_code, flags in cells
+                if type_code == SHRINE and not (usable and flags & USED) and abs(tile_x - x) + abs(tile_y - y) <= radius
+            )
+            assert [(t.x, t.y) for t in grid.shrines_within(x, y, radius, usable)] == [shrine[1:] for shrine in shrines]
+            nearest = grid.nearest_shrine(x, y, radius, usable)
+            assert (None if nearest is None else (nearest.x, nearest.y)) == (shrines[0][1:] if shrines else None)
+        bbox = (x, y, x + rng.randint(0, 70), y + rng.randint(0, 70))
+        walls = sum(
+            1 for tile_x, tile_y, type_code, flags in cells
+            if type_code == WALL and not flags & BOMBED and bbox[0] <= tile_x <= bbox[2] and bbox[1] <= tile_y <= bbox[3]
+        )
+        assert grid.count_walls(bbox) == walls
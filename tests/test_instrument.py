@@ -0,0 +1,74 @@
+import json
+from src.controller import Controller
+from src.instrument import Instrumentation, instrumentation as shared
+from src.simulate import simulate, random_script
+
+
+def test_enable_and_disable_the_real_targets():
+    instrumentation = Instrumentation()
+    originals = [(owner, name, owner.__dict__[name]) for owner, name in instrumentation.targets()]
+    instrumentation.enable()
+    try:
+        assert instrumentation.enabled
+        assert all(owner.__dict__[name] is not original for owner, name, original in originals)
+    finally:
+        instrumentation.disable()
+    assert not instrumentation.enabled
+    assert all(owner.__dict__[name] is original for owner, name, original in originals)
+
+
+def played(instrumentation, steps=200):
+    cont = Controller(5, 3, 'instrument')
+    instrumentation.enable()
+    try:
+        # Instrumented runs take the full step path, see simulate.lean_path_applies
+        simulate(cont, random_script(steps, seed=1, weights=(1, 1, 1, 1, 0, 0)))
+    finally:
+        instrumentation.disable()
+    return cont
+
+
+def test_counts_and_times_the_calls():
+    # The shared instance, the one the game and the overlay use
+    instrumentation = shared
+    instrumentation.reset()
+    played(instrumentation)
+    stats = instrumentation.stats
+    assert stats['Controller.try_move'].count == 200
+    moved = stats['Controller.enter_current_tile'].count
+    assert 0 < moved <= 200 and instrumentation.steps == moved
+    assert stats['Grid.generate_leading_edge'].count == moved
+    for stat in stats.values():
+        assert stat.total > 0 and stat.max <= stat.total
+        assert sum(stat.histogram) == stat.count
+        assert stat.percentile(0.5) <= stat.percentile(0.99) <= stat.max
+    assert instrumentation.step_tiles and instrumentation.max_step_tiles >= instrumentation.last_step_tiles
+    assert len(instrumentation.trace) == sum(stat.count for stat in stats.values())
+    # Disabled, nothing more is counted
+    counts = {name: stat.count for name, stat in stats.items()}
+    played(Instrumentation())
+    assert {name: stat.count for name, stat in stats.items()} == counts
+    instrumentation.reset()
+
+
+def test_overlay_and_export_json(tmp_path):
+    instrumentation = shared
+    instrumentation.reset()
+    cont = played(instrumentation, 50)
+    lines = instrumentation.overlay(cont.grid)
+    assert lines[0].startswith('Debug | Tiles/step: last ')
+    assert f"Tiles: {cont.grid.tile_count}" in lines[0]
+    assert len(lines) == 1 + len(instrumentation.stats)
+    assert any('Controller.try_move' in line and 'n 50 ' in line for line in lines[1:])
+
+    path = tmp_path / 'trace.json'
+    instrumentation.export_json(str(path), cont.grid)
+    data = json.loads(path.read_text())
+    assert data['stats']['Controller.try_move']['count'] == 50
+    assert data['tiles_per_step'] == {'steps': instrumentation.steps, 'tiles': instrumentation.step_tiles, 'max': instrumentation.max_step_tiles}
+    assert data['gauges']['chunks'] == len(cont.grid.chunks)
+    assert data['gauges']['tiles_created'] == cont.grid.tile_count
+    events = data['traceEvents']
+    assert len(events) == len(instrumentation.trace)
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+    instrumentation.reset()
@@ -0,0 +1,97 @@
+import pytest
+from src import journal
+from src.controller import Controller
+from src.simulate import simulate, random_script
+
+
+def state(cont):
+    cells = {key: (bytes(chunk.types), bytes(chunk.flags)) for key, chunk in cont.grid.chunks.items()}
+    return cont.x, cont.y, cont.bombs, cont.is_bombing, cont.gen_range, cells
+
+
+def test_resume_after_background_compaction(tmp_path):
+    directory = str(tmp_path / 'autosave')
+    cont = Controller(5, 1, 'journal')
+    # The journal thread never wakes on its own, the test finishes the compactions record() captures
+    cont.enable_autosave(directory, interval=60, compact_every=400)
+    snapshots = [journal.read_snapshot(directory)]
+    for gen_range, seed in ((2, 1), (1, 2), (3, 3)):
+        cont.set_gen_range(gen_range)
+        simulate(cont, random_script(1500, seed=seed, weights=(6, 6, 6, 6, 3, 3)))
+        assert cont.journal.pending is not None
+        cont.journal.finish_pending()
+        snapshots.append(journal.read_snapshot(directory))
+    assert len(set(snapshots)) == len(snapshots)
+    # Recorded after the last capture, so only the journal holds them
+    simulate(cont, random_script(300, seed=4, weights=(6, 6, 6, 6, 3, 3)))
+    cont.journal.flush()
+    expected = state(cont)
+    cont.journal.close()
+
+    resumed = Controller(5, 1, 'other')
+    resumed.resume_autosave(directory)
+    assert state(resumed) == expected
+    resumed.journal.close()
+
+
+def test_resume_with_a_compaction_captured_but_not_written(tmp_path):
+    directory = str(tmp_path / 'autosave')
+    cont = Controller(5, 2, 'pending')
+    cont.enable_autosave(directory, interval=60, compact_every=400)
+    simulate(cont, random_script(1500, seed=5, weights=(6, 6, 6, 6, 3, 3)))
+    assert cont.journal.pending is not None
+    expected = state(cont)
+    # Closing drops the pending compaction, the old snapshot and the whole journal still resume
+    cont.journal.close()
+
+    resumed = Controller(5, 1, 'other')
+    resumed.resume_autosave(directory)
+    assert state(resumed) == expected
+    resumed.journal.close()
+
+
+def test_gen_range_and_bombing_survive_compaction(tmp_path):
+    directory = str(tmp_path / 'autosave')
+    cont = Controller(5, 1, 'settings')
+    cont.enable_autosave(directory, interval=60)
+    cont.set_gen_range(4)
+    cont.compact_journal()
+    cont.set_bombing(True)
+    cont.journal.close()
+
+    resumed = Controller(5, 1, 'other')
+    resumed.resume_autosave(directory)
+    assert resumed.gen_range == 4 and resumed.is_bombing
+    resumed.journal.close()
+
+
+def test_capture_is_independent_of_later_moves():
+    cont = Controller(5, 2, 'capture')
+    encode, _ = cont.capture()
+    before = encode()
+    simulate(cont, random_script(500, seed=4))
+    assert encode() == before
+
+
+def test_crash_while_rewriting_the_journal_keeps_it(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'autosave')
+    cont = Controller(5, 2, 'rewrite')
+    cont.enable_autosave(directory, interval=60, compact_every=400)
+    simulate(cont, random_script(1500, seed=6, weights=(6, 6, 6, 6, 3, 3)))
+    expected = state(cont)
+    atomic_write = journal.atomic_write
+
+    def crash_on_journal(path, data):
+        if path.endswith(journal.JOURNAL_FILE):
+            raise OSError("crashed")
+        atomic_write(path, data)
+    monkeypatch.setattr(journal, 'atomic_write', crash_on_journal)
+    with pytest.raises(OSError):
+        cont.journal.finish_pending()
+    monkeypatch.undo()
+    cont.journal.close()
+    # The new snapshot is in, and the old journal over it still replays to the same state
+    resumed = Controller(5, 1, 'other')
+    resumed.resume_autosave(directory)
+    assert state(resumed) == expected
+    resumed.journal.close()
@@ -0,0 +1,48 @@
+from src.chunk import BOMBED, USED
+from src.controller import Controller
+from src.grid import WALL, SHRINE
+from src.minimap import Minimap, LEVELS, LEVEL_SHIFT
+from src.simulate import simulate, random_script
+
+
+def brute_force(grid, level):
+    """Sum (explored, intact walls, usable shrines) per block of a level, cell by cell."""
+    blocks = {}
+    for key in grid.chunk_keys():
+        chunk = grid.peek_chunk(key)
+        block = (key[0] >> LEVEL_SHIFT * level, key[1] >> LEVEL_SHIFT * level)
+        summary = blocks.setdefault(block, [0, 0, 0])
+        for index in chunk.indices():
+            type_code, flags = chunk.types[index], chunk.flags[index]
+            summary[0] += 1
+            summary[1] += type_code == WALL and not flags & BOMBED
+            summary[2] += type_code == SHRINE and not flags & USED
+    return {block: tuple(summary) for block, summary in blocks.items()}
+
+
+def summaries(minimap, level):
+    return {block: tuple(summary) for block, summary in minimap.levels[level].items() if tuple(summary) != (0, 0, 0)}
+
+
+def test_summaries_match_a_cell_count_as_the_world_changes():
+    cont = Controller(5, 3, 'minimap')
+    minimap = Minimap(cont.grid)
+    for seed in range(4):
+        simulate(cont, random_script(3000, seed=seed, weights=(6, 6, 6, 6, 4, 3)))
+        minimap.refresh()
+        for level in range(LEVELS):
+            assert summaries(minimap, level) == brute_force(cont.grid, level)
+    flags = b''.join(chunk.flags for chunk in cont.grid.chunks.values())
+    assert any(flag & BOMBED for flag in flags) and any(flag & USED for flag in flags)
+
+
+def test_summaries_of_a_bounded_grid_do_not_page_chunks_in():
+    cont = Controller(5, 2, 'minimap', cache_chunks=4)
+    minimap = Minimap(cont.grid)
+    simulate(cont, random_script(8000, seed=9, weights=(6, 6, 6, 6, 4, 3)))
+    assert cont.grid.evicted
+    resident = list(cont.grid.chunks)
+    minimap.refresh()
+    assert list(cont.grid.chunks) == resident
+    assert summaries(minimap, 0) == brute_force(cont.grid, 0)
+    assert summaries(minimap, 2) == brute_force(cont.grid, 2)
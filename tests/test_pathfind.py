@@ -0,0 +1,109 @@
+from collections import deque
+import random
+import pytest
+from src.grid import Grid
+from src.pathfind import PathMap, find_path, OPEN, WALL, FAST_WEIGHT
+
+MARGIN = 8
+
+
+def bfs_length(path_map, start, goal, bombs=0, bomb_cost=10):
+    """Length in steps of the cheapest path, by Dijkstra over (cell, bombs used), None when there is none."""
+    if not bombs:
+        seen = {start: 0}
+        queue = deque([start])
+        while queue:
+            x, y = queue.popleft()
+            if (x, y) == goal:
+                return seen[goal]
+            for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if cell not in seen and path_map.cost(*cell) == OPEN:
+                    seen[cell] = seen[(x, y)] + 1
+                    queue.append(cell)
+        return None
+    # Few enough bomb states to do Dijkstra with a bucket per cost
+    best = {(start, 0): 0}
+    buckets = {0: [(start, 0)]}
+    cost = 0
+    while buckets:
+        for state in buckets.pop(cost, ()):
+            (x, y), used = state
+            if best[state] != cost:
+                continue
+            if (x, y) == goal:
+                return cost
+            for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                kind = path_map.cost(*cell)
+                if kind == OPEN:
+                    next_state, next_cost = (cell, used), cost + 1
+                elif kind == WALL and used < bombs:
+                    next_state, next_cost = (cell, used + 1), cost + 1 + bomb_cost
+                else:
+                    continue
+                if next_cost < best.get(next_state, next_cost + 1):
+                    best[next_state] = next_cost
+                    buckets.setdefault(next_cost, []).append(next_state)
+        cost += 1
+    return None
+
+
+def path_cost(path_map, path, bomb_cost=10):
+    """Check a path steps between neighbouring walkable cells and get its cost."""
+    cost = 0
+    for (x, y), (next_x, next_y) in zip(path, path[1:]):
+        assert abs(next_x - x) + abs(next_y - y) == 1
+        kind = path_map.cost(next_x, next_y)
+        assert kind in (OPEN, WALL)
+        cost += 1 + (bomb_cost if kind == WALL else 0)
+    return cost
+
+
+def bounded_map(grid, start, goal):
+    bounds = (
+        (min(start[0], goal[0]) - MARGIN) // 16, (min(start[1], goal[1]) - MARGIN) // 16,
+        (max(start[0], goal[0]) + MARGIN) // 16, (max(start[1], goal[1]) + MARGIN) // 16,
+    )
+    return PathMap(grid, True, bounds)
+
+
+def cases(count, spread):
+    rng = random.Random(17)
+    for i in range(count):
+        start = (rng.randint(-spread, spread), rng.randint(-spread, spread))
+        goal = (start[0] + rng.randint(-spread, spread), start[1] + rng.randint(-spread, spread))
+        yield f'seed{i % 5}', start, goal
+
+
+@pytest.mark.parametrize('seed, start, goal', list(cases(60, 40)))
+def test_jump_point_search_matches_bfs(seed, start, goal):
+    grid = Grid(seed)
+    path_map = bounded_map(grid, start, goal)
+    expected = bfs_length(path_map, start, goal)
+    exact = find_path(grid, start, goal, margin=MARGIN)
+    weighted = find_path(grid, start, goal, margin=MARGIN, weight=FAST_WEIGHT)
+    if expected is None:
+        assert exact is None and weighted is None
+        return
+    assert exact[0] == start and exact[-1] == goal
+    assert path_cost(path_map, exact) == expected
+    assert expected <= path_cost(path_map, weighted) <= FAST_WEIGHT * expected
+
+
+@pytest.mark.parametrize('seed, start, goal', list(cases(20, 20)))
+def test_bomb_paths_match_dijkstra(seed, start, goal):
+    grid = Grid(seed)
+    path_map = bounded_map(grid, start, goal)
+    expected = bfs_length(path_map, start, goal, bombs=2, bomb_cost=3)
+    path = find_path(grid, start, goal, bombs=2, bomb_cost=3, margin=MARGIN)
+    if expected is None:
+        assert path is None
+        return
+    assert path_cost(path_map, path, bomb_cost=3) == expected
+    assert sum(path_map.cost(*cell) == WALL for cell in path) <= 2
+
+
+def test_find_path_does_not_create_tiles():
+    grid = Grid('lazy')
+    tiles = len(grid)
+    find_path(grid, (0, 0), (200, 150))
+    assert len(grid) == tiles
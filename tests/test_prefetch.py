@@ -0,0 +1,105 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import random
+import threading
+from src.chunk import chunk_key
+from src.grid import Grid
+from src.prefetch import Prefetcher, PREFETCH_BATCH, chunk_distance, edge_chunk_keys
+from src.terrain import generate_chunk
+
+
+def walked_edge_keys(x, y, gen_range, dx, dy, lookahead):
+    """Chunk keys of every leading edge cell, cell by cell as Grid.generate_leading_edge walks them."""
+    keys = set()
+    for step in range(1, lookahead + 1):
+        centre_x, centre_y = x + dx * step, y + dy * step
+        for forward in range(gen_range + 1):
+            side = gen_range - forward
+            for offset in ((-side, side) if side else (0,)):
+                keys.add(chunk_key(centre_x + dx * forward + dy * offset, centre_y + dy * forward + dx * offset))
+    return keys
+
+
+def test_edge_chunk_keys_match_the_cells_walked():
+    rng = random.Random(3)
+    for _ in range(500):
+        x, y = rng.randint(-100, 100), rng.randint(-100, 100)
+        gen_range, lookahead = rng.randint(0, 40), rng.randint(1, 40)
+        dx, dy = rng.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+        assert edge_chunk_keys(x, y, gen_range, dx, dy, lookahead) == walked_edge_keys(x, y, gen_range, dx, dy, lookahead)
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    """One worker thread that notes the chunk keys of each task, and can hold its first task back."""
+    def __init__(self, hold=False):
+        super().__init__(max_workers=1)
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def submit(self, function, seed, keys, legacy):
+        self.batches.append(keys)
+        return super().submit(self.run, function, seed, keys, legacy)
+
+    def run(self, function, *args):
+        self.started.set()
+        self.release.wait()
+        return function(*args)
+
+
+def test_prefetch_generates_the_edge_nearest_first():
+    grid = Grid('prefetch')
+    executor = RecordingExecutor()
+    prefetcher = Prefetcher(executor)
+
+    async def schedule():
+        futures = prefetcher.update(grid, 0, 0, 12, (1, 0))
+        await asyncio.gather(*futures)
+        # Everything is scheduled already, moving on asks for nothing new
+        assert prefetcher.update(grid, 0, 0, 12, (1, 0)) == []
+    asyncio.run(schedule())
+    prefetcher.close()
+    keys = [key for batch in executor.batches for key in batch]
+    assert len(keys) == len(set(keys)) and all(len(batch) <= PREFETCH_BATCH for batch in executor.batches)
+    assert set(keys) == edge_chunk_keys(0, 0, 12, 1, 0, prefetcher.lookahead)
+    distances = [chunk_distance(key, 0, 0) for key in keys]
+    assert distances == sorted(distances)
+    assert not prefetcher.pending
+    assert all(grid.prefetched[key] == generate_chunk('prefetch', *key) for key in keys)
+
+
+def test_prefetch_tasks_cancelled_on_close():
+    grid = Grid('cancel')
+    executor = RecordingExecutor(hold=True)
+    prefetcher = Prefetcher(executor)
+
+    async def schedule():
+        futures = prefetcher.update(grid, 0, 0, 20, (0, -1))
+        assert len(futures) > 1 and prefetcher.pending
+        executor.started.wait()
+        prefetcher.close()
+        executor.release.set()
+        await asyncio.gather(*futures, return_exceptions=True)
+        return futures
+    futures = asyncio.run(schedule())
+    # The first task was already running and finished, the queued ones were cancelled
+    assert not futures[0].cancelled() and all(future.cancelled() for future in futures[1:])
+    assert not prefetcher.pending
+    assert set(grid.prefetched) == set(executor.batches[0])
+
+
+def test_prefetch_limit_drops_the_oldest_chunks():
+    grid = Grid('limit')
+    prefetcher = Prefetcher(RecordingExecutor(), limit=10)
+
+    async def walk():
+        for y in range(0, 200, 16):
+            await asyncio.gather(*prefetcher.update(grid, 0, y, 5, (0, 1)))
+    asyncio.run(walk())
+    prefetcher.close()
+    assert len(grid.prefetched) == 10
+    # What is left is what lies furthest along the walk, the chunks scheduled first were dropped
+    assert max(key[1] for key in grid.prefetched) == (192 + prefetcher.lookahead + 5) // 16
+    assert min(key[1] for key in grid.prefetched) >= 192 // 16 - 2
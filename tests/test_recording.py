@@ -0,0 +1,56 @@
+import re
+from src.controller import Controller
+from src.recording import Recorder, Replay, recording_name
+from src.simulate import simulate, random_script
+
+
+def state(cont):
+    grid = cont.grid
+    chunks = {key: (bytes(chunk.types), bytes(chunk.flags), chunk.ids.tobytes()) for key, chunk in grid.chunks.items()}
+    return cont.x, cont.y, cont.bombs, cont.is_bombing, cont.gen_range, grid.seed, grid.tile_count, chunks
+
+
+def record(path):
+    """Record a game with range changes and a reset, returning the controller that played it."""
+    cont = Controller(10, 1, 'recorded')
+    recorder = Recorder(path, 'recorded', 1, 10)
+    for gen_range, seed, reset in ((1, 1, None), (3, 2, None), (2, 3, 'second'), (1, 4, None)):
+        if reset:
+            cont.reset(reset)
+            recorder.reset(reset)
+        if gen_range != cont.gen_range:
+            cont.set_gen_range(gen_range)
+            recorder.set_gen_range(gen_range)
+        script = random_script(2500, seed=seed)
+        simulate(cont, script)
+        for action in script:
+            recorder.record(action)
+    recorder.close()
+    return cont
+
+
+def test_replay_reaches_the_recorded_state(tmp_path):
+    path = str(tmp_path / 'game.rec')
+    played = record(path)
+    replay = Replay.open(path, checkpoint_interval=1000)
+    assert replay.total == 10000
+    assert len(replay.run()) == 10000
+    assert state(replay.controller) == state(played)
+
+
+def test_seek_matches_replaying_from_the_start(tmp_path):
+    path = str(tmp_path / 'game.rec')
+    record(path)
+    replay = Replay.open(path, checkpoint_interval=1000)
+    replay.run()
+    for step in (7321, 2500, 5000, 999, 0, 10000):
+        fresh = Replay.open(path)
+        fresh.run(step)
+        assert state(replay.seek(step)) == state(fresh.controller)
+
+
+def test_recording_name_is_safe_for_any_seed():
+    names = [recording_name(seed) for seed in ('../../etc/passwd', 'a/b', 'a_b', 'seed with spaces', '')]
+    assert all(re.fullmatch(r'[A-Za-z0-9_-]*\.rec', name) for name in names)
+    # Seeds with the same slug still get different names
+    assert names[1].split('-')[1] != names[2].split('-')[1]
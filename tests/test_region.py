@@ -0,0 +1,42 @@
+from src.chunk import Chunk
+from src.controller import Controller
+from src.region import RegionFile
+from src.simulate import simulate, random_script
+
+
+def world_state(grid):
+    return {key: (bytes(chunk.types), bytes(chunk.flags)) for key in grid.chunk_keys() for chunk in [grid.peek_chunk(key)]}
+
+
+def test_save_world_into_its_own_directory(tmp_path):
+    directory = str(tmp_path / 'world')
+    cont = Controller(5, 2, 'regions')
+    simulate(cont, random_script(3000, seed=3))
+    cont.save_world(directory)
+    cont = Controller(5, 2, 'regions')
+    cont.open_world(directory, max_chunks=8)
+    # Keep playing, and paging chunks out to the store, between saves
+    for seed in (4, 5, 6):
+        simulate(cont, random_script(3000, seed=seed))
+        expected = world_state(cont.grid)
+        position = (cont.x, cont.y, cont.bombs)
+        cont.save_world(directory)
+        reopened = Controller(5, 2, 'regions')
+        reopened.open_world(directory)
+        assert (reopened.x, reopened.y, reopened.bombs) == position
+        assert world_state(reopened.grid) == expected
+        reopened.grid.store.close()
+
+
+def test_region_file_handles_share_appends(tmp_path):
+    path = str(tmp_path / 'r.0.0.region')
+    first, second = RegionFile(path), RegionFile(path)
+    chunks = [Chunk(i // 20, i % 20) for i in range(40)]
+    for i, chunk in enumerate(chunks):
+        chunk.types[:] = bytes([i % 3 + 1]) * len(chunk.types)
+        (first if i % 2 else second).write(chunk)
+    for chunk in chunks:
+        assert first.read(chunk.cx, chunk.cy).types == chunk.types
+        assert second.read(chunk.cx, chunk.cy).types == chunk.types
+    first.close()
+    second.close()
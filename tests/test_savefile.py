@@ -0,0 +1,125 @@
+import io
+import pytest
+from src.chunk import CHUNK_SIZE, OCCUPIED, BOMBED, USED
+from src.controller import Controller
+from src.grid import Grid, WALL
+from src.simulate import simulate, random_script
+from src.terrain import generate_chunk
+from src import savefile
+
+
+def played(seed='saves', steps=4000, gen_range=2):
+    cont = Controller(5, gen_range, seed)
+    simulate(cont, random_script(steps, seed=1, weights=(6, 6, 6, 6, 3, 3)))
+    return cont
+
+
+def cells(grid):
+    """Types and flags of every chunk, ids left out since loading reassigns them."""
+    return {key: (bytes(chunk.types), bytes(chunk.flags)) for key, chunk in grid.chunks.items()}
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib', 'lzma'])
+def test_round_trip(compression):
+    cont = played()
+    flags = b''.join(chunk.flags for chunk in cont.grid.chunks.values())
+    assert any(flag & BOMBED for flag in flags) and any(flag & USED for flag in flags)
+    # A random walk leaves most chunks partly explored
+    assert any(0 < chunk.count < len(chunk.types) for chunk in cont.grid.chunks.values())
+    grid, player = savefile.decode(savefile.encode(cont.grid, cont.player_state(), compression))
+    assert player == cont.player_state()
+    assert cells(grid) == cells(cont.grid)
+    assert len(grid) == len(cont.grid) == grid.tile_count
+    ids = sorted(chunk.ids[index] for chunk in grid.chunks.values() for index in chunk.indices())
+    assert ids == list(range(1, grid.tile_count + 1))
+
+
+def test_round_trip_keeps_created_types_and_full_chunks():
+    grid = Grid('full')
+    grid.pregenerate((0, 0, 31, 15), workers=1)
+    grid.get_tile(3, 4).set_type('shrine')
+    grid.create_tile(100, -100, type='wall')
+    tile = grid.get_tile(0, 0)
+    tile.is_occupied = True
+    player = {'x': 0, 'y': 0, 'bombs': 2, 'max_bombs': 5, 'is_bombing': False}
+    decoded, _ = savefile.decode(savefile.encode(grid, player))
+    assert cells(decoded) == cells(grid)
+    assert decoded.get_tile(0, 0).chunk.flags[0] == OCCUPIED
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib', 'lzma'])
+def test_truncated_saves_raise_value_error(compression):
+    cont = played(steps=500)
+    data = savefile.encode(cont.grid, cont.player_state(), compression)
+    for size in range(len(data)):
+        with pytest.raises(ValueError):
+            savefile.decode(data[:size])
+
+
+def test_corrupt_saves_raise_value_error():
+    cont = played(steps=500)
+    data = savefile.encode(cont.grid, cont.player_state(), 'none')
+    for position in range(len(data)):
+        for value in (0, 0xFF, data[position] ^ 0x80):
+            corrupt = bytearray(data)
+            corrupt[position] = value
+            try:
+                savefile.decode(bytes(corrupt))
+            except ValueError:
+                pass
+
+
+def test_controller_round_trip(tmp_path):
+    cont = played()
+    cont.save_grid('slot', directory=str(tmp_path))
+    loaded = Controller(5, 2, 'other')
+    loaded.load_grid('slot', directory=str(tmp_path))
+    assert loaded.player_state() == cont.player_state()
+    assert cells(loaded.grid) == cells(cont.grid)
+    assert loaded.current_tile.is_occupied
+
+
+def large_world():
+    """A world of 24 x 24 half-explored chunks with a bombed wall in each, many buffers long."""
+    grid = Grid('stream')
+    for cx in range(-12, 12):
+        for cy in range(-12, 12):
+            chunk = grid.get_chunk(cx * CHUNK_SIZE, cy * CHUNK_SIZE, create=True)
+            chunk.fill(generate_chunk(grid.seed, cx, cy), b'\x55' * (CHUNK_SIZE * CHUNK_SIZE // 8))
+            wall = next(chunk.find(WALL), None)
+            if wall is not None:
+                chunk.flags[wall] |= BOMBED
+    # Loading marks the player's tile, as a game would have
+    grid.get_tile(0, 0).is_occupied = True
+    return grid
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib', 'lzma'])
+def test_saves_stream_in_bounded_blocks(compression, monkeypatch):
+    # Small buffers, so a small world spans many of them
+    monkeypatch.setattr(savefile, 'BUFFER_SIZE', 4096)
+    grid = large_world()
+    player = {'x': 0, 'y': 0, 'bombs': 1, 'max_bombs': 3, 'is_bombing': False}
+    calls = []
+    blocks = list(savefile.encode_stream(grid, player, compression, lambda done, total: calls.append((done, total))))
+    chunks = len(grid.chunks)
+    assert calls == [(done, chunks) for done in range(1, chunks + 1)]
+    assert all(savefile.BUFFER_SIZE <= len(block) < savefile.BUFFER_SIZE + savefile.MAX_CHUNK_RECORD for block in blocks[:-1])
+    data = b''.join(blocks)
+    if compression == 'none':
+        assert len(blocks) > 4
+
+    # Loading holds at most a few buffers of the save at a time, whatever its size
+    buffered = []
+    fill = savefile.StreamReader.fill
+
+    def tracked_fill(reader, size):
+        fill(reader, size)
+        buffered.append(len(reader.data))
+    monkeypatch.setattr(savefile.StreamReader, 'fill', tracked_fill)
+    calls.clear()
+    decoded, loaded_player = savefile.decode_stream(io.BytesIO(data), lambda done, total: calls.append((done, total)))
+    assert max(buffered) <= 2 * savefile.BUFFER_SIZE + savefile.MAX_CHUNK_RECORD + 20
+    assert calls == [(done, chunks) for done in range(1, chunks + 1)]
+    assert loaded_player == player
+    assert cells(decoded) == cells(grid)
@@ -0,0 +1,18 @@
+import json
+from src.saves import SaveStore
+
+
+def test_migrate_counts_only_imported_slots(tmp_path, monkeypatch):
+    legacy = tmp_path / 'saves.json'
+    legacy.write_text(json.dumps({'kept': 'seed1|0|0|3', 'first': 'seed2|1|1|3', 'second': 'seed3|2|2|3'}))
+    store = SaveStore(str(tmp_path / 'saves'))
+    store.write('kept', b'newer', 'legacy', seed='seed1')
+    writes = []
+    monkeypatch.setattr(store, 'write_index', lambda: writes.append(dict(store.index)))
+    assert store.migrate(str(legacy)) == 2
+    # One index write, holding every slot
+    assert len(writes) == 1 and set(writes[0]) == {'kept', 'first', 'second'}
+    assert store.read('kept') == ('legacy', b'newer')
+    assert store.read('first') == ('legacy', b'seed2|1|1|3')
+    assert not legacy.exists() and (tmp_path / 'saves.json.migrated').exists()
+    assert store.migrate(str(legacy)) == 0
@@ -0,0 +1,61 @@
+from collections import deque
+import random
+from src.seedscan import component_size, top_results, scan, scan_seed, diamond_types
+
+
+def bfs_size(cells, side, start):
+    if not cells[start]:
+        return 0
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        index = queue.popleft()
+        row, column = divmod(index, side)
+        for next_row, next_column in ((row - 1, column), (row + 1, column), (row, column - 1), (row, column + 1)):
+            neighbour = next_row * side + next_column
+            if 0 <= next_row < side and 0 <= next_column < side and cells[neighbour] and neighbour not in seen:
+                seen.add(neighbour)
+                queue.append(neighbour)
+    return len(seen)
+
+
+def test_component_size_matches_bfs():
+    rng = random.Random(1)
+    for _ in range(300):
+        side = rng.randint(1, 24)
+        density = rng.random()
+        cells = bytearray(rng.random() < density for _ in range(side * side))
+        start = rng.randrange(side * side)
+        expected = bfs_size(cells, side, start)
+        copy = bytearray(cells)
+        assert component_size(copy, side, start) == expected
+        # The component is cleared and nothing else is touched
+        assert copy.count(1) == cells.count(1) - expected
+
+
+def test_scan_seed_region_matches_bfs():
+    for seed in ('a', 'b', 'c'):
+        radius = 12
+        side = 2 * radius + 1
+        walkable = bytearray(code in (1, 3) for code in diamond_types(seed, radius))
+        assert scan_seed(seed, radius)[3] == bfs_size(walkable, side, radius * side + radius)
+
+
+def test_top_results_break_ties_by_seed_whatever_the_order():
+    rng = random.Random(2)
+    # Few distinct values, so most of the top k are ties
+    results = [(f'seed{i:03}', rng.randint(0, 3), rng.choice((0.1, 0.2)), rng.randint(0, 4)) for i in range(200)]
+    for metric, column in (('region', 3), ('shrines', 1), ('walls', 2)):
+        for ascending in (False, True):
+            sign = -1 if ascending else 1
+            expected = sorted(results, key=lambda result: (sign * result[column], result[0]), reverse=True)[:10]
+            for _ in range(5):
+                rng.shuffle(results)
+                assert top_results(results, 10, metric, ascending) == expected
+
+
+def test_top_results_calls_each_on_every_result():
+    seen = []
+    results = list(scan(['x', 'y', 'z', 'w'], 4, workers=1, batch_size=3))
+    assert top_results(results, 2, each=seen.append) == sorted(results, key=lambda r: (r[3], r[0]), reverse=True)[:2]
+    assert seen == results
@@ -0,0 +1,80 @@
+import asyncio
+from src.grid import Grid
+from src.server import WorldServer
+
+
+def test_join_does_not_size_the_shared_grid(monkeypatch):
+    server = WorldServer()
+    server.join('shared', 3)
+
+    def sized(grid):
+        raise AssertionError("len() reads every chunk of the world")
+    monkeypatch.setattr(Grid, '__len__', sized)
+    key, cont = server.join('shared', 3)
+    assert cont.grid is server.worlds[key]
+
+
+def step_off(server, key, cont):
+    """Move a player one cell in the first direction that is open, returning the reply."""
+    for action in 'wasd':
+        reply = server.act(key, cont, action)
+        if reply.startswith('0'):
+            return reply
+    raise AssertionError("boxed in")
+
+
+def occupied(grid, x, y):
+    return grid.get_tile(x, y).is_occupied
+
+
+def test_players_sharing_a_cell_keep_it_occupied_until_both_leave():
+    server = WorldServer()
+    key, first = server.join('occupancy', 2)
+    _, second = server.join('occupancy', 2)
+    grid = first.grid
+    assert server.positions[key] == {(0, 0): 2} and occupied(grid, 0, 0)
+
+    step_off(server, key, first)
+    # The first player left the origin, the second still stands on it
+    assert occupied(grid, 0, 0) and occupied(grid, first.x, first.y)
+    assert server.positions[key] == {(0, 0): 1, (first.x, first.y): 1}
+    rows = server.view(key, second, 1).split('/')
+    assert rows[1][1] == '@'
+
+    server.leave(key, second)
+    assert not occupied(grid, 0, 0) and occupied(grid, first.x, first.y)
+    # Alone in the world, leaving clears the cell the player stands on
+    step_off(server, key, first)
+    position = (first.x, first.y)
+    server.leave(key, first)
+    assert not occupied(grid, *position)
+    assert not server.positions[key] and server.sessions == 0
+
+
+def test_session_protocol_over_a_socket():
+    async def session():
+        server = WorldServer()
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        host, port = listener.sockets[0].getsockname()[:2]
+        replies = []
+        connections = [await asyncio.open_connection(host, port) for _ in range(2)]
+        for reader, writer in connections:
+            for line in (b'wasd\n', b'join sock 2\n', b'view 1\n'):
+                writer.write(line)
+                await writer.drain()
+                replies.append((await reader.readline()).decode().strip())
+        for _, writer in connections:
+            writer.write(b'quit\n')
+            writer.close()
+            await writer.wait_closed()
+        # Let the handlers see the quits and leave
+        while server.sessions:
+            await asyncio.sleep(0.01)
+        listener.close()
+        await listener.wait_closed()
+        return server, replies
+    server, replies = asyncio.run(session())
+    assert replies[0] == 'error join a world first' and replies[1] == 'ok 0 0 3'
+    assert replies[2].split('/')[1][1] == '@'
+    assert not server.positions[('sock', False)]
+    assert not server.worlds[('sock', False)].get_tile(0, 0).is_occupied
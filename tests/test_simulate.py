@@ -0,0 +1,56 @@
+import pytest
+from src.controller import Controller
+from src.simulate import simulate, step_actions, step_lean, lean_path_applies, random_script
+
+
+def snapshot(cont):
+    grid = cont.grid
+    chunks = {key: (bytes(chunk.types), bytes(chunk.flags), chunk.ids.tobytes(), chunk.count) for key, chunk in grid.chunks.items()}
+    return cont.x, cont.y, cont.bombs, cont.is_bombing, cont.generated, grid.tile_count, chunks
+
+
+@pytest.mark.parametrize('gen_range, legacy, weights', [
+    (1, False, (6, 6, 6, 6, 1, 1)),
+    (2, False, (6, 6, 6, 6, 4, 2)),
+    (5, True, (6, 6, 6, 6, 1, 1)),
+])
+def test_lean_path_matches_the_controller(gen_range, legacy, weights):
+    script = random_script(20000, seed=gen_range, weights=weights) + b' \nx'
+    lean = Controller(5, gen_range, 'lean', legacy)
+    full = Controller(5, gen_range, 'lean', legacy)
+    assert lean_path_applies(lean)
+    changed = lean.grid.watch()
+    expected_changed = full.grid.watch()
+    assert step_lean(lean, script) == step_actions(full, script)
+    assert snapshot(lean) == snapshot(full)
+    assert changed == expected_changed
+
+
+def test_lean_path_after_gen_range_change():
+    lean = Controller(5, 1, 'range')
+    full = Controller(5, 1, 'range')
+    for gen_range, seed in ((3, 1), (1, 2), (4, 3)):
+        lean.set_gen_range(gen_range)
+        full.set_gen_range(gen_range)
+        script = random_script(3000, seed=seed)
+        assert simulate(lean, script) == step_actions(full, script)
+        assert snapshot(lean) == snapshot(full)
+
+
+def test_bounded_grids_use_the_controller():
+    assert not lean_path_applies(Controller(5, 1, 'cache', cache_chunks=8))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_lean_path_matches_the_controller_on_a_pregenerated_world(workers):
+    bbox = (-40, -40, 39, 39)
+    lean = Controller(5, 2, 'pregenerated')
+    full = Controller(5, 2, 'pregenerated')
+    lean.grid.pregenerate(bbox, workers=workers)
+    full.grid.pregenerate(bbox, workers=1)
+    assert snapshot(lean) == snapshot(full)
+    script = random_script(20000, seed=7, weights=(6, 6, 6, 6, 4, 2))
+    assert step_lean(lean, script) == step_actions(full, script)
+    assert snapshot(lean) == snapshot(full)
+    # The walk left the pregenerated chunks, so both kinds of terrain were stepped on
+    assert len(lean.grid.chunks) > 36
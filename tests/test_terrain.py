@@ -0,0 +1,15 @@
+import random
+from src.chunk import TYPE_CODES
+from src.terrain import generate_types
+from src.tile import TYPES
+
+
+def test_legacy_generator_matches_random_choices():
+    names, weights = list(TYPES), [tile_type.weight for tile_type in TYPES.values()]
+    codes = generate_types('legacy', -20, -20, 40, 40, legacy=True)
+    expected = bytearray()
+    for x in range(-20, 20):
+        for y in range(-20, 20):
+            random.seed(f'{x},{y},legacy')
+            expected.append(TYPE_CODES[random.choices(names, weights=weights)[0]])
+    assert codes == expected